@@ -1,11 +1,21 @@
+import io
+import os
 import streamlit as st
-import sqlite3
 import pandas as pd
-from datetime import datetime
-from src.database import NutritionDatabase
-from src.nlp_parser import MealParser
+import plotly.express as px
+from datetime import datetime, timedelta
+from src.db_reloader import DatabaseReloader
+from src.gemini_client import GeminiClient
+from src.llm_backends import LatencyModel, ReplayBackend
+from src.local_parser import LocalMealParser
+from src.nlp_parser import PARSE_MODELS, MealParser
+from src.parse_cache import ParseCache
 from src.nutrition_calculator import NutritionCalculator
 from src.chatbot_handler import NutritionChatbot
+from src.chat_turn import run_chat_turn
+from src.meal_history import DB_PATH, MealHistory, normalize_user_id
+from src.nutrients import NUTRIENT_KEYS, format_amount, get_nutrient
+from src.tracing import configure_from_env, tracer
 
 # Page config
 st.set_page_config(
@@ -102,55 +112,36 @@ st.markdown("""
 # Initialize components
 @st.cache_resource
 def load_components():
-    db = NutritionDatabase()
-    parser = MealParser()
+    # NUTRIBOT_TRACE_FILE / NUTRIBOT_METRICS_PORT turn on tracing
+    configure_from_env()
+    # Picks up a rebuilt database (convert_csv_v2.py / compile_db.py)
+    # without restarting the app
+    db = DatabaseReloader("data/nutrition_db.json")
+    # LLM_REPLAY_FILE runs the app offline on recorded responses
+    # (see src/llm_backends.py), e.g. for load tests
+    backend = None
+    if os.getenv('LLM_REPLAY_FILE'):
+        backend = ReplayBackend(os.getenv('LLM_REPLAY_FILE'), LatencyModel())
+    # One client for both, so the concurrency limit, connection and
+    # per-model metrics are shared
+    client = GeminiClient('gemini-2.5-flash', timeout=30.0, backend=backend)
+    # Parses go to flash first and escalate to pro if foods don't resolve
+    parser = MealParser(cache=ParseCache("parse_cache.db"), local_parser=LocalMealParser(db),
+                        client=client, models=PARSE_MODELS, database=db)
     calculator = NutritionCalculator(db)
-    chatbot = NutritionChatbot()
-    return db, parser, calculator, chatbot
+    # Combined mode: a message reaching Gemini is classified and parsed in one call
+    chatbot = NutritionChatbot(client=client, combined=True, model_name='gemini-2.5-flash', database=db)
+    # Meal history: pooled WAL connections shared by all sessions
+    history = MealHistory(DB_PATH)
+    return db, parser, calculator, chatbot, history
 
-db, parser, calculator, chatbot = load_components()
+db, parser, calculator, chatbot, history = load_components()
 
-# SQLite setup
-DB_PATH = "meal_history.db"
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS meals (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date TEXT,
-        meal_type TEXT,
-        description TEXT,
-        calories REAL,
-        protein REAL,
-        carbs REAL,
-        fats REAL,
-        fiber REAL
-    )''')
-    conn.commit()
-    conn.close()
-
-init_db()
-
-def log_meal(date, meal_type, description, nutrition):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''INSERT INTO meals (date, meal_type, description, calories, protein, carbs, fats, fiber)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-              (date, meal_type, description, nutrition['calories'], 
-               nutrition['protein'], nutrition['carbs'], nutrition['fats'], nutrition['fiber']))
-    conn.commit()
-    conn.close()
-
-def get_history():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query(
-        'SELECT date as Date, meal_type as "Meal Type", description as Description, '
-        'calories as Calories, protein as Protein, carbs as Carbs, fats as Fats, fiber as Fiber '
-        'FROM meals ORDER BY date DESC, meal_type',
-        conn
-    )
-    conn.close()
-    return df
+# Meals per page in the History view
+HISTORY_PAGE_SIZE = 50
+# Trend chart ranges in the History view
+TREND_DAYS = 30
+TREND_WEEKS = 12
 
 # Initialize session state
 if 'messages' not in st.session_state:
@@ -163,9 +154,52 @@ if 'processing' not in st.session_state:
     st.session_state.processing = False
 if 'pending_input' not in st.session_state:
     st.session_state.pending_input = None
+if 'history_cursors' not in st.session_state:
+    st.session_state.history_cursors = [None]
+if 'user_id' not in st.session_state:
+    # ?user=name keeps the user across page reloads
+    st.session_state.user_id = normalize_user_id(st.query_params.get('user'))
+
+
+def auth_configured() -> bool:
+    """Whether Streamlit authentication ([auth] in .streamlit/secrets.toml) is set up."""
+    if not hasattr(st, 'login'):
+        return False
+    try:
+        return 'auth' in st.secrets
+    except Exception:
+        # No secrets file
+        return False
+
 
 # Sidebar
 with st.sidebar:
+    # Whose meals are shown and logged: only the signed-in account when
+    # Streamlit authentication is set up. Otherwise the name entered here,
+    # which just keeps histories apart: it is not authentication, and anyone
+    # using the app can open any name's meals.
+    if auth_configured():
+        if not st.user.get('is_logged_in'):
+            st.markdown("### 👤 Sign in")
+            st.caption("Sign in to log your meals and see your history.")
+            st.button("🔑 Log in", on_click=st.login, use_container_width=True)
+            st.stop()
+        user_id = normalize_user_id(st.user.get('email') or st.user.get('sub'))
+        st.caption(f"👤 Signed in as {user_id}")
+        st.button("Log out", on_click=st.logout, use_container_width=True)
+    else:
+        user_id = normalize_user_id(st.text_input(
+            "👤 Your name", value=st.session_state.user_id, key='user_name',
+            help="Keeps your meals apart from other people's. This is not a login: "
+                 "anyone who enters the same name sees the same history."
+        ))
+        if st.query_params.get('user') != user_id:
+            st.query_params['user'] = user_id
+    if user_id != st.session_state.user_id:
+        st.session_state.user_id = user_id
+        st.session_state.history_cursors = [None]
+    
+    st.markdown("---")
     st.markdown("### 📂 Navigation")
     
     # Navigation buttons
@@ -175,6 +209,7 @@ with st.sidebar:
     
     if st.button("📊 History", use_container_width=True, type="primary" if st.session_state.show_history else "secondary"):
         st.session_state.show_history = True
+        st.session_state.history_cursors = [None]
         st.rerun()
     
     st.markdown("---")
@@ -182,21 +217,19 @@ with st.sidebar:
     # Quick Stats
     st.markdown("### 🎯 Quick Stats")
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT COUNT(*) FROM meals')
-    total_meals = c.fetchone()[0]
-    
-    c.execute('SELECT SUM(calories) FROM meals WHERE date = ?', 
-              (datetime.now().strftime('%Y-%m-%d'),))
-    today_calories = c.fetchone()[0] or 0
-    conn.close()
+    stats = history.quick_stats(datetime.now().strftime('%Y-%m-%d'), user_id)
     
     col1, col2 = st.columns(2)
     with col1:
-        st.metric("📊 Meals", total_meals)
+        st.metric("📊 Meals", stats['meals'])
     with col2:
-        st.metric("🔥 Today", f"{today_calories:.0f} cal")
+        st.metric("🔥 Today", f"{stats['calories']:.0f} cal")
+    
+    # LLM usage per model tier (since the app started)
+    model_metrics = parser.client.metrics_report()
+    if model_metrics:
+        with st.expander("🤖 Model Usage"):
+            st.dataframe(pd.DataFrame(model_metrics).round(4), use_container_width=True, hide_index=True)
     
     st.markdown("---")
     
@@ -222,18 +255,111 @@ st.markdown("""
 if st.session_state.show_history:
     st.markdown("### 📊 Meal History")
     
-    df = get_history()
-    if not df.empty:
+    total_meals = history.count_meals(user_id)
+    if total_meals:
+        # Trends read the daily/weekly rollups, not the meals themselves
+        st.markdown("#### 📈 Trends")
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            trend_key = st.selectbox("Nutrient", NUTRIENT_KEYS, format_func=lambda key: get_nutrient(key).label)
+        nutrient = get_nutrient(trend_key)
+        with col2:
+            trend_period = st.radio("Period", ["daily", "weekly"], format_func=str.title, horizontal=True)
+        with col3:
+            goal = st.number_input(
+                f"Daily goal ({nutrient.unit})",
+                min_value=0.0,
+                value=float(nutrient.daily_value or 0),
+                key=f"goal_{trend_key}"
+            )
+        
+        today = datetime.now().date()
+        if trend_period == "daily":
+            period_column, period_goal = 'date', goal
+            start = today - timedelta(days=TREND_DAYS - 1)
+        else:
+            period_column, period_goal = 'week', goal * 7
+            start = today - timedelta(weeks=TREND_WEEKS - 1)
+        totals = history.get_totals(trend_period, start.isoformat(), today.isoformat(), user_id)
+        
+        if totals.empty:
+            st.info("No meals logged in this period.")
+        else:
+            fig = px.bar(
+                totals, x=period_column, y=trend_key, color='meal_type',
+                labels={period_column: period_column.title(), 'meal_type': "Meal Type",
+                        trend_key: f"{nutrient.label} ({nutrient.unit})"}
+            )
+            if period_goal:
+                fig.add_hline(y=period_goal, line_dash="dash", annotation_text="Goal")
+            fig.update_layout(height=350, margin=dict(l=0, r=0, t=30, b=0))
+            st.plotly_chart(fig, use_container_width=True)
+        
+        # Goal tracking
+        if goal:
+            today_total = history.get_totals("daily", today.isoformat(), today.isoformat(), user_id)[trend_key].sum()
+            st.progress(
+                min(today_total / goal, 1.0),
+                text=f"Today: {format_amount(trend_key, today_total)} of {format_amount(trend_key, goal)} "
+                     f"({today_total / goal:.0%})"
+            )
+            if not totals.empty:
+                per_period = totals.groupby(period_column)[trend_key].sum()
+                reached = int((per_period >= period_goal).sum())
+                st.caption(
+                    f"{trend_period.title()} average: {format_amount(trend_key, per_period.mean())} "
+                    f"({per_period.mean() / period_goal:.0%} of goal) · "
+                    f"goal reached in {reached} of {len(per_period)} {'days' if trend_period == 'daily' else 'weeks'} logged"
+                )
+        
+        # Top sources over the same period, scored from the stored meal items
+        # (one database snapshot, so a reload can't shift the nutrient columns)
+        items = history.get_items(start.isoformat(), today.isoformat(), user_id)
+        food_db = calculator.snapshot()
+        if not items.empty and trend_key in food_db.nutrient_keys:
+            values = calculator.score_items(items['food_id'].tolist(), items['multiplier'].tolist(), food_db)
+            items[trend_key] = values[:, food_db.nutrient_keys.index(trend_key)]
+            top_foods = items.groupby('food')[trend_key].sum().nlargest(5)
+            top_foods = top_foods[top_foods > 0]
+            if not top_foods.empty:
+                st.markdown(f"**🥇 Top sources of {nutrient.label.lower()}**")
+                st.dataframe(pd.DataFrame({
+                    'Food': top_foods.index.str.title(),
+                    nutrient.label: [format_amount(trend_key, value) for value in top_foods]
+                }), use_container_width=True, hide_index=True)
+        
+        st.markdown("#### 📋 Meals")
+        
+        # Keyset pagination: the cursor of every page visited so far
+        cursors = st.session_state.history_cursors
+        df, next_cursor = history.get_history_page(cursors[-1], HISTORY_PAGE_SIZE, user_id)
         st.dataframe(df, use_container_width=True, hide_index=True)
         
-        # Download button
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="📥 Download as CSV",
-            data=csv,
-            file_name=f"meal_history_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv"
-        )
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("◀ Newer", use_container_width=True, disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            pages = -(-total_meals // HISTORY_PAGE_SIZE)
+            st.caption(f"Page {len(cursors)} of {pages} · {total_meals} meals")
+        with col3:
+            if st.button("Older ▶", use_container_width=True, disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
+        
+        # The export reads every meal, so it is only built on request, and
+        # page by page rather than as one DataFrame
+        if st.button("📥 Export as CSV"):
+            csv_buffer = io.StringIO()
+            history.write_history_csv(csv_buffer, user_id)
+            st.download_button(
+                label="📥 Download CSV",
+                data=csv_buffer.getvalue(),
+                file_name=f"meal_history_{datetime.now().strftime('%Y%m%d')}.csv",
+                mime="text/csv"
+            )
     else:
         st.info("No meals logged yet! Start chatting to track your meals.")
 
@@ -243,7 +369,7 @@ else:
     
     # Display chat messages
     chat_container = st.container()
-    with chat_container:
+    with chat_container, tracer.span('render', messages=len(st.session_state.messages)):
         for message in st.session_state.messages:
             role = message["role"]
             content = message["content"]
@@ -269,38 +395,30 @@ else:
             if "nutrition_data" in message:
                 result = message["nutrition_data"]
                 
-                # Create DataFrame for the table
+                # Create DataFrame for the table: one column per nutrient in the result
+                totals = result['totals']
+                labels = {key: get_nutrient(key).label for key in totals}
                 items_data = []
                 for item in result['items']:
                     if item['status'] == 'success':
-                        items_data.append({
+                        row = {
                             'Food Item': item['food'].title(),
-                            'Quantity': f"{item['quantity']} {item['unit']}",
-                            'Calories': f"{item['calories']}",
-                            'Protein': f"{item['protein']}g",
-                            'Carbs': f"{item['carbs']}g",
-                            'Fats': f"{item['fats']}g"
-                        })
+                            'Quantity': f"{item['quantity']} {item['unit']}"
+                        }
+                        row.update({labels[key]: format_amount(key, item[key]) for key in totals})
                     else:
-                        items_data.append({
+                        row = {
                             'Food Item': f"❌ {item['food'].title()}",
-                            'Quantity': 'N/A',
-                            'Calories': 'Not found',
-                            'Protein': '-',
-                            'Carbs': '-',
-                            'Fats': '-'
-                        })
+                            'Quantity': 'N/A'
+                        }
+                        row.update({labels[key]: '-' for key in totals})
+                        row[labels['calories']] = 'Not found'
+                    items_data.append(row)
                 
                 # Add totals row
-                totals = result['totals']
-                items_data.append({
-                    'Food Item': '**TOTAL**',
-                    'Quantity': '',
-                    'Calories': f"**{totals['calories']:.0f}**",
-                    'Protein': f"**{totals['protein']:.1f}g**",
-                    'Carbs': f"**{totals['carbs']:.1f}g**",
-                    'Fats': f"**{totals['fats']:.1f}g**"
-                })
+                row = {'Food Item': '**TOTAL**', 'Quantity': ''}
+                row.update({labels[key]: f"**{format_amount(key, value)}**" for key, value in totals.items()})
+                items_data.append(row)
                 
                 df_items = pd.DataFrame(items_data)
                 
@@ -314,75 +432,74 @@ else:
         user_input = st.session_state.pending_input
         st.session_state.pending_input = None
         
-        # Show typing indicator
-        typing_placeholder = st.empty()
-        typing_placeholder.markdown("""
-        <div class="chat-container">
-            <div class="typing-indicator">
-                <span></span>
-                <span></span>
-                <span></span>
+        # One trace per turn, with a child span per stage (see src/tracing.py);
+        # the turn span's llm_calls attribute counts its Gemini requests
+        with tracer.span('turn', source='app') as turn:
+            # Show typing indicator
+            typing_placeholder = st.empty()
+            typing_placeholder.markdown("""
+            <div class="chat-container">
+                <div class="typing-indicator">
+                    <span></span>
+                    <span></span>
+                    <span></span>
+                </div>
             </div>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Get bot response
-        response = chatbot.chat(user_input, st.session_state.conversation_history)
-        typing_placeholder.empty()
-        
-        if response['type'] == 'meal_analysis':
-            # Meal analysis
-            meal_description = response.get('meal_description', user_input)
+            """, unsafe_allow_html=True)
             
-            # Add simple response
-            st.session_state.messages.append({
-                "role": "assistant", 
-                "content": "Sure! Here's your nutrition breakdown:"
-            })
+            # Conversational replies stream into the placeholder
+            def show_streamed(streamed_text):
+                typing_placeholder.markdown(f"""
+                <div class="chat-container">
+                    <div class="chat-message bot-message">
+                        <strong>🥗 NutriBot:</strong> {streamed_text}
+                    </div>
+                </div>
+                """, unsafe_allow_html=True)
             
-            # Analyze
-            parsed_meal = parser.parse_meal(meal_description)
+            # chat -> parse -> calculate -> log, one child span per stage
+            result = run_chat_turn(user_input, st.session_state.conversation_history, chatbot, parser,
+                                   calculator, history, user_id=user_id, on_chunk=show_streamed)
             
-            if 'error' not in parsed_meal:
-                result = calculator.calculate_meal(parsed_meal)
-                
-                # Add table with data
+            typing_placeholder.empty()
+            
+            if result['type'] == 'meal_analysis':
+                nutrition = result['result']
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": "Sure! Here's your nutrition breakdown:"
+                })
                 st.session_state.messages.append({
                     "role": "assistant",
-                    "content": f"Your {result['meal_type']} has {result['totals']['calories']:.0f} calories and {result['totals']['protein']:.1f}g protein. Looking good! 💪",
-                    "nutrition_data": result
+                    "content": f"Your {nutrition['meal_type']} has {nutrition['totals']['calories']:.0f} calories and {nutrition['totals']['protein']:.1f}g protein. Looking good! 💪",
+                    "nutrition_data": nutrition
+                })
+            
+            elif result['type'] == 'parse_error':
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": "Sure! Here's your nutrition breakdown:"
                 })
-                
-                # Log meal
-                log_meal(
-                    date=datetime.now().strftime('%Y-%m-%d'),
-                    meal_type=result['meal_type'],
-                    description=meal_description,
-                    nutrition=result['totals']
-                )
-            else:
                 st.session_state.messages.append({
                     "role": "assistant",
                     "content": "I couldn't analyze that meal. Could you describe it again? 🤔"
                 })
-        
-        elif response['type'] == 'conversation':
-            # Regular chat
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": response['message']
-            })
-        
-        else:
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": "Sorry, something went wrong. Please try again! 😅"
-            })
-        
-        # Update history
-        st.session_state.conversation_history.append({"role": "user", "content": user_input})
-        st.session_state.conversation_history.append({"role": "assistant", "content": response.get('message', '')})
-        
+            
+            elif result['type'] == 'conversation':
+                # Regular chat
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": result['message']
+                })
+            
+            else:
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": "Sorry, something went wrong. Please try again! 😅"
+                })
+            
+            turn.set(type=result['type'])
+            
         st.session_state.processing = False
         st.rerun()
     
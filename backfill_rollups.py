@@ -0,0 +1,25 @@
+import argparse
+import time
+
+from src.meal_history import DB_PATH, MealHistory
+
+
+def main():
+    """Rebuild the daily and weekly nutrient rollups from every logged meal."""
+    arg_parser = argparse.ArgumentParser(description=main.__doc__)
+    arg_parser.add_argument('--db', default=DB_PATH, help="Meal history database")
+    args = arg_parser.parse_args()
+
+    history = MealHistory(args.db)
+    print(f"📖 Rolling up {history.count_meals(user_id=None)} meals in {args.db}...")
+    start = time.perf_counter()
+    counts = history.rebuild_rollups()
+    history.close()
+
+    for table, rows in counts.items():
+        print(f"✓ {table}: {rows} rows")
+    print(f"💾 Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Offline load test of full chat turns: chat -> parse_meal -> calculate_meal -> log_meal.
+
+Gemini is replaced by a ReplayBackend answering from recorded responses
+(benchmarks/recordings.jsonl by default) after a simulated latency, so
+runs need no API key and are repeatable for a given --seed. Each session
+is a thread sending messages like a Streamlit session would, through one
+shared GeminiClient; meals are logged to a throwaway history database.
+
+Record real responses for replay by passing a RecordingBackend to
+GeminiClient (see src/llm_backends.py).
+
+Usage:
+    python -m benchmarks.chat_pipeline
+    python -m benchmarks.chat_pipeline --sessions 16 --turns 50 --first-token 0.8 --json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from src.chat_turn import run_chat_turn
+from src.chatbot_handler import NutritionChatbot
+from src.compiled_db import open_database
+from src.gemini_client import GeminiClient
+from src.llm_backends import LatencyModel, ReplayBackend
+from src.local_parser import LocalMealParser
+from src.meal_history import DEFAULT_USER, get_repository, init_db
+from src.nlp_parser import PARSE_MODELS, MealParser
+from src.nutrition_calculator import NutritionCalculator
+from src.parse_cache import ParseCache
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_RECORDINGS = str(ROOT / 'benchmarks' / 'recordings.jsonl')
+
+# Messages the sessions pick from: meals the local parser handles, meals
+# needing a Gemini parse, a meal only the chat call recognizes, and small talk
+MESSAGES = [
+    "I had 2 rotis and dal for dinner",
+    "3 idlis with sambar for breakfast",
+    "paneer butter masala with 2 naan",
+    "I had a big plate of chole bhature at the mall",
+    "Had leftover chicken biryani with boondi raita for dinner",
+    "Just finished a masala dosa",
+    "hello!",
+    "Any tips for getting more protein?",
+    "thanks, that helps",
+]
+
+STAGES = ('chat', 'stream', 'parse_meal', 'calculate_meal', 'log_meal', 'turn')
+
+
+def build_pipeline(history_db: str, recordings: str = DEFAULT_RECORDINGS,
+                   database: str = 'data/nutrition_db.json', latency: LatencyModel = None,
+                   concurrency: int = 4, cache: bool = False) -> Dict:
+    """
+    Create the app's components on top of a ReplayBackend.
+
+    Args:
+        history_db: Meal history database to log to
+        recordings: JSONL recordings for the ReplayBackend
+        database: Nutrition database
+        latency: Simulated LLM latency (defaults to none)
+        concurrency: LLM requests in flight
+        cache: Use a parse cache next to history_db
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        backend = ReplayBackend(recordings, latency)
+        db = open_database(database)
+    client = GeminiClient(PARSE_MODELS[0], max_concurrency=concurrency, backend=backend)
+    parse_cache = ParseCache(str(Path(history_db).with_name('parse_cache.db'))) if cache else None
+    return {
+        'backend': backend,
+        'client': client,
+        'parser': MealParser(cache=parse_cache, local_parser=LocalMealParser(db), client=client, database=db),
+        'calculator': NutritionCalculator(db),
+        'chatbot': NutritionChatbot(client=client, combined=True, model_name=PARSE_MODELS[0], database=db),
+        'history_db': history_db,
+        'history': get_repository(history_db),
+    }
+
+
+def chat_turn(pipeline: Dict, message: str, history: List[Dict], stream: bool,
+              user_id: str = DEFAULT_USER) -> Dict:
+    """
+    One turn through the same run_chat_turn() app.py uses, logging meals to `user_id`'s history.
+
+    Returns:
+        Seconds spent per stage, plus the response type under 'type'
+    """
+    start = time.perf_counter()
+    turn = run_chat_turn(message, history, pipeline['chatbot'], pipeline['parser'], pipeline['calculator'],
+                         pipeline['history'], user_id=user_id, stream=stream)
+    timings = dict(turn['timings'])
+    timings['turn'] = time.perf_counter() - start
+    timings['type'] = turn['type']
+    return timings
+
+
+def run_session(pipeline: Dict, session: int, args) -> List[Dict]:
+    """Send args.turns random messages in one conversation (each session is its own user)."""
+    rng = random.Random(f"{args.seed}-{session}")
+    history = []
+    return [chat_turn(pipeline, rng.choice(MESSAGES), history, args.stream, f"session-{session}")
+            for _ in range(args.turns)]
+
+
+def summarize(turns: List[Dict], elapsed: float, pipeline: Dict) -> Dict:
+    """Latency percentiles per stage, throughput and LLM usage."""
+    stages = {}
+    for stage in STAGES:
+        values = np.array([turn[stage] for turn in turns if stage in turn]) * 1000
+        if len(values):
+            stages[stage] = {
+                'count': int(len(values)),
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(np.percentile(values, 50)),
+                'p95_ms': float(np.percentile(values, 95)),
+                'p99_ms': float(np.percentile(values, 99)),
+            }
+
+    types = {}
+    for turn in turns:
+        types[turn['type']] = types.get(turn['type'], 0) + 1
+
+    return {
+        'turns': len(turns),
+        'elapsed_s': elapsed,
+        'turns_per_s': len(turns) / elapsed if elapsed else 0.0,
+        'response_types': types,
+        'stages': stages,
+        'llm_calls': pipeline['backend'].calls,
+        'llm_misses': pipeline['backend'].misses,
+        'models': pipeline['client'].metrics_report(),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Offline load test of chat -> parse -> calculate -> log.")
+    arg_parser.add_argument('--sessions', type=int, default=8, help="Concurrent chat sessions")
+    arg_parser.add_argument('--turns', type=int, default=25, help="Messages per session")
+    arg_parser.add_argument('--recordings', default=DEFAULT_RECORDINGS)
+    arg_parser.add_argument('--database', default='data/nutrition_db.json')
+    arg_parser.add_argument('--first-token', type=float, default=0.4, help="Median seconds to first token")
+    arg_parser.add_argument('--per-token', type=float, default=0.005, help="Median seconds per output token")
+    arg_parser.add_argument('--jitter', type=float, default=0.25, help="Lognormal sigma of the latency")
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of failing LLM requests")
+    arg_parser.add_argument('--concurrency', type=int, default=4, help="LLM requests in flight")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--stream', action='store_true', help="Use chat_stream like the app")
+    arg_parser.add_argument('--cache', action='store_true', help="Use a parse cache")
+    arg_parser.add_argument('--json', action='store_true', help="Print the summary as JSON")
+    args = arg_parser.parse_args()
+
+    # Keep the JSON on stdout parseable (retry warnings go to stderr)
+    with tempfile.TemporaryDirectory() as tmp, \
+            contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        history_db = str(Path(tmp) / 'meal_history.db')
+        init_db(history_db)
+        latency = LatencyModel(first_token=args.first_token, per_token=args.per_token,
+                               jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+        pipeline = build_pipeline(history_db, args.recordings, args.database, latency,
+                                  args.concurrency, args.cache)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.sessions) as pool:
+            sessions = pool.map(lambda session: run_session(pipeline, session, args), range(args.sessions))
+            turns = [turn for session in sessions for turn in session]
+        summary = summarize(turns, time.perf_counter() - start, pipeline)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"{summary['turns']} turns in {summary['elapsed_s']:.1f}s "
+          f"({summary['turns_per_s']:.1f} turns/s, {args.sessions} sessions)")
+    print(f"LLM calls: {summary['llm_calls']} ({summary['llm_misses']} without a recording)")
+    print(f"Responses: {summary['response_types']}\n")
+    print(f"{'Stage':<16} {'Count':>6} {'Mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    print("-" * 62)
+    for stage, stats in summary['stages'].items():
+        print(f"{stage:<16} {stats['count']:>6} {stats['mean_ms']:>9.1f} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
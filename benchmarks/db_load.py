@@ -0,0 +1,90 @@
+"""
+Compare JSON and compiled (.nutridb) database load time and memory.
+
+Each measurement runs in a fresh interpreter so import caches and
+previously loaded data don't skew the numbers.
+
+Usage:
+    python compile_db.py data/nutrition_db.json data/nutrition_db_backup.json
+    python -m benchmarks.db_load
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Runs inside the child process; prints one JSON line with the results
+_CHILD = r'''
+import io, json, sys, time, contextlib
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+from src.database import NutritionDatabase
+from src.compiled_db import CompiledNutritionDatabase
+
+kind, path = sys.argv[1], sys.argv[2]
+before = rss_kb()
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    db = NutritionDatabase(path) if kind == 'json' else CompiledNutritionDatabase(path)
+loaded = time.perf_counter()
+db.find_food('chapati')
+first_lookup = time.perf_counter()
+print(json.dumps({
+    'load_ms': (loaded - start) * 1000,
+    'first_lookup_ms': (first_lookup - loaded) * 1000,
+    'rss_delta_kb': rss_kb() - before,
+}))
+'''
+
+
+def measure(kind: str, path: Path, repeat: int) -> dict:
+    """Run the child benchmark several times and keep the fastest run."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', _CHILD, kind, str(path)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run['load_ms'])
+    best['file_kb'] = path.stat().st_size / 1024
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark nutrition database loading.")
+    arg_parser.add_argument('databases', nargs='*',
+                            default=['data/nutrition_db.json', 'data/nutrition_db_backup.json'])
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    print(f"{'Database':<32} {'Format':<9} {'File KB':>8} {'Load ms':>9} {'Lookup ms':>10} {'RSS +KB':>9}")
+    print("-" * 82)
+    for database in args.databases:
+        json_path = ROOT / database
+        compiled_path = json_path.with_suffix('.nutridb')
+        for kind, path in [('json', json_path), ('compiled', compiled_path)]:
+            if not path.exists():
+                print(f"{database:<32} {kind:<9} missing (run compile_db.py first)")
+                continue
+            result = measure(kind, path, args.repeat)
+            print(f"{database:<32} {kind:<9} {result['file_kb']:>8.0f} {result['load_ms']:>9.2f} "
+                  f"{result['first_lookup_ms']:>10.3f} {result['rss_delta_kb']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Benchmark suite for the meal analysis pipeline.
+
+Times database loading, find_food and search_food, calculate_meal and
+format_result, log_meal, get_history and history pages, and a full chat turn on the
+replay LLM backend (no API key or network needed). Runs across both
+nutrition databases and several meal history sizes, and writes the
+results as JSON so runs on different commits can be compared.
+
+Usage:
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --output after.json --compare before.json
+    python -m benchmarks.suite --quick
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from benchmarks.chat_pipeline import MESSAGES, build_pipeline, chat_turn
+from benchmarks.db_load import measure
+from src.compiled_db import CompiledNutritionDatabase, compiled_path_for
+from src.database import NutritionDatabase
+from src.meal_history import get_history, get_repository, init_db, log_meal
+from src.nutrients import NUTRIENT_KEYS
+from src.nutrition_calculator import NutritionCalculator
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DATABASES = ['data/nutrition_db.json', 'data/nutrition_db_backup.json']
+HISTORY_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# Users the synthetic meals are spread over; per-user reads are timed for one of them
+HISTORY_USERS = 100
+
+SEARCH_QUERIES = ['pan', 'chick', 'rice', 'dal', 'masala', 'egg', 'tea', 'aloo', 'paneer', 'curry']
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snack')
+
+
+def time_calls(fn: Callable, items: Sequence, repeat: int, min_time: float = 0.05) -> Dict:
+    """
+    Time fn(item) over all items, like timeit.
+
+    Each of `repeat` rounds calls fn on every item `loops` times, with
+    `loops` chosen so a round takes at least `min_time` seconds.
+
+    Returns:
+        Per-call min, median and mean over the rounds, in ms
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            for item in items:
+                fn(item)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 2 if elapsed * 2 >= min_time else 10
+
+    rounds = [elapsed]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            for item in items:
+                fn(item)
+        rounds.append(time.perf_counter() - start)
+
+    per_call = np.array(rounds) * 1000 / (loops * len(items))
+    return {
+        'min_ms': float(per_call.min()),
+        'median_ms': float(np.median(per_call)),
+        'mean_ms': float(per_call.mean()),
+        'calls': loops * len(items) * len(rounds),
+    }
+
+
+class Suite:
+    """Collects results and prints them as they come in."""
+
+    def __init__(self, quiet: bool = False):
+        self.results: List[Dict] = []
+        self.quiet = quiet
+
+    def add(self, name: str, params: Dict, stats: Dict):
+        self.results.append({'name': name, 'params': params, **stats})
+        if not self.quiet:
+            described = ', '.join(f"{key}={value}" for key, value in params.items())
+            print(f"{name:<16} {described:<64} {stats['median_ms']:>12.4f} ms", flush=True)
+
+
+def load_quietly(kind: str, path: str):
+    """Open a database without its load messages."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return NutritionDatabase(path) if kind == 'json' else CompiledNutritionDatabase(str(path))
+
+
+def sample_meals(db, count: int, rng: random.Random) -> List[Dict]:
+    """Parsed meals of 1-4 random foods from the database."""
+    names = db.get_all_food_names()
+    return [{
+        'meal_type': rng.choice(MEAL_TYPES),
+        'items': [{'food': rng.choice(names), 'quantity': rng.choice([0.5, 1, 2, 3]), 'unit': 'serving'}
+                  for _ in range(rng.randint(1, 4))]
+    } for _ in range(count)]
+
+
+def bench_database(suite: Suite, database: str, repeat: int):
+    """Load, lookup, search, calculation and formatting benchmarks for one database."""
+    json_path = ROOT / database
+    compiled_path = Path(compiled_path_for(str(json_path)))
+
+    for kind, path in [('json', json_path), ('compiled', compiled_path)]:
+        if not path.exists():
+            print(f"⚠ {path} missing, skipped (run compile_db.py first)", file=sys.stderr)
+            continue
+        params = {'database': database, 'format': kind}
+
+        # Each load in a fresh interpreter, as in benchmarks/db_load.py
+        loads = np.array([measure(kind, path, 1)['load_ms'] for _ in range(repeat)])
+        suite.add('db_load', params, {'min_ms': float(loads.min()), 'median_ms': float(np.median(loads)),
+                                      'mean_ms': float(loads.mean()), 'calls': repeat})
+
+        db = load_quietly(kind, path)
+        rng = random.Random(0)
+        names = db.get_all_food_names()
+        hits = rng.sample(names, min(200, len(names)))
+        misses = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(8)) for _ in range(50)]
+
+        suite.add('find_food', {**params, 'lookup': 'hit'}, time_calls(db.find_food, hits, repeat))
+        suite.add('find_food', {**params, 'lookup': 'miss'}, time_calls(db.find_food, misses, repeat))
+        suite.add('search_food', params, time_calls(db.search_food, SEARCH_QUERIES, repeat))
+
+        calculator = NutritionCalculator(db)
+        meals = sample_meals(db, 100, rng)
+        suite.add('calculate_meal', params, time_calls(calculator.calculate_meal, meals, repeat))
+
+        results = [calculator.calculate_meal(meal) for meal in meals[:20]]
+        for format_type in ('table', 'simple'):
+            suite.add('format_result', {**params, 'format_type': format_type},
+                      time_calls(lambda result: calculator.format_result(result, format_type), results, repeat))
+
+
+def seed_history(db_path: str, size: int, rng: random.Random, users: int = 1):
+    """Fill a meal history database with `size` synthetic meals spread over three years and `users` users."""
+    init_db(db_path)
+    conn = sqlite3.connect(db_path)
+    start = date.today() - timedelta(days=3 * 365)
+    columns = ', '.join(NUTRIENT_KEYS)
+    rows = (
+        (f'user-{i % users}', (start + timedelta(days=i // users % (3 * 365))).isoformat(),
+         rng.choice(MEAL_TYPES), f"synthetic meal {i}", *[round(rng.uniform(0, 500), 1) for _ in NUTRIENT_KEYS])
+        for i in range(size)
+    )
+    with conn:
+        conn.executemany(
+            f'INSERT INTO meals (user_id, date, meal_type, description, {columns}) '
+            f'VALUES (?, ?, ?, ?{", ?" * len(NUTRIENT_KEYS)})',
+            rows
+        )
+    conn.close()
+
+
+def bench_history(suite: Suite, sizes: Sequence[int], repeat: int, tmp: Path, users: int = HISTORY_USERS):
+    """
+    log_meal, get_history, history pages, sidebar stats and rollup reads on
+    histories of each size, for one of `users` users sharing the database.
+    """
+    rng = random.Random(0)
+    nutrition = {key: 100.0 for key in NUTRIENT_KEYS}
+    today = datetime.now().strftime('%Y-%m-%d')
+    user = 'user-0'
+
+    for size in sizes:
+        db_path = str(tmp / f'history_{size}.db')
+        seed_history(db_path, size, rng, users)
+        params = {'history_meals': size, 'users': users}
+
+        suite.add('log_meal', params, time_calls(
+            lambda i: log_meal(today, 'lunch', f'benchmark meal {i}', nutrition, db_path=db_path, user_id=user),
+            range(20), repeat
+        ))
+        suite.add('get_history', params, time_calls(
+            lambda path: get_history(path, user), [db_path], repeat, min_time=0
+        ))
+
+        history = get_repository(db_path)
+        _, cursor = history.get_history_page(page_size=50, user_id=user)
+        # The cursor of a page ~90% of the way back
+        deep_cursor = history.get_history_page(page_size=int(history.count_meals(user) * 0.9),
+                                               user_id=user)[1] or cursor
+        suite.add('history_page', {**params, 'page': 'first'},
+                  time_calls(lambda after: history.get_history_page(after, user_id=user), [None], repeat))
+        suite.add('history_page', {**params, 'page': 'deep'},
+                  time_calls(lambda after: history.get_history_page(after, user_id=user), [deep_cursor], repeat))
+        suite.add('quick_stats', params, time_calls(lambda day: history.quick_stats(day, user), [today], repeat))
+        year_ago = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        for period in ('daily', 'weekly'):
+            suite.add('rollup_totals', {**params, 'period': period},
+                      time_calls(lambda p: history.get_totals(p, year_ago, today, user), [period], repeat))
+
+
+def bench_chat(suite: Suite, databases: Sequence[str], repeat: int, tmp: Path):
+    """Full chat turns on the replay backend with no simulated latency (pipeline overhead only)."""
+    for database in databases:
+        history_db = str(tmp / 'chat_history.db')
+        init_db(history_db)
+        pipeline = build_pipeline(history_db, database=database)
+        for stream in (False, True):
+            # Drop the pipeline's progress messages
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = time_calls(lambda message: chat_turn(pipeline, message, [], stream), MESSAGES, repeat)
+            suite.add('chat_turn', {'database': database, 'stream': stream}, stats)
+
+
+def git_commit() -> str:
+    """Current commit, marked '-dirty' with uncommitted changes."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def compare(results: List[Dict], baseline_file: str, threshold: float) -> int:
+    """
+    Print median changes against an earlier run.
+
+    Returns:
+        Number of benchmarks slower than the baseline by more than `threshold`
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    before = {(result['name'], json.dumps(result['params'], sort_keys=True)): result
+              for result in baseline['results']}
+
+    print(f"\nCompared with {baseline['meta']['commit']} ({baseline_file}):")
+    regressions = 0
+    for result in results:
+        old = before.get((result['name'], json.dumps(result['params'], sort_keys=True)))
+        if old is None or not old['median_ms']:
+            continue
+        change = result['median_ms'] / old['median_ms'] - 1
+        if change > threshold:
+            regressions += 1
+            marker = '✗'
+        elif change < -threshold:
+            marker = '✓'
+        else:
+            continue
+        described = ', '.join(f"{key}={value}" for key, value in result['params'].items())
+        print(f"  {marker} {result['name']:<16} {described:<64} {change:+.0%}")
+
+    print(f"{regressions} regression(s) above {threshold:.0%}" if regressions
+          else f"No regressions above {threshold:.0%}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the meal analysis pipeline.")
+    arg_parser.add_argument('--databases', nargs='*', default=DATABASES)
+    arg_parser.add_argument('--history-sizes', nargs='*', type=int, default=HISTORY_SIZES)
+    arg_parser.add_argument('--history-users', type=int, default=HISTORY_USERS,
+                            help="Users the history meals are spread over")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="Timing rounds per benchmark")
+    arg_parser.add_argument('--quick', action='store_true', help="Fewer rounds and histories up to 10k meals")
+    arg_parser.add_argument('--only', nargs='*', choices=['database', 'history', 'chat'],
+                            help="Run only these groups")
+    arg_parser.add_argument('--output', help="Write the results to this JSON file")
+    arg_parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+    arg_parser.add_argument('--compare', help="Earlier results file to compare with (exits 1 on regressions)")
+    arg_parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Relative slowdown counted as a regression")
+    args = arg_parser.parse_args()
+
+    if args.quick:
+        args.repeat = min(args.repeat, 3)
+        args.history_sizes = [size for size in args.history_sizes if size <= 10_000]
+    groups = set(args.only or ['database', 'history', 'chat'])
+
+    suite = Suite(quiet=args.json)
+    started = datetime.now().isoformat(timespec='seconds')
+    with tempfile.TemporaryDirectory() as tmp, \
+            contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        if 'database' in groups:
+            for database in args.databases:
+                bench_database(suite, database, args.repeat)
+        if 'history' in groups:
+            bench_history(suite, args.history_sizes, args.repeat, Path(tmp), args.history_users)
+        if 'chat' in groups:
+            bench_chat(suite, args.databases, args.repeat, Path(tmp))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'started': started,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': suite.results,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Saved {len(suite.results)} results to {args.output}", file=sys.stderr if args.json else sys.stdout)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+            regressions = compare(suite.results, args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,12 @@ def check_food_names():
         data = json.load(f)
     
     foods = data.get('foods', [])
+    nutrient_keys = data.get('nutrient_keys', [])
+    
+    def calories_of(food):
+        if 'nutrients' in food and 'calories' in nutrient_keys:
+            return food['nutrients'][nutrient_keys.index('calories')]
+        return food.get('calories', 'N/A')
     print(f"Total foods: {len(foods)}\n")
     print("=" * 80)
     
@@ -21,7 +27,7 @@ def check_food_names():
         
         print(f"{i+1:3d}. Name: {name}")
         print(f"     Aliases: {aliases_str}")
-        print(f"     Calories: {food.get('calories', 'N/A')} kcal")
+        print(f"     Calories: {calories_of(food)} kcal")
         print()
     
     # Search for specific foods
@@ -0,0 +1,23 @@
+import argparse
+
+from src.compiled_db import compile_json_database, compiled_path_for
+
+
+def main():
+    """Compile JSON nutrition databases to the memory-mapped .nutridb format."""
+    arg_parser = argparse.ArgumentParser(description=main.__doc__)
+    arg_parser.add_argument('json_files', nargs='*', default=['data/nutrition_db.json'],
+                            help='JSON databases to compile (default: data/nutrition_db.json)')
+    args = arg_parser.parse_args()
+    
+    for json_file in args.json_files:
+        output_file = compiled_path_for(json_file)
+        print(f"📖 Compiling {json_file}...")
+        stats = compile_json_database(json_file, str(output_file))
+        print(f"✓ {stats['foods']} foods, {stats['aliases']} aliases, {stats['names']} index keys, "
+              f"{stats['nutrients']} nutrients")
+        print(f"💾 Saved {output_file} ({stats['bytes'] / 1024:.0f} KB)\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,120 +1,416 @@
-import pandas as pd
+import argparse
+import hashlib
 import json
+import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.compiled_db import compile_json_database, compiled_path_for
+from src.database import upgrade_legacy_foods
+from src.nutrients import NUTRIENTS
+from src.nutrition_calculator import round_array
+from src.search_index import normalize_name
+
+# Split points and filler words used when generating aliases
+ALIAS_SEPARATORS = (' with ', ' and ', ' or ', ' / ', '-')
+STOP_WORDS = {'with', 'and', 'the', 'for'}
+PAREN_PATTERN = re.compile(r'\((.*?)\)')
+
+# Search terms checked at the end of a conversion
+TEST_FOODS = ['hot tea', 'tea', 'chai', 'coffee', 'lemonade']
+
 
 def create_aliases(dish_name):
     """Create smart aliases for a dish name."""
-    
-    aliases = []
+
     original = dish_name.strip()
-    
+    lowered = original.lower()
+
     # Add lowercase version
-    aliases.append(original.lower())
-    
+    aliases = [lowered]
+
     # Extract content from parentheses
     if '(' in original and ')' in original:
         # Get text before parentheses
-        before_paren = original.split('(')[0].strip()
-        aliases.append(before_paren.lower())
-        
+        aliases.append(lowered.split('(')[0].strip())
+
         # Get text inside parentheses
-        inside_paren = re.findall(r'\((.*?)\)', original)
-        for text in inside_paren:
-            aliases.append(text.strip().lower())
-    
+        aliases.extend(text.strip() for text in PAREN_PATTERN.findall(lowered))
+
     # Split by common separators and add variations
-    for separator in [' with ', ' and ', ' or ', ' / ', '-']:
-        if separator in original.lower():
-            parts = original.lower().split(separator)
-            for part in parts:
-                cleaned = part.strip()
-                if len(cleaned) > 3:  # Skip very short parts
-                    aliases.append(cleaned)
-    
+    for separator in ALIAS_SEPARATORS:
+        if separator in lowered:
+            aliases.extend(part.strip() for part in lowered.split(separator) if len(part.strip()) > 3)
+
     # Add individual important words (longer than 3 chars)
-    words = original.lower().split()
-    important_words = [w for w in words if len(w) > 3 and w not in ['with', 'and', 'the', 'for']]
-    aliases.extend(important_words)
-    
-    # Remove duplicates and empty strings
-    aliases = list(set([a for a in aliases if a]))
-    
-    # Remove the main name if it's in aliases
-    main_name = original.lower()
-    if main_name in aliases:
-        aliases.remove(main_name)
-    
-    return aliases
-
-def convert_csv_to_db(csv_file, output_file):
-    """Convert CSV to nutrition database with better name handling."""
-    
+    aliases.extend(w for w in lowered.split() if len(w) > 3 and w not in STOP_WORDS)
+
+    # Remove duplicates (keeping first-seen order so output is stable), empty
+    # strings and the main name itself
+    return [a for a in dict.fromkeys(aliases) if a and a != lowered]
+
+
+def create_aliases_batch(dish_names: List[str]) -> List[List[str]]:
+    """Create aliases for a batch of dish names (one worker task)."""
+    return [create_aliases(name) for name in dish_names]
+
+
+def create_aliases_parallel(dish_names: List[str], pool: Optional[ProcessPoolExecutor], jobs: int) -> List[List[str]]:
+    """Create aliases for dish names, split over the pool's workers if there is one."""
+    if pool is None or len(dish_names) < 2:
+        return create_aliases_batch(dish_names)
+    size = -(-len(dish_names) // jobs)
+    parts = [dish_names[i:i + size] for i in range(0, len(dish_names), size)]
+    return [aliases for part in pool.map(create_aliases_batch, parts) for aliases in part]
+
+
+def existing_ids(output_file: str) -> Tuple[Dict[str, int], int]:
+    """
+    Ids of the foods already in a database, by normalized name, and the
+    next unused id, so a full rebuild keeps every food's id.
+
+    Meal history stores food ids (meal_items, rescore_meals.py), so a food
+    must keep its id when rows are added to or removed from the CSV.
+    """
+    if not os.path.exists(output_file):
+        return {}, 1
+    with open(output_file, 'r', encoding='utf-8') as f:
+        foods = json.load(f).get('foods', [])
+    # A dish's own CSV-derived entry wins over a hand-added one of the same name
+    ids = {}
+    for food in sorted(foods, key=lambda food: 'source_hash' not in food):
+        if 'id' in food:
+            ids.setdefault(normalize_name(food['name']), food['id'])
+    return ids, max((food.get('id', 0) for food in foods), default=0) + 1
+
+
+def chunk_values(chunk: pd.DataFrame):
+    """
+    Convert a chunk of CSV rows to dish names and rounded nutrient vectors
+    (None for missing values), with one numpy operation per chunk.
+    """
+    names = chunk['Dish Name'].astype(str).str.strip().str.lower().tolist()
+    columns = [n.csv_column for n in NUTRIENTS if n.csv_column in chunk.columns]
+    values = round_array(chunk[columns].to_numpy(dtype=np.float64)).tolist()
+    return names, [[None if value != value else value for value in row] for row in values]
+
+
+def row_hash(name: str, nutrients: List) -> str:
+    """Content hash of a converted CSV row, used to detect changed rows."""
+    return hashlib.sha1(json.dumps([name, nutrients]).encode('utf-8')).hexdigest()[:16]
+
+
+def make_food_entry(food_id: int, name: str, aliases: List[str], nutrients: List) -> Dict:
+    """Build a database entry for a CSV row."""
+    return {
+        "id": food_id,
+        "name": name,
+        "aliases": aliases,
+        "serving_size": "1 serving (100g)",
+        "serving_size_grams": 100,
+        "nutrients": nutrients,
+        "source_hash": row_hash(name, nutrients)
+    }
+
+
+def iter_food_chunks(csv_file: str, chunk_size: int, jobs: int,
+                     ids: Optional[Dict[str, int]] = None, next_id: int = 1) -> Iterator[List[Dict]]:
+    """
+    Stream food entries from the CSV, one chunk of rows at a time.
+
+    Nutrient columns are converted per chunk with numpy; alias generation
+    runs in up to `jobs` worker processes. At most 2 * jobs chunks are in
+    flight, so memory stays bounded regardless of CSV size.
+
+    Args:
+        ids: Id to keep for each normalized dish name (see existing_ids());
+            other dishes are numbered from next_id
+        next_id: First id for dishes without one
+    """
+    reader = pd.read_csv(csv_file, chunksize=chunk_size)
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    pending = deque()
+    ids = ids or {}
+    used = set()
+
+    def finish(chunk, aliases_future):
+        nonlocal next_id
+        names, values = chunk_values(chunk)
+        aliases = aliases_future.result() if pool else aliases_future
+
+        foods = []
+        for name, food_aliases, nutrients in zip(names, aliases, values):
+            food_id = ids.get(normalize_name(name))
+            # A repeated dish name gets an id of its own
+            if food_id is None or food_id in used:
+                food_id = next_id
+                next_id += 1
+            used.add(food_id)
+            foods.append(make_food_entry(food_id, name, food_aliases, nutrients))
+        return foods
+
+    try:
+        for chunk in reader:
+            dish_names = chunk['Dish Name'].astype(str).tolist()
+            if pool:
+                pending.append((chunk, pool.submit(create_aliases_batch, dish_names)))
+                if len(pending) >= 2 * jobs:
+                    yield finish(*pending.popleft())
+            else:
+                yield finish(chunk, create_aliases_batch(dish_names))
+
+        while pending:
+            yield finish(*pending.popleft())
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+
+def write_db(output_file: str, nutrient_keys: List[str], foods) -> int:
+    """Write foods (any iterable) to a JSON database, one food per line, atomically."""
+    count = 0
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write('{\n  "nutrient_keys": ' + json.dumps(nutrient_keys, ensure_ascii=False) + ',\n  "foods": [')
+        for food in foods:
+            f.write((',\n    ' if count else '\n    ') + json.dumps(food, ensure_ascii=False))
+            count += 1
+        f.write('\n  ]\n}\n')
+    os.replace(tmp_file, output_file)
+    return count
+
+
+def convert_csv_to_db(csv_file, output_file, jobs: int = 1, chunk_size: int = 5000, renumber: bool = False):
+    """
+    Convert CSV to nutrition database with better name handling.
+
+    Rows are streamed in chunks and written out as they are converted
+    (one food per line), so memory use does not grow with the CSV.
+    Dishes already in output_file keep their id; new ones are numbered
+    after the largest existing id.
+
+    Args:
+        csv_file: Source CSV with a 'Dish Name' column and nutrient columns
+        output_file: JSON database to write
+        jobs: Worker processes used for alias generation
+        chunk_size: CSV rows converted per batch
+        renumber: Number every dish from 1 instead, ignoring existing ids
+            (logged meal history then points at different foods)
+    """
+
     print(f"📖 Reading {csv_file}...\n")
-    
-    df = pd.read_csv(csv_file)
-    print(f"✓ Found {len(df)} dishes\n")
-    
-    foods = []
-    
-    for idx, row in df.iterrows():
-        dish_name = str(row['Dish Name']).strip()
-        
-        # Use the full dish name (in lowercase)
-        main_name = dish_name.lower()
-        
-        # Create comprehensive aliases
-        aliases = create_aliases(dish_name)
-        
-        # Create food entry
-        food_entry = {
-            "id": idx + 1,
-            "name": main_name,
-            "aliases": aliases,
-            "serving_size": "1 serving (100g)",
-            "serving_size_grams": 100,
-            "calories": round(float(row['Calories (kcal)']), 1),
-            "protein": round(float(row['Protein (g)']), 1),
-            "carbs": round(float(row['Carbohydrates (g)']), 1),
-            "fats": round(float(row['Fats (g)']), 1),
-            "fiber": round(float(row['Fibre (g)']), 1)
-        }
-        
-        foods.append(food_entry)
-        
-        # Show progress for first few entries
-        if idx < 5:
-            print(f"✓ {food_entry['name']}")
-            print(f"  Aliases: {', '.join(aliases[:5])}{'...' if len(aliases) > 5 else ''}")
-            print()
-    
-    print(f"\n✓ Converted {len(foods)} dishes")
-    
-    # Save to JSON
-    output_data = {"foods": foods}
-    
-    print(f"\n💾 Saving to {output_file}...")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=2, ensure_ascii=False)
-    
+
+    ids, next_id = ({}, 1) if renumber else existing_ids(output_file)
+    if ids:
+        print(f"✓ Keeping the ids of {len(ids)} foods in {output_file}\n")
+
+    # Every known nutrient present in the CSV becomes part of the vector
+    header = pd.read_csv(csv_file, nrows=0).columns
+    nutrient_keys = [n.key for n in NUTRIENTS if n.csv_column in header]
+    print(f"✓ Nutrients: {', '.join(nutrient_keys)}\n")
+
+    found = {term: [] for term in TEST_FOODS}
+    count = 0
+
+    def entries():
+        nonlocal count
+        for foods in iter_food_chunks(csv_file, chunk_size, jobs, ids, next_id):
+            for food_entry in foods:
+                # Show progress for first few entries
+                if count < 5:
+                    aliases = food_entry['aliases']
+                    print(f"✓ {food_entry['name']}")
+                    print(f"  Aliases: {', '.join(aliases[:5])}{'...' if len(aliases) > 5 else ''}")
+                    print()
+
+                for term, names in found.items():
+                    if len(names) < 3 and (term in food_entry['name'] or term in food_entry['aliases']):
+                        names.append(food_entry['name'])
+                count += 1
+                yield food_entry
+
+    print(f"💾 Writing {output_file}...\n")
+    write_db(output_file, nutrient_keys, entries())
+
+    print(f"\n✓ Converted {count} dishes")
     print("✅ Done!\n")
-    
+
     # Test search
     print("🧪 Testing some searches:")
-    test_foods = ['hot tea', 'tea', 'chai', 'coffee', 'lemonade']
-    
-    for search_term in test_foods:
-        found = []
-        for food in foods:
-            if search_term.lower() in food['name'] or search_term.lower() in food.get('aliases', []):
-                found.append(food['name'])
-        
-        if found:
-            print(f"  ✓ '{search_term}' found: {found[:3]}")
+    for search_term, names in found.items():
+        if names:
+            print(f"  ✓ '{search_term}' found: {names}")
         else:
             print(f"  ✗ '{search_term}' not found")
 
+
+def update_db_incremental(csv_file, output_file, chunk_size: int = 5000, jobs: int = 1) -> Dict:
+    """
+    Bring an existing database in line with the CSV, touching only rows
+    whose content changed.
+
+    Each CSV-derived entry carries a "source_hash" of its row. Entries are
+    matched to CSV rows by dish name and keep their id; new rows get ids
+    after the current maximum, so ids never shift. Aliases are generated
+    only for new or changed rows, and aliases already on an entry (e.g.
+    added by hand) are kept. Entries without a hash that match a CSV row
+    are adopted; other hand-added entries are left untouched. CSV-derived
+    entries whose row disappeared are removed.
+
+    If nothing changed the database file is not rewritten, so its mtime
+    (and anything cached from it) stays valid. Otherwise the whole file is
+    rewritten (atomically, as JSON has no in-place updates), but only the
+    changed entries are regenerated.
+
+    Args:
+        jobs: Worker processes used for alias generation
+
+    Returns:
+        Dict with 'added', 'changed' and 'removed' dish names and the
+        'unchanged' count
+    """
+    print(f"📖 Reading {csv_file} (incremental)...\n")
+
+    header = pd.read_csv(csv_file, nrows=0).columns
+    nutrient_keys = [n.key for n in NUTRIENTS if n.csv_column in header]
+
+    foods: List[Dict] = []
+    old_keys = nutrient_keys
+    if os.path.exists(output_file):
+        with open(output_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        foods = data.get('foods', [])
+        old_keys = upgrade_legacy_foods(foods, data.get('nutrient_keys'))
+
+    # Re-lay out existing vectors if the CSV brings a different nutrient set
+    layout_changed = list(old_keys) != nutrient_keys
+    if layout_changed:
+        for food in foods:
+            values = dict(zip(old_keys, food['nutrients']))
+            food['nutrients'] = [values.get(key) for key in nutrient_keys]
+
+    hashed = {}
+    unhashed = {}
+    for food in foods:
+        key = normalize_name(food['name'])
+        target = hashed if 'source_hash' in food else unhashed
+        target.setdefault(key, food)
+
+    next_id = max((food['id'] for food in foods), default=0) + 1
+    diff = {'added': [], 'changed': [], 'removed': [], 'unchanged': 0}
+    seen = set()
+    new_foods = []
+
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        for chunk in pd.read_csv(csv_file, chunksize=chunk_size):
+            names, values = chunk_values(chunk)
+            raw_names = chunk['Dish Name'].astype(str).tolist()
+            pending = []
+
+            for raw_name, name, nutrients in zip(raw_names, names, values):
+                key = normalize_name(name)
+                if key in seen:
+                    print(f"⚠ Skipping duplicate dish: {raw_name}")
+                    continue
+                seen.add(key)
+
+                existing = hashed.get(key) or unhashed.pop(key, None)
+                if existing is not None and existing.get('source_hash') == row_hash(name, nutrients):
+                    diff['unchanged'] += 1
+                    continue
+                pending.append((raw_name, name, nutrients, existing))
+
+            # Aliases only for new or changed rows, in one batch per chunk
+            aliases = create_aliases_parallel([raw_name for raw_name, _, _, _ in pending], pool, jobs)
+            for (raw_name, name, nutrients, existing), food_aliases in zip(pending, aliases):
+                if existing is None:
+                    new_foods.append(make_food_entry(next_id, name, food_aliases, nutrients))
+                    next_id += 1
+                    diff['added'].append(name)
+                    continue
+
+                kept_aliases = existing.get('aliases', [])
+                merged = kept_aliases + [a for a in food_aliases if a not in kept_aliases]
+                updated = make_food_entry(existing['id'], name, merged, nutrients)
+                for field in ('serving_size', 'serving_size_grams'):
+                    if field in existing:
+                        updated[field] = existing[field]
+                existing.clear()
+                existing.update(updated)
+                hashed[normalize_name(name)] = existing
+                diff['changed'].append(name)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    # CSV-derived entries whose row is gone
+    kept = []
+    for food in foods:
+        if 'source_hash' in food and normalize_name(food['name']) not in seen:
+            diff['removed'].append(food['name'])
+        else:
+            kept.append(food)
+
+    for label in ('added', 'changed', 'removed'):
+        names = diff[label]
+        preview = ', '.join(names[:10]) + ('...' if len(names) > 10 else '')
+        print(f"  {label.title():<10} {len(names):>6}  {preview}")
+    print(f"  {'Unchanged':<10} {diff['unchanged']:>6}\n")
+
+    if not (diff['added'] or diff['changed'] or diff['removed'] or layout_changed):
+        print("✅ Database already up to date, nothing written\n")
+        return diff
+
+    print(f"💾 Writing {output_file}...")
+    count = write_db(output_file, nutrient_keys, kept + new_foods)
+    print(f"✓ {count} foods\n")
+
+    # Keep a compiled copy in step so it doesn't fall back to JSON parsing
+    compiled_file = compiled_path_for(output_file)
+    if compiled_file.exists():
+        compile_json_database(output_file, str(compiled_file))
+        print(f"✓ Recompiled {compiled_file}\n")
+
+    print("✅ Done!\n")
+    return diff
+
+
+
 if __name__ == "__main__":
-    convert_csv_to_db(
-        csv_file="data/indian_food_nutrition.csv",
-        output_file="data/nutrition_db.json"
-    )
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Convert a nutrition CSV to the JSON food database.")
+    arg_parser.add_argument('--csv', default="data/indian_food_nutrition.csv", help="Source CSV file")
+    arg_parser.add_argument('--output', default="data/nutrition_db.json", help="Output JSON database")
+    arg_parser.add_argument('--jobs', type=int, default=1,
+                            help="Worker processes for alias generation (default: 1)")
+    arg_parser.add_argument('--chunk-size', type=int, default=5000, help="CSV rows per batch")
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help="Only update entries whose CSV rows changed, keeping ids stable")
+    arg_parser.add_argument('--renumber', action='store_true',
+                            help="Number foods from 1 instead of keeping the output file's ids "
+                                 "(logged meals then point at different foods)")
+    args = arg_parser.parse_args()
+
+    if args.incremental and args.renumber:
+        arg_parser.error("--renumber rebuilds the whole database and can't be combined with --incremental")
+
+    if args.incremental:
+        update_db_incremental(
+            csv_file=args.csv,
+            output_file=args.output,
+            chunk_size=args.chunk_size,
+            jobs=args.jobs
+        )
+    else:
+        convert_csv_to_db(
+            csv_file=args.csv,
+            output_file=args.output,
+            jobs=args.jobs,
+            chunk_size=args.chunk_size,
+            renumber=args.renumber
+        )
@@ -0,0 +1,143 @@
+import argparse
+import csv
+import sqlite3
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+from src.compiled_db import open_database
+from src.gemini_client import GeminiClient
+from src.local_parser import LocalMealParser
+from src.meal_history import DB_PATH, DEFAULT_USER, MealHistory, insert_meals, normalize_user_id
+from src.nlp_parser import PARSE_MODELS, MealParser
+from src.nutrition_calculator import NutritionCalculator
+from src.parse_cache import ParseCache
+
+
+def init_import_tables(conn: sqlite3.Connection):
+    """Tables tracking how far each import got, and which rows could not be imported."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS import_progress (
+        source TEXT PRIMARY KEY,
+        rows_done INTEGER NOT NULL,
+        updated_at TEXT
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS import_failures (
+        source TEXT,
+        row_number INTEGER,
+        description TEXT,
+        reason TEXT
+    )''')
+
+
+def read_rows(csv_file, skip):
+    """Yield (row_number, row) from the CSV, starting after `skip` data rows."""
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        yield from islice(enumerate(reader, start=1), skip, None)
+
+
+def import_meals(csv_file, db_path=DB_PATH, chunk_size=200, batch_size=20,
+                 requests_per_minute=60, max_concurrency=4, user_id=DEFAULT_USER):
+    """
+    Import free-text meal logs into the meal history.
+
+    The CSV needs `date` and `description` columns; `meal_type` is optional
+    (the parsed meal type is used when it is missing). Rows are parsed in
+    chunks with MealParser.parse_meals, scored with NutritionCalculator and
+    written to the meals table. Each chunk is committed together with the
+    import's progress, so an interrupted import resumes after the last
+    committed chunk when run again.
+
+    Args:
+        csv_file: CSV of meal logs
+        db_path: Meal history database
+        chunk_size: Rows parsed and committed together
+        batch_size: Descriptions per Gemini request
+        requests_per_minute: Gemini rate limit
+        max_concurrency: Gemini requests in flight at once
+        user_id: User the imported meals belong to
+    """
+    source = str(Path(csv_file).resolve())
+
+    history = MealHistory(db_path)
+    with history.transaction() as conn:
+        init_import_tables(conn)
+        row = conn.execute('SELECT rows_done FROM import_progress WHERE source = ?', (source,)).fetchone()
+    rows_done = row[0] if row else 0
+    if rows_done:
+        print(f"↻ Resuming {csv_file} after row {rows_done}")
+
+    db = open_database()
+    client = GeminiClient(PARSE_MODELS[0], max_concurrency=max_concurrency,
+                          requests_per_minute=requests_per_minute)
+    parser = MealParser(cache=ParseCache("parse_cache.db"), local_parser=LocalMealParser(db),
+                        client=client, database=db)
+    calculator = NutritionCalculator(db)
+
+    imported = failed = 0
+    rows = read_rows(csv_file, rows_done)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        parsed = parser.parse_meals(
+            {row_number: row['description'] for row_number, row in chunk},
+            batch_size=batch_size
+        )
+
+        parsed_rows = []
+        failures = []
+        for row_number, row in chunk:
+            parsed_meal = parsed[row_number]
+            if 'error' in parsed_meal or not parsed_meal.get('items'):
+                failures.append((source, row_number, row['description'], parsed_meal.get('error', 'no items')))
+            else:
+                parsed_rows.append((row, parsed_meal))
+
+        meals = []
+        results = calculator.calculate_meals([parsed_meal for _, parsed_meal in parsed_rows])
+        for (row, _), result in zip(parsed_rows, results):
+            meal_type = (row.get('meal_type') or '').strip() or result['meal_type']
+            meals.append((row['date'], meal_type, row['description'], result['totals'], result['items']))
+
+        # Meals and progress in one transaction: a crash never half-imports a chunk
+        with history.transaction() as conn:
+            insert_meals(conn, meals, user_id)
+            conn.executemany('INSERT INTO import_failures VALUES (?, ?, ?, ?)', failures)
+            conn.execute(
+                'INSERT OR REPLACE INTO import_progress (source, rows_done, updated_at) VALUES (?, ?, ?)',
+                (source, chunk[-1][0], datetime.now().isoformat(timespec='seconds'))
+            )
+
+        imported += len(meals)
+        failed += len(failures)
+        print(f"✓ Rows {chunk[0][0]}-{chunk[-1][0]}: {len(meals)} imported, {len(failures)} failed")
+
+    history.close()
+
+    print(f"\n✅ Imported {imported} meals ({failed} failed, see the import_failures table)")
+    for metrics in client.metrics_report():
+        print(f"   {metrics['model']}: {metrics['calls']} calls, ${metrics['cost_usd']:.4f}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Import free-text meal logs into the meal history.")
+    arg_parser.add_argument('csv_file', help="CSV with date, description and optional meal_type columns")
+    arg_parser.add_argument('--db', default=DB_PATH, help="Meal history database")
+    arg_parser.add_argument('--user', default=DEFAULT_USER, help="User the meals belong to")
+    arg_parser.add_argument('--chunk-size', type=int, default=200, help="Rows committed together")
+    arg_parser.add_argument('--batch-size', type=int, default=20, help="Descriptions per Gemini request")
+    arg_parser.add_argument('--rpm', type=float, default=60, help="Gemini requests per minute")
+    arg_parser.add_argument('--concurrency', type=int, default=4, help="Gemini requests in flight")
+    args = arg_parser.parse_args()
+
+    import_meals(
+        csv_file=args.csv_file,
+        db_path=args.db,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        requests_per_minute=args.rpm,
+        max_concurrency=args.concurrency,
+        user_id=normalize_user_id(args.user)
+    )
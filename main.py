@@ -10,9 +10,13 @@ from pathlib import Path
 # Add src directory to path
 sys.path.insert(0, str(Path(__file__).parent / 'src'))
 
-from database import NutritionDatabase
+from compiled_db import open_database
+from local_parser import LocalMealParser
 from nlp_parser import MealParser
+from parse_cache import ParseCache
 from nutrition_calculator import NutritionCalculator
+# Through the src package: the modules above report to src.tracing's tracer
+from src.tracing import configure_from_env, tracer
 
 
 class NutritionChatbot:
@@ -21,10 +25,13 @@ class NutritionChatbot:
     def __init__(self):
         print("🔧 Initializing Nutrition Chatbot...")
         
+        # NUTRIBOT_TRACE_FILE / NUTRIBOT_METRICS_PORT turn on tracing
+        configure_from_env()
+        
         try:
             # Initialize components
-            self.db = NutritionDatabase()
-            self.parser = MealParser()
+            self.db = open_database()
+            self.parser = MealParser(cache=ParseCache("parse_cache.db"), local_parser=LocalMealParser(self.db))
             self.calculator = NutritionCalculator(self.db)
             
             print("✓ All components loaded successfully!\n")
@@ -44,17 +51,22 @@ class NutritionChatbot:
         """
         print("\n⏳ Analyzing your meal...")
         
-        # Step 1: Parse the input
-        parsed_meal = self.parser.parse_meal(user_input)
-        
-        if 'error' in parsed_meal:
-            return f"❌ Error: {parsed_meal['error']}"
-        
-        # Step 2: Calculate nutrition
-        result = self.calculator.calculate_meal(parsed_meal)
-        
-        # Step 3: Format and return
-        return self.calculator.format_result(result)
+        with tracer.span('turn', source='cli') as turn:
+            # Step 1: Parse the input
+            with tracer.span('parse_meal'):
+                parsed_meal = self.parser.parse_meal(user_input)
+            
+            if 'error' in parsed_meal:
+                turn.set(type='parse_error')
+                return f"❌ Error: {parsed_meal['error']}"
+            
+            # Step 2: Calculate nutrition
+            with tracer.span('calculate_meal', items=len(parsed_meal['items'])):
+                result = self.calculator.calculate_meal(parsed_meal)
+            
+            # Step 3: Format and return
+            with tracer.span('format_result'):
+                return self.calculator.format_result(result)
     
     def run_interactive(self):
         """Run the chatbot in interactive mode."""
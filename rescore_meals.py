@@ -0,0 +1,246 @@
+import argparse
+import contextlib
+import json
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.compiled_db import open_database
+from src.meal_history import DB_PATH, MealHistory
+from src.nutrients import NUTRIENT_KEYS
+from src.nutrition_calculator import NutritionCalculator, nutrient_signature
+
+
+def food_signatures(db) -> Dict[int, str]:
+    """Fingerprint of each food's nutrients per serving, by food id."""
+    return {food['id']: nutrient_signature(db.nutrient_keys, db.nutrients[row])
+            for row, food in enumerate(db.foods)}
+
+
+def history_columns(db) -> Tuple[List[str], List[int]]:
+    """History nutrient columns the database has values for, and their index in db.nutrient_keys."""
+    columns = [key for key in db.nutrient_keys if key in NUTRIENT_KEYS]
+    return columns, [db.nutrient_keys.index(key) for key in columns]
+
+
+def remap_food_id(old_id: int, new_id: int, database='data/nutrition_db.json', db_path=DB_PATH,
+                  dry_run=False) -> Dict:
+    """
+    Move stored meal items to a food's new id after the database changed it.
+
+    For a food that was given a new id because another food shares its
+    old one (e.g. koshimbir, which had spanish rice's id 118), items
+    stored under the old id may be either food. Each meal containing the
+    old id is scored twice from its stored items, with those items as the
+    food now at the old id and as the food at the new id; the items are
+    moved when only the second reproduces the meal's stored totals. Meals
+    matching both or neither (e.g. re-scored since) are left as they are
+    and counted as ambiguous.
+
+    Run once, before rescore_meals(), on histories logged before the change.
+
+    Args:
+        old_id: Id the items were logged under
+        new_id: Id the food has now
+        database: Nutrition database (JSON or .nutridb)
+        db_path: Meal history database
+        dry_run: Count the meals that would change without writing
+
+    Returns:
+        Counts of meals checked, remapped and ambiguous
+    """
+    calculator = NutritionCalculator(open_database(database))
+    db = calculator.db
+    old_row, new_row = calculator.food_rows([old_id, new_id], db)
+    if old_row < 0 or new_row < 0:
+        raise ValueError(f"Food ids {old_id} and {new_id} must both be in {database}")
+
+    columns, column_index = history_columns(db)
+    if not columns:
+        raise ValueError(f"{database} has none of the nutrients the meal history stores")
+    history = MealHistory(db_path)
+    stats = {'meals_checked': 0, 'meals_remapped': 0, 'meals_ambiguous': 0}
+
+    with contextlib.closing(history), (history.connection() if dry_run else history.transaction()) as conn:
+        meals = conn.execute(
+            f'SELECT id, {", ".join(columns)} FROM meals '
+            f'WHERE id IN (SELECT meal_id FROM meal_items WHERE food_id = ?) ORDER BY id',
+            (old_id,)
+        ).fetchall()
+        if not meals:
+            print(f"✓ No meal items logged under food id {old_id}")
+            return stats
+        items = conn.execute(
+            'SELECT meal_id, food_id, multiplier FROM meal_items '
+            'WHERE meal_id IN (SELECT meal_id FROM meal_items WHERE food_id = ?)',
+            (old_id,)
+        ).fetchall()
+
+        ids = np.array([meal[0] for meal in meals], dtype=np.int64)
+        stored = np.array([meal[1:] for meal in meals], dtype=np.float64)
+        item_meals, food_ids, multipliers = (np.array(column) for column in zip(*items))
+        meal_index = np.searchsorted(ids, item_meals)
+        rows = calculator.food_rows(food_ids.tolist(), db)
+        # Meals with a food no longer in the database can't be checked
+        unknown = np.zeros(len(ids), dtype=bool)
+        unknown[meal_index[rows < 0]] = True
+        scored = rows >= 0
+
+        def matches(candidate_rows):
+            totals = calculator.score_meal_totals(candidate_rows[scored], multipliers[scored].astype(np.float64),
+                                                  meal_index[scored], len(ids), db)[:, column_index]
+            return ((np.abs(totals - stored) <= 1e-6) | np.isnan(stored)).all(axis=1) & ~unknown
+
+        as_new_rows = rows.copy()
+        as_new_rows[food_ids == old_id] = new_row
+        as_old, as_new = matches(rows), matches(as_new_rows)
+        remap = as_new & ~as_old
+
+        if not dry_run and remap.any():
+            conn.executemany('UPDATE meal_items SET food_id = ? WHERE meal_id = ? AND food_id = ?',
+                             [(new_id, int(meal_id), old_id) for meal_id in ids[remap]])
+            conn.executemany('INSERT INTO foods (id, name) VALUES (?, ?) '
+                             'ON CONFLICT (id) DO UPDATE SET name = excluded.name',
+                             [(old_id, db.foods[old_row]['name']), (new_id, db.foods[new_row]['name'])])
+
+    stats['meals_checked'] = len(ids)
+    stats['meals_remapped'] = int(remap.sum())
+    stats['meals_ambiguous'] = int((as_old == as_new).sum())
+    print(f"✅ {stats['meals_remapped']} of {stats['meals_checked']} meals with food id {old_id} "
+          f"{'would move' if dry_run else 'moved'} to {new_id} ({db.foods[new_row]['name']}); "
+          f"{stats['meals_ambiguous']} ambiguous, left as they are")
+    return stats
+
+
+def rescore_meals(database='data/nutrition_db.json', db_path=DB_PATH, chunk_size=20_000, dry_run=False) -> Dict:
+    """
+    Re-score logged meals after foods' nutrients changed in the nutrition database.
+
+    The history's foods table remembers a signature of each food's
+    nutrients as of the last re-score, or as of when it was first logged.
+    Foods whose signature differs from the database are the changed ones;
+    only meals containing them (found through the food_id index of
+    meal_items) are read, their totals are recomputed from the stored
+    items with NutritionCalculator.score_meal_totals, and only meals whose
+    totals actually differ are updated. Each chunk of meals is one
+    transaction, and the rollups follow through their update triggers.
+
+    Signatures are saved after the last chunk, so an interrupted run is
+    simply run again: meals it already updated no longer differ. Meals
+    containing a food that is no longer in the database are left as they
+    are.
+
+    Args:
+        database: Nutrition database (JSON or .nutridb)
+        db_path: Meal history database
+        chunk_size: Meals re-scored per transaction
+        dry_run: Count the meals that would change without writing
+
+    Returns:
+        Counts of changed foods and of meals checked, updated and skipped
+    """
+    calculator = NutritionCalculator(open_database(database))
+    db = calculator.db
+    stats = {'changed_foods': 0, 'meals_checked': 0, 'meals_updated': 0, 'meals_skipped': 0}
+
+    # History columns the database has values for; the rest are kept
+    columns, column_index = history_columns(db)
+    if not columns:
+        print(f"⚠ {database} has none of the nutrients the meal history stores, nothing to re-score")
+        return stats
+    update_sql = f'UPDATE meals SET {", ".join(f"{key} = ?" for key in columns)} WHERE id = ?'
+
+    history = MealHistory(db_path)
+    signatures = food_signatures(db)
+    with history.connection() as conn:
+        stored = conn.execute('SELECT id, signature FROM foods').fetchall()
+    changed = [food_id for food_id, signature in stored if signatures.get(food_id) != signature]
+    print(f"📖 {len(changed)} of {len(stored)} logged foods changed")
+
+    stats['changed_foods'] = len(changed)
+    if not changed:
+        history.close()
+        return stats
+
+    start = time.perf_counter()
+    with history.connection() as conn:
+        meal_ids = np.array([row[0] for row in conn.execute(
+            'SELECT DISTINCT meal_id FROM meal_items WHERE food_id IN (SELECT value FROM json_each(?)) ORDER BY meal_id',
+            (json.dumps(changed),)
+        )], dtype=np.int64)
+
+    for offset in range(0, len(meal_ids), chunk_size):
+        chunk = json.dumps(meal_ids[offset:offset + chunk_size].tolist())
+
+        # Read and write in one transaction, so no meal changes in between
+        with (history.connection() if dry_run else history.transaction()) as conn:
+            meals = conn.execute(
+                f'SELECT id, {", ".join(columns)} FROM meals WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id',
+                (chunk,)
+            ).fetchall()
+            items = conn.execute(
+                'SELECT meal_id, food_id, multiplier FROM meal_items WHERE meal_id IN (SELECT value FROM json_each(?))',
+                (chunk,)
+            ).fetchall()
+            if not meals or not items:
+                continue
+
+            ids = np.array([meal[0] for meal in meals], dtype=np.int64)
+            old_totals = np.array([meal[1:] for meal in meals], dtype=np.float64)
+            item_meals, food_ids, multipliers = (np.array(column) for column in zip(*items))
+
+            rows = calculator.food_rows(food_ids.tolist(), db)
+            meal_index = np.searchsorted(ids, item_meals)
+            # Items of meals deleted since the ids were collected
+            present = (meal_index < len(ids)) & (ids[np.minimum(meal_index, len(ids) - 1)] == item_meals)
+            unknown = np.zeros(len(ids), dtype=bool)
+            unknown[meal_index[present & (rows < 0)]] = True
+
+            scored = present & (rows >= 0)
+            totals = calculator.score_meal_totals(rows[scored], multipliers[scored].astype(np.float64),
+                                                  meal_index[scored], len(ids), db)[:, column_index]
+            differs = ((np.abs(totals - old_totals) > 1e-6) | np.isnan(old_totals)).any(axis=1) & ~unknown
+
+            updates = [(*totals[i].tolist(), int(ids[i])) for i in np.flatnonzero(differs)]
+            if not dry_run:
+                conn.executemany(update_sql, updates)
+
+        stats['meals_checked'] += len(ids)
+        stats['meals_updated'] += len(updates)
+        stats['meals_skipped'] += int(unknown.sum())
+        print(f"✓ Meals {ids[0]}-{ids[-1]}: {len(updates)} of {len(ids)} "
+              f"{'would change' if dry_run else 'updated'}")
+
+    if not dry_run:
+        with history.transaction() as conn:
+            conn.executemany('UPDATE foods SET signature = ? WHERE id = ?',
+                             [(signatures.get(food_id), food_id) for food_id in changed])
+    history.close()
+
+    print(f"\n✅ {stats['meals_updated']} of {stats['meals_checked']} affected meals "
+          f"{'would change' if dry_run else 're-scored'} in {time.perf_counter() - start:.1f}s "
+          f"({stats['meals_skipped']} skipped: food no longer in the database)")
+    return stats
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Re-score logged meals after nutrition database changes.")
+    arg_parser.add_argument('--database', default='data/nutrition_db.json', help="Nutrition database")
+    arg_parser.add_argument('--db', default=DB_PATH, help="Meal history database")
+    arg_parser.add_argument('--chunk-size', type=int, default=20_000, help="Meals re-scored per transaction")
+    arg_parser.add_argument('--dry-run', action='store_true', help="Only count the meals that would change")
+    arg_parser.add_argument('--remap', metavar='OLD:NEW',
+                            help="First move items logged under a food's old id to its new one (e.g. 118:1198)")
+    args = arg_parser.parse_args()
+
+    if args.remap:
+        old_id, new_id = (int(food_id) for food_id in args.remap.split(':'))
+        remap_food_id(old_id, new_id, database=args.database, db_path=args.db, dry_run=args.dry_run)
+
+    rescore_meals(
+        database=args.database,
+        db_path=args.db,
+        chunk_size=args.chunk_size,
+        dry_run=args.dry_run
+    )
@@ -0,0 +1,103 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from src.meal_history import DEFAULT_USER
+from src.tracing import tracer
+
+
+@contextmanager
+def _stage(timings: Dict, name: str, **attrs):
+    """Trace one stage of a turn and record its duration in `timings`."""
+    start = time.perf_counter()
+    try:
+        with tracer.span(name, **attrs) as span:
+            yield span
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def run_chat_turn(message: str, history: List[Dict], chatbot, parser, calculator, meal_history,
+                  user_id: str = DEFAULT_USER, stream: bool = True,
+                  on_chunk: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Handle one chat message: chat -> parse_meal -> calculate_meal -> log_meal.
+
+    Meals are logged to `user_id`'s history, and the message and reply are
+    appended to `history`. Each stage gets a tracer span, so calling this
+    inside a 'turn' span traces the turn stage by stage.
+
+    Args:
+        message: User's message
+        history: Conversation history (role/content dicts), updated in place
+        chatbot: NutritionChatbot
+        parser: MealParser for meals the chat call didn't parse
+        calculator: NutritionCalculator
+        meal_history: MealHistory to log meals to
+        user_id: User the meal belongs to
+        stream: Stream conversational replies (chat_stream) instead of chat
+        on_chunk: Called with the reply so far after each streamed chunk
+
+    Returns:
+        Dict with:
+            type: 'meal_analysis', 'parse_error', 'conversation' or 'error'
+            message: Chatbot's reply text
+            meal_description: Meal text that was parsed (meals only)
+            result: calculate_meal() result of the logged meal (meals only)
+            timings: Seconds spent per stage
+    """
+    timings = {}
+
+    with _stage(timings, 'chat') as span:
+        if stream:
+            response = chatbot.chat_stream(message, history)
+        else:
+            response = chatbot.chat(message, history)
+        span.set(type=response['type'])
+
+    if 'chunks' in response:
+        streamed_text = ""
+        with _stage(timings, 'stream'):
+            try:
+                for chunk in response['chunks']:
+                    streamed_text += chunk
+                    if on_chunk:
+                        on_chunk(streamed_text)
+                response['message'] = streamed_text
+            except Exception as e:
+                response = {"type": "error", "message": f"Sorry, I encountered an error: {str(e)}"}
+
+    turn = {'type': response['type'], 'message': response.get('message', ''), 'timings': timings}
+
+    if response['type'] == 'meal_analysis':
+        meal_description = response.get('meal_description', message)
+        turn['meal_description'] = meal_description
+
+        # Already parsed if the chatbot's combined call did it; if that
+        # parse named unknown foods, start on the larger model
+        with _stage(timings, 'parse_meal', source='chat' if response.get('parsed_meal') else 'parser'):
+            parsed_meal = response.get('parsed_meal') or parser.parse_meal(
+                meal_description, min_tier=1 if response.get('escalate_parse') else 0
+            )
+
+        if 'error' in parsed_meal:
+            turn['type'] = 'parse_error'
+        else:
+            with _stage(timings, 'calculate_meal', items=len(parsed_meal['items'])):
+                result = calculator.calculate_meal(parsed_meal)
+            turn['result'] = result
+
+            with _stage(timings, 'log_meal'):
+                meal_history.log_meal(
+                    date=datetime.now().strftime('%Y-%m-%d'),
+                    meal_type=result['meal_type'],
+                    description=meal_description,
+                    nutrition=result['totals'],
+                    items=result['items'],
+                    user_id=user_id
+                )
+
+    history.append({"role": "user", "content": message})
+    history.append({"role": "assistant", "content": turn['message']})
+    return turn
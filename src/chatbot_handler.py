@@ -1,26 +1,73 @@
-import os
 import json
-from typing import Dict, List
-import google.generativeai as genai
+from typing import Dict, Iterator, List, Optional
 from dotenv import load_dotenv
+from src.gemini_client import JSON_OUTPUT, GeminiClient
+from src.llm_backends import GeminiBackend
+from src.nlp_parser import PARSE_RULES, strip_code_fence, validate_parsed_meal
+from src.nutrition_calculator import find_unresolved_foods
+from src.tracing import tracer
 
 load_dotenv()
 
+# The meal form of the combined prompts
+_MEAL_FORM = """If the user describes food they ate, analyze the meal:
+{
+  "type": "meal_analysis",
+  "message": "short friendly reply, e.g. Perfect! Let me analyze your lunch 🍽️",
+  "meal_description": "exact text of what they ate",
+  "meal": {
+    "meal_type": "breakfast|lunch|dinner|snack",
+    "items": [
+      {"food": "food name in lowercase", "quantity": numeric_value, "unit": "pieces|bowl|serving|glass|grams|cup"}
+    ]
+  }
+}
+
+Rules for "meal":
+""" + PARSE_RULES
+
+_ALWAYS_MEAL = """
+IMPORTANT: When user mentions eating something (had, ate, eating, consumed, etc.), ALWAYS use the meal_analysis form.
+"""
+
+# Replaces the chat prompt's "How to respond" section in combined mode
+COMBINED_INSTRUCTIONS = "Respond with ONLY a JSON object, in one of these two forms.\n\n" + _MEAL_FORM + """
+For anything else (greetings, questions, thanks), reply conversationally:
+{"type": "conversation", "message": "your reply"}
+""" + _ALWAYS_MEAL
+
+# Combined mode when streaming: conversational replies stay plain text so
+# they can be shown as they arrive
+COMBINED_STREAM_INSTRUCTIONS = _MEAL_FORM + """
+For anything else (greetings, questions, thanks), reply conversationally in plain text, not JSON.
+""" + _ALWAYS_MEAL
 
 class NutritionChatbot:
     """Conversational chatbot that handles both casual chat and nutrition analysis."""
     
-    def __init__(self, api_key: str = None):
-        self.api_key = api_key or os.getenv('GEMINI_API_KEY')
-        
-        if not self.api_key:
-            raise ValueError("Gemini API key not found.")
-        
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+    def __init__(self, api_key: str = None, client: Optional[GeminiClient] = None,
+                 combined: bool = False, model_name: Optional[str] = None, database=None):
+        """
+        Args:
+            api_key: Gemini API key. If None, loads from GEMINI_API_KEY env variable.
+                Not needed when a client is given.
+            client: GeminiClient to send requests through (timeouts, retries,
+                concurrency limit). Defaults to one for gemini-2.5-pro.
+            combined: Classify and parse in one request. Meal responses then
+                carry the parsed meal under 'parsed_meal', so no separate
+                MealParser call is needed.
+            model_name: Model to chat with (defaults to the client's model)
+            database: Nutrition database; if given, a combined parse naming
+                foods it can't resolve is dropped and the response is marked
+                'escalate_parse', so the caller re-parses on a larger model
+        """
+        self.combined = combined
+        self.model_name = model_name
+        self.database = database
+        self.client = client or GeminiClient(model_name or 'gemini-2.5-pro', backend=GeminiBackend(api_key))
         
-        # System prompt for the chatbot personality
-        self.system_prompt = """You are NutriBot, a friendly and knowledgeable nutrition assistant chatbot. 
+        # Personality, shared by the chat and combined prompts
+        self.persona_prompt = """You are NutriBot, a friendly and knowledgeable nutrition assistant chatbot. 
 
 Your personality:
 - Warm, encouraging, and supportive
@@ -33,7 +80,10 @@ Your capabilities:
 1. CASUAL CONVERSATION: Greet users, answer questions about nutrition, give tips, be friendly
 2. MEAL ANALYSIS: When user describes what they ate, identify it and respond that you'll analyze it
 
-How to respond:
+"""
+        
+        # System prompt for the chatbot personality
+        self.system_prompt = self.persona_prompt + """How to respond:
 - If user greets (hi, hello, hey): Greet back warmly and introduce yourself
 - If user asks general questions: Answer briefly and helpfully
 - If user describes a MEAL they ate: Respond in this EXACT format:
@@ -99,11 +149,104 @@ IMPORTANT: When user mentions eating something (had, ate, eating, consumed, etc.
         Returns:
             Dict with response and type
         """
-        if conversation_history is None:
-            conversation_history = []
+        quick_response = self._quick_response(user_message)
+        if quick_response:
+            return quick_response
+        
+        if self.combined:
+            prompt = self._build_context(user_message, conversation_history, COMBINED_INSTRUCTIONS)
+            try:
+                response_text = self.client.generate(prompt, generation_config=JSON_OUTPUT,
+                                                     model_name=self.model_name)
+            except Exception as e:
+                return self._error_response(e)
+            return self._interpret_combined_response(user_message, response_text)
+        
+        try:
+            response_text = self.client.generate(self._build_context(user_message, conversation_history),
+                                                 model_name=self.model_name)
+        except Exception as e:
+            return self._error_response(e)
+        
+        return self._interpret_response(user_message, response_text)
+    
+    async def chat_async(self, user_message: str, conversation_history: List[Dict] = None) -> Dict:
+        """Async version of chat(); returns the same dict."""
+        quick_response = self._quick_response(user_message)
+        if quick_response:
+            return quick_response
         
+        if self.combined:
+            prompt = self._build_context(user_message, conversation_history, COMBINED_INSTRUCTIONS)
+            try:
+                response_text = await self.client.generate_async(prompt, generation_config=JSON_OUTPUT,
+                                                                 model_name=self.model_name)
+            except Exception as e:
+                return self._error_response(e)
+            return self._interpret_combined_response(user_message, response_text)
+        
+        try:
+            response_text = await self.client.generate_async(self._build_context(user_message, conversation_history),
+                                                             model_name=self.model_name)
+        except Exception as e:
+            return self._error_response(e)
+        
+        return self._interpret_response(user_message, response_text)
+    
+    def chat_stream(self, user_message: str, conversation_history: List[Dict] = None) -> Dict:
+        """
+        Like chat(), but conversational replies are streamed.
+        
+        Returns the same dict as chat(), except that a conversational reply
+        comes with a 'chunks' generator of text instead of a 'message'; the
+        caller renders the chunks as they arrive. The call returns as soon
+        as the first chunk shows whether the reply is a meal (JSON) or
+        conversation.
+        """
+        quick_response = self._quick_response(user_message)
+        if quick_response:
+            return quick_response
+        
+        instructions = COMBINED_STREAM_INSTRUCTIONS if self.combined else None
+        prompt = self._build_context(user_message, conversation_history, instructions)
+        
+        try:
+            chunks = self.client.generate_stream(prompt, model_name=self.model_name)
+            head = ''
+            for chunk in chunks:
+                head += chunk
+                if head.strip():
+                    break
+        except Exception as e:
+            return self._error_response(e)
+        
+        # Meal replies are JSON: collect them whole and interpret as usual
+        if head.lstrip().startswith(('{', '```')):
+            try:
+                response_text = (head + ''.join(chunks)).strip()
+            except Exception as e:
+                return self._error_response(e)
+            if self.combined:
+                return self._interpret_combined_response(user_message, response_text)
+            return self._interpret_response(user_message, response_text)
+        
+        return {
+            "type": "conversation",
+            "chunks": self._relay(head.lstrip(), chunks),
+            "raw_response": ""
+        }
+    
+    def _relay(self, head: str, chunks: Iterator[str]) -> Iterator[str]:
+        """Yield the already received head, then the rest of the stream."""
+        yield head
+        yield from chunks
+    
+    def _quick_response(self, user_message: str) -> Optional[Dict]:
+        """Answer without an API call when the message is clearly a meal."""
         # Quick intent check first (no API call)
-        intent = self.classify_intent(user_message)
+        with tracer.span('classify_intent') as span:
+            intent = self.classify_intent(user_message)
+            span.set(intent=intent['type'])
         
         # If it's clearly a meal, skip the chat API call and go straight to parsing
         if intent['type'] == 'potential_meal':
@@ -113,9 +256,24 @@ IMPORTANT: When user mentions eating something (had, ate, eating, consumed, etc.
                 "meal_description": user_message,
                 "raw_response": ""
             }
+        return None
+    
+    def _build_context(self, user_message: str, conversation_history: List[Dict] = None,
+                       instructions: Optional[str] = None) -> str:
+        """
+        Build the conversation prompt from the system prompt and recent history.
+        
+        Args:
+            instructions: Replaces the system prompt's "How to respond"
+                section (e.g. COMBINED_INSTRUCTIONS)
+        """
+        if conversation_history is None:
+            conversation_history = []
         
-        # Otherwise, do regular conversation
-        context = self.system_prompt + "\n\nConversation:\n"
+        if instructions:
+            context = self.persona_prompt + instructions + "\n\nConversation:\n"
+        else:
+            context = self.system_prompt + "\n\nConversation:\n"
         
         for msg in conversation_history[-5:]:
             role = msg.get('role', 'user')
@@ -123,41 +281,90 @@ IMPORTANT: When user mentions eating something (had, ate, eating, consumed, etc.
             context += f"{role.title()}: {content}\n"
         
         context += f"User: {user_message}\nYou:"
+        return context
+    
+    def _interpret_response(self, user_message: str, response_text: str) -> Dict:
+        """Turn Gemini's reply into a meal_analysis or conversation response."""
+        # Try to parse as JSON (for meal analysis)
+        if '{' in response_text and '"type": "meal_analysis"' in response_text:
+            json_start = response_text.index('{')
+            json_end = response_text.rindex('}') + 1
+            json_str = response_text[json_start:json_end]
+            
+            try:
+                parsed = json.loads(json_str)
+                return {
+                    "type": "meal_analysis",
+                    "message": parsed.get("message", "Let me analyze that!"),
+                    "meal_description": parsed.get("meal_description", user_message),
+                    "raw_response": response_text
+                }
+            except json.JSONDecodeError:
+                pass
         
+        # Regular conversation response
+        return {
+            "type": "conversation",
+            "message": response_text,
+            "raw_response": response_text
+        }
+    
+    def _interpret_combined_response(self, user_message: str, response_text: str) -> Dict:
+        """Turn a combined-mode JSON reply into a chat response."""
         try:
-            response = self.model.generate_content(context)
-            response_text = response.text.strip()
-            
-            # Try to parse as JSON (for meal analysis)
-            if '{' in response_text and '"type": "meal_analysis"' in response_text:
-                json_start = response_text.index('{')
-                json_end = response_text.rindex('}') + 1
-                json_str = response_text[json_start:json_end]
-                
-                try:
-                    parsed = json.loads(json_str)
-                    return {
-                        "type": "meal_analysis",
-                        "message": parsed.get("message", "Let me analyze that!"),
-                        "meal_description": parsed.get("meal_description", user_message),
-                        "raw_response": response_text
-                    }
-                except json.JSONDecodeError:
-                    pass
-            
-            # Regular conversation response
-            return {
-                "type": "conversation",
-                "message": response_text,
+            # Streamed replies are requested without JSON mode and may be fenced
+            parsed = json.loads(strip_code_fence(response_text))
+        except json.JSONDecodeError:
+            # Not JSON after all: treat it like a regular chat reply
+            return self._interpret_fallback(user_message, response_text)
+        
+        if not isinstance(parsed, dict):
+            return self._interpret_fallback(user_message, response_text)
+        
+        if parsed.get('type') == 'meal_analysis':
+            response = {
+                "type": "meal_analysis",
+                "message": parsed.get("message", "Let me analyze that!"),
+                "meal_description": parsed.get("meal_description", user_message),
                 "raw_response": response_text
             }
-            
-        except Exception as e:
-            return {
-                "type": "error",
-                "message": f"Sorry, I encountered an error: {str(e)}",
-                "raw_response": ""
-            }
+            # Without a usable parse the caller falls back to MealParser
+            meal = parsed.get('meal')
+            try:
+                validate_parsed_meal(meal)
+            except ValueError:
+                meal = None
+            if meal is not None and meal['items']:
+                if self.database is not None and find_unresolved_foods(self.database, meal):
+                    response['escalate_parse'] = True
+                    self.client.record_escalation(self.model_name or self.client.model_name)
+                else:
+                    response['parsed_meal'] = meal
+            else:
+                # The caller's MealParser call makes it a second request
+                tracer.count('combined_parse_misses')
+            return response
+        
+        return {
+            "type": "conversation",
+            "message": parsed.get("message", response_text),
+            "raw_response": response_text
+        }
+    
+    def _interpret_fallback(self, user_message: str, response_text: str) -> Dict:
+        """Interpret a combined-mode reply that isn't a JSON object like a regular chat reply."""
+        response = self._interpret_response(user_message, response_text)
+        if response['type'] == 'meal_analysis':
+            tracer.count('combined_parse_misses')
+        return response
+    
+    def _error_response(self, error: Exception) -> Dict:
+        """Response shown when the Gemini call failed."""
+        return {
+            "type": "error",
+            "message": f"Sorry, I encountered an error: {str(error)}",
+            "raw_response": ""
+        }
     
     def generate_nutrition_response(self, result: Dict) -> str:
         """
@@ -0,0 +1,440 @@
+"""
+Compiled, memory-mappable nutrition database format (.nutridb).
+
+Layout (little endian, all offsets absolute):
+
+    header      magic, version, counts and section offsets
+    columns     (name_off, name_len, flags) per numeric column; food fields
+                first, then the nutrient vector (FLAG_NUTRIENT)
+    foods       (id, name_off, name_len, serving_off, serving_len,
+                 alias_start, alias_count) per food
+    aliases     (off, len) per alias
+    values      n_foods x n_columns float64 block, row per food
+    slots       open-addressing hash table of normalized name/alias ->
+                (key_off, key_len, food_position + 1), 0 marks an empty slot
+    strings     UTF-8 string table referenced by the sections above
+
+Opening a file only reads the header; foods are decoded on demand, and
+pages are shared between every process mapping the same file.
+"""
+
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.database import NutritionDatabase, build_name_index
+from src.fuzzy_matcher import FuzzyMatcher
+from src.search_index import FoodSearchIndex, normalize_name
+
+MAGIC = b'NUTRIDB\x00'
+VERSION = 2
+COMPILED_SUFFIX = '.nutridb'
+
+_HEADER = struct.Struct('<8sIIII6Q')
+_COLUMN = struct.Struct('<III')
+_FOOD = struct.Struct('<7I')
+_ALIAS = struct.Struct('<II')
+_SLOT = struct.Struct('<III')
+_VALUE_SIZE = 8
+
+FLAG_INT = 1
+FLAG_NUTRIENT = 2
+
+# Fields stored outside the numeric column block
+_NON_COLUMN_FIELDS = ('id', 'name', 'aliases', 'serving_size', 'nutrients')
+
+
+def _hash_slot(key: bytes, n_slots: int) -> int:
+    """Stable hash of an encoded key into the slot table."""
+    return zlib.crc32(key) & (n_slots - 1)
+
+
+class _StringTable:
+    """Deduplicating UTF-8 string table builder."""
+
+    def __init__(self):
+        self.blob = bytearray()
+        self._offsets: Dict[str, int] = {}
+
+    def add(self, text: str) -> Tuple[int, int]:
+        encoded = text.encode('utf-8')
+        if text not in self._offsets:
+            self._offsets[text] = len(self.blob)
+            self.blob.extend(encoded)
+        return self._offsets[text], len(encoded)
+
+
+def compile_database(foods: List[Dict], nutrient_keys: List[str], output_file: str) -> Dict:
+    """
+    Write foods to the compiled .nutridb format.
+
+    Args:
+        foods: Food dicts as held by NutritionDatabase (with "nutrients" vectors)
+        nutrient_keys: Nutrient key of each vector position
+        output_file: Path of the .nutridb file to write
+
+    Returns:
+        Dict with counts and the output size in bytes
+    """
+    # Numeric food fields (e.g. serving_size_grams) in first-seen order
+    food_columns: List[str] = []
+    for food in foods:
+        for key, value in food.items():
+            if key not in _NON_COLUMN_FIELDS and key not in food_columns and isinstance(value, (int, float)):
+                food_columns.append(key)
+    int_columns = {
+        column for column in food_columns
+        if all(isinstance(food.get(column, 0), int) for food in foods)
+    }
+
+    strings = _StringTable()
+    column_block = bytearray()
+    for column in food_columns:
+        column_block += _COLUMN.pack(*strings.add(column), FLAG_INT if column in int_columns else 0)
+    for key in nutrient_keys:
+        column_block += _COLUMN.pack(*strings.add(key), FLAG_NUTRIENT)
+    n_columns = len(food_columns) + len(nutrient_keys)
+
+    food_block = bytearray()
+    alias_block = bytearray()
+    value_block = bytearray()
+    alias_count = 0
+    nan = float('nan')
+    for food in foods:
+        aliases = food.get('aliases', [])
+        food_block += _FOOD.pack(
+            food['id'],
+            *strings.add(food['name']),
+            *strings.add(food.get('serving_size', '')),
+            alias_count,
+            len(aliases)
+        )
+        for alias in aliases:
+            alias_block += _ALIAS.pack(*strings.add(alias))
+        alias_count += len(aliases)
+        value_block += struct.pack(
+            f'<{n_columns}d',
+            *[float(food.get(column, nan)) for column in food_columns],
+            *[float(value or 0.0) for value in food['nutrients']]
+        )
+
+    # Name index: same resolution rules as NutritionDatabase.find_food
+    name_index, _ = build_name_index(foods)
+    positions = {id(food): position for position, food in enumerate(foods)}
+    n_slots = 1
+    while n_slots < 2 * max(len(name_index), 1):
+        n_slots *= 2
+    slots = [None] * n_slots
+    for key, food in name_index.items():
+        encoded = key.encode('utf-8')
+        slot = _hash_slot(encoded, n_slots)
+        while slots[slot] is not None:
+            slot = (slot + 1) & (n_slots - 1)
+        slots[slot] = (*strings.add(key), positions[id(food)] + 1)
+    slot_block = bytearray()
+    for entry in slots:
+        slot_block += _SLOT.pack(*(entry or (0, 0, 0)))
+
+    # Section offsets; values are padded to 8 bytes for a zero-copy float view
+    columns_off = _HEADER.size
+    foods_off = columns_off + len(column_block)
+    aliases_off = foods_off + len(food_block)
+    values_off = aliases_off + len(alias_block)
+    padding = -values_off % _VALUE_SIZE
+    values_off += padding
+    slots_off = values_off + len(value_block)
+    strings_off = slots_off + len(slot_block)
+
+    header = _HEADER.pack(
+        MAGIC, VERSION, len(foods), n_columns, n_slots,
+        columns_off, foods_off, aliases_off, values_off, slots_off, strings_off
+    )
+
+    with open(output_file, 'wb') as f:
+        f.write(header)
+        f.write(column_block)
+        f.write(food_block)
+        f.write(alias_block)
+        f.write(b'\x00' * padding)
+        f.write(value_block)
+        f.write(slot_block)
+        f.write(strings.blob)
+
+    return {
+        'foods': len(foods),
+        'aliases': alias_count,
+        'nutrients': len(nutrient_keys),
+        'names': len(name_index),
+        'bytes': strings_off + len(strings.blob)
+    }
+
+
+class CompiledNutritionDatabase:
+    """
+    Read-only nutrition database backed by a memory-mapped .nutridb file.
+
+    Offers the same query methods as NutritionDatabase. find_food() reads
+    the on-disk hash index directly; search and fuzzy matching build their
+    in-memory indexes the first time they are used.
+    """
+
+    def __init__(self, db_path: str = "data/nutrition_db.nutridb"):
+        self.db_path = Path(db_path)
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._values: Optional[memoryview] = None
+        self._nutrients: Optional[np.ndarray] = None
+        self._food_cache: Dict[int, Dict] = {}
+        self._rows: Dict[int, int] = {}
+        self._foods: Optional[List[Dict]] = None
+        self.n_foods = 0
+        self.columns: List[str] = []
+        self.nutrient_keys: List[str] = []
+        self._int_columns = set()
+        self.load_database()
+
+    def load_database(self):
+        """Map the compiled database file and read its header."""
+        self.close()
+        try:
+            self._file = open(self.db_path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            print(f"✗ Compiled database file not found or empty: {self.db_path}")
+            self.close()
+            return
+
+        (magic, version, self.n_foods, n_columns, self._n_slots,
+         columns_off, self._foods_off, self._aliases_off, values_off,
+         self._slots_off, self._strings_off) = _HEADER.unpack_from(self._mmap, 0)
+
+        if magic != MAGIC or version != VERSION:
+            print(f"✗ Not a compiled nutrition database (v{VERSION}): {self.db_path}")
+            self.close()
+            return
+
+        self.columns = []
+        self.nutrient_keys = []
+        self._int_columns = set()
+        for i in range(n_columns):
+            name_off, name_len, flags = _COLUMN.unpack_from(self._mmap, columns_off + i * _COLUMN.size)
+            column = self._string(name_off, name_len)
+            if flags & FLAG_NUTRIENT:
+                self.nutrient_keys.append(column)
+                continue
+            self.columns.append(column)
+            if flags & FLAG_INT:
+                self._int_columns.add(column)
+
+        values_end = values_off + self.n_foods * n_columns * _VALUE_SIZE
+        self._values = memoryview(self._mmap)[values_off:values_end].cast('d')
+        self.build_index()
+        print(f"✓ Mapped {self.n_foods} foods from compiled database")
+
+    def build_index(self):
+        """Drop lazily built structures so they are rebuilt from the file."""
+        self._food_cache = {}
+        self._rows = {}
+        self._foods = None
+        self._nutrients = None
+        self._name_index: Optional[Dict[str, Dict]] = None
+        self._collisions: Dict[str, List[Dict]] = {}
+        self._search_index: Optional[FoodSearchIndex] = None
+        self._fuzzy_matcher: Optional[FuzzyMatcher] = None
+
+    def close(self):
+        """
+        Release the memory map. If nutrient arrays handed out earlier are
+        still referenced, the mapping stays alive until they are dropped.
+        """
+        self._nutrients = None
+        try:
+            if self._values is not None:
+                self._values.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            pass
+        self._values = None
+        self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.n_foods = 0
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings_off + offset
+        return self._mmap[start:start + length].decode('utf-8')
+
+    def get_food(self, position: int) -> Dict:
+        """Decode the food stored at a position (cached)."""
+        food = self._food_cache.get(position)
+        if food is not None:
+            return food
+
+        (food_id, name_off, name_len, serving_off, serving_len,
+         alias_start, alias_count) = _FOOD.unpack_from(self._mmap, self._foods_off + position * _FOOD.size)
+
+        aliases = []
+        for i in range(alias_start, alias_start + alias_count):
+            aliases.append(self._string(*_ALIAS.unpack_from(self._mmap, self._aliases_off + i * _ALIAS.size)))
+
+        food = {
+            'id': food_id,
+            'name': self._string(name_off, name_len),
+            'aliases': aliases,
+            'serving_size': self._string(serving_off, serving_len)
+        }
+        row = position * (len(self.columns) + len(self.nutrient_keys))
+        for i, column in enumerate(self.columns):
+            value = self._values[row + i]
+            if value != value:  # NaN marks a missing field
+                continue
+            food[column] = int(value) if column in self._int_columns else value
+        start = row + len(self.columns)
+        food['nutrients'] = self._values[start:start + len(self.nutrient_keys)].tolist()
+
+        self._food_cache[position] = food
+        self._rows[id(food)] = position
+        return food
+
+    @property
+    def foods(self) -> List[Dict]:
+        """All foods, decoded on first access."""
+        if self._foods is None:
+            self._foods = [self.get_food(position) for position in range(self.n_foods)]
+        return self._foods
+
+    @property
+    def nutrients(self) -> np.ndarray:
+        """
+        N x K float array of nutrient_keys: a zero-copy view of the mapped
+        value block, so it is shared between processes.
+        """
+        if self._nutrients is None:
+            n_columns = len(self.columns) + len(self.nutrient_keys)
+            if self._values is None:
+                return np.zeros((0, len(self.nutrient_keys)))
+            values = np.frombuffer(self._values, dtype=np.float64).reshape(self.n_foods, n_columns)
+            self._nutrients = values[:, len(self.columns):]
+        return self._nutrients
+
+    def row_of(self, food: Dict) -> int:
+        """Get the nutrient matrix row of a food returned by this database."""
+        return self._rows[id(food)]
+
+    def get_nutrients(self, food: Dict) -> Dict[str, float]:
+        """Get a food's nutrients per serving as a key -> value dict."""
+        return dict(zip(self.nutrient_keys, self.nutrients[self.row_of(food)].tolist()))
+
+    def _ensure_name_index(self):
+        if self._name_index is None:
+            self._name_index, self._collisions = build_name_index(self.foods)
+
+    def find_food(self, food_name: str) -> Optional[Dict]:
+        """
+        Find a food item by name or alias using the on-disk hash index.
+        Returns the food dict if found, None otherwise.
+        """
+        if self._mmap is None:
+            return None
+
+        key = normalize_name(food_name).encode('utf-8')
+        mask = self._n_slots - 1
+        slot = _hash_slot(key, self._n_slots)
+        while True:
+            key_off, key_len, position = _SLOT.unpack_from(self._mmap, self._slots_off + slot * _SLOT.size)
+            if position == 0:
+                return None
+            if key_len == len(key):
+                start = self._strings_off + key_off
+                if self._mmap[start:start + key_len] == key:
+                    return self.get_food(position - 1)
+            slot = (slot + 1) & mask
+
+    def find_food_fuzzy(self, food_name: str, min_confidence: float = 0.75) -> Optional[Tuple[Dict, float]]:
+        """Find a food tolerating spelling mistakes (see NutritionDatabase.find_food_fuzzy)."""
+        food = self.find_food(food_name)
+        if food:
+            return food, 1.0
+        if self._fuzzy_matcher is None:
+            self._ensure_name_index()
+            self._fuzzy_matcher = FuzzyMatcher(self._name_index)
+        return self._fuzzy_matcher.match(normalize_name(food_name), min_confidence)
+
+    def find_food_candidates(self, food_name: str) -> List[Dict]:
+        """Get every food matching a name or alias, in resolution order."""
+        self._ensure_name_index()
+        key = normalize_name(food_name)
+        if key in self._collisions:
+            return list(self._collisions[key])
+        food = self._name_index.get(key)
+        return [food] if food else []
+
+    def get_ambiguous_names(self) -> Dict[str, List[str]]:
+        """Get names/aliases claimed by several foods, mapped to the foods in resolution order."""
+        self._ensure_name_index()
+        return {key: [food['name'] for food in foods] for key, foods in self._collisions.items()}
+
+    def get_all_food_names(self) -> List[str]:
+        """Get list of all food names and aliases."""
+        names = []
+        for food in self.foods:
+            names.append(food['name'])
+            names.extend(food['aliases'])
+        return names
+
+    def search_food(self, query: str, limit: Optional[int] = None) -> List[Dict]:
+        """Search for foods containing the query string, ranked best first."""
+        if self._search_index is None:
+            self._search_index = FoodSearchIndex(self.foods)
+        return self._search_index.search(query, limit)
+
+
+def compiled_path_for(json_path: str) -> Path:
+    """Get the .nutridb path that sits next to a JSON database."""
+    return Path(json_path).with_suffix(COMPILED_SUFFIX)
+
+
+def open_database(db_path: str = "data/nutrition_db.json"):
+    """
+    Open the nutrition database, preferring a compiled copy.
+
+    A .nutridb path is opened directly. For a JSON path, the compiled
+    sibling (same name, .nutridb suffix) is used when it exists and is at
+    least as new as the JSON file; otherwise the JSON is parsed.
+    """
+    path = Path(db_path)
+    if path.suffix == COMPILED_SUFFIX:
+        return CompiledNutritionDatabase(str(path))
+
+    compiled = compiled_path_for(db_path)
+    try:
+        if compiled.stat().st_mtime >= path.stat().st_mtime:
+            return CompiledNutritionDatabase(str(compiled))
+    except FileNotFoundError:
+        pass
+    return NutritionDatabase(str(path))
+
+
+def compile_json_database(json_file: str, output_file: Optional[str] = None) -> Dict:
+    """
+    Convert a JSON nutrition database to the compiled format.
+
+    Args:
+        json_file: Path to nutrition_db.json style file
+        output_file: Output path (defaults to the .nutridb sibling)
+    """
+    output_file = output_file or str(compiled_path_for(json_file))
+    db = NutritionDatabase(json_file)
+
+    # Write to a temp file and swap, so readers never map a partial file
+    tmp_file = f"{output_file}.tmp"
+    stats = compile_database(db.foods, db.nutrient_keys, tmp_file)
+    os.replace(tmp_file, output_file)
+    return stats
@@ -1,6 +1,88 @@
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
+import numpy as np
+from src.search_index import FoodSearchIndex, normalize_name
+from src.fuzzy_matcher import FuzzyMatcher
+from src.nutrients import NUTRIENT_KEYS, order_nutrient_keys
+
+
+def upgrade_legacy_foods(foods: List[Dict], nutrient_keys: Optional[List[str]] = None) -> List[str]:
+    """
+    Convert foods with one field per nutrient ("calories": 70, ...) to the
+    vector layout ("nutrients": [70, ...]) in place.
+    
+    Foods without an "id" (e.g. hand-added ones) are numbered after the
+    largest id, in file order, since meal history stores food ids.
+    
+    Args:
+        foods: Food dicts; ones that already have a vector are left alone
+        nutrient_keys: Vector layout to use (default: every known
+            nutrient field found in the foods)
+    
+    Returns:
+        The nutrient keys the vectors are aligned to
+    """
+    if nutrient_keys is None:
+        nutrient_keys = order_nutrient_keys(
+            key for food in foods for key in food if key in NUTRIENT_KEYS
+        )
+    for food in foods:
+        if 'nutrients' not in food:
+            food['nutrients'] = [food.pop(key, None) for key in nutrient_keys]
+    
+    missing_ids = [food for food in foods if food.get('id') is None]
+    if missing_ids:
+        next_id = max((food['id'] for food in foods if food.get('id') is not None), default=0) + 1
+        for food_id, food in enumerate(missing_ids, start=next_id):
+            food['id'] = food_id
+        print(f"⚠ {len(missing_ids)} foods had no id and were numbered from {next_id} "
+              f"(add ids to the file to keep them fixed)")
+    return nutrient_keys
+
+
+def build_nutrient_matrix(foods: List[Dict], nutrient_keys: List[str]) -> np.ndarray:
+    """Build an N x K float array from each food's nutrient vector (missing values are 0)."""
+    matrix = np.zeros((len(foods), len(nutrient_keys)), dtype=np.float64)
+    for row, food in enumerate(foods):
+        matrix[row] = [value or 0.0 for value in food['nutrients']]
+    return matrix
+
+
+def build_name_index(foods: List[Dict]) -> Tuple[Dict[str, Dict], Dict[str, List[Dict]]]:
+    """
+    Map every normalized name and alias to the food it resolves to.
+    
+    Resolution order when several foods claim the same key:
+    1. A food whose main name matches beats any alias match
+    2. Among equal-rank matches, the food listed first wins
+    
+    Returns:
+        (key -> winning food, key -> all matching foods in resolution
+        order, for keys claimed by more than one food)
+    """
+    ranked: Dict[str, List[Tuple[int, int, Dict]]] = {}
+    
+    for position, food in enumerate(foods):
+        keys = [(normalize_name(food['name']), 0)]
+        keys.extend((normalize_name(alias), 1) for alias in food.get('aliases', []))
+        
+        seen = set()
+        for key, rank in keys:
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            ranked.setdefault(key, []).append((rank, position, food))
+    
+    name_index = {}
+    collisions = {}
+    for key, entries in ranked.items():
+        if len(entries) > 1:
+            entries.sort(key=lambda entry: (entry[0], entry[1]))
+            collisions[key] = [food for _, _, food in entries]
+        name_index[key] = entries[0][2]
+    
+    return name_index, collisions
 
 
 class NutritionDatabase:
@@ -9,14 +91,37 @@ class NutritionDatabase:
     def __init__(self, db_path: str = "data/nutrition_db.json"):
         self.db_path = Path(db_path)
         self.foods: List[Dict] = []
+        
+        # Nutrients stored for every food; each food's "nutrients" vector
+        # and each row of self.nutrients follow this order
+        self.nutrient_keys: List[str] = []
+        
+        # Normalized name/alias -> winning food, plus every candidate for
+        # keys that more than one food claims (see build_index)
+        self._name_index: Dict[str, Dict] = {}
+        self._collisions: Dict[str, List[Dict]] = {}
+        self._search_index: Optional[FoodSearchIndex] = None
+        self._fuzzy_matcher: Optional[FuzzyMatcher] = None
+        
+        # Columnar copy of the nutrients: row i holds the vector of foods[i]
+        self.nutrients = np.zeros((0, 0))
+        self._rows: Dict[int, int] = {}
+        
         self.load_database()
     
     def load_database(self):
-        """Load the nutrition database from JSON file."""
+        """
+        Load the nutrition database from JSON file.
+        
+        Files list their nutrients once in "nutrient_keys" and store a
+        "nutrients" vector per food. Foods with one field per nutrient
+        (older files, hand-added entries) are converted on load.
+        """
         try:
             with open(self.db_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 self.foods = data.get('foods', [])
+            self.nutrient_keys = upgrade_legacy_foods(self.foods, data.get('nutrient_keys'))
             print(f"✓ Loaded {len(self.foods)} foods from database")
         except FileNotFoundError:
             print(f"✗ Database file not found: {self.db_path}")
@@ -24,26 +129,75 @@ class NutritionDatabase:
         except json.JSONDecodeError:
             print(f"✗ Invalid JSON in database file: {self.db_path}")
             self.foods = []
+        
+        self.build_index()
+    
+    def build_index(self):
+        """
+        Build the normalized name -> food lookup index, the substring
+        search index, the typo-tolerant matcher and the nutrient matrix.
+        
+        Must be called again whenever self.foods is modified.
+        See build_name_index() for how colliding names are resolved.
+        """
+        self._name_index, self._collisions = build_name_index(self.foods)
+        
+        self._search_index = FoodSearchIndex(self.foods)
+        self._fuzzy_matcher = FuzzyMatcher(self._name_index)
+        
+        self.nutrients = build_nutrient_matrix(self.foods, self.nutrient_keys)
+        self._rows = {id(food): row for row, food in enumerate(self.foods)}
+        
+        if self._collisions:
+            print(f"⚠ {len(self._collisions)} names/aliases match more than one food "
+                  f"(names win over aliases, then file order)")
     
     def find_food(self, food_name: str) -> Optional[Dict]:
         """
         Find a food item by name or alias.
         Returns the food dict if found, None otherwise.
         """
-        food_name_lower = food_name.lower().strip()
+        return self._name_index.get(normalize_name(food_name))
+    
+    def row_of(self, food: Dict) -> int:
+        """Get the nutrient matrix row of a food returned by this database."""
+        return self._rows[id(food)]
+    
+    def get_nutrients(self, food: Dict) -> Dict[str, float]:
+        """Get a food's nutrients per serving as a key -> value dict."""
+        return dict(zip(self.nutrient_keys, self.nutrients[self.row_of(food)].tolist()))
+    
+    def find_food_fuzzy(self, food_name: str, min_confidence: float = 0.75) -> Optional[Tuple[Dict, float]]:
+        """
+        Find a food by name or alias, tolerating small spelling mistakes.
         
-        for food in self.foods:
-            # Check exact name match
-            if food['name'].lower() == food_name_lower:
-                return food
+        Args:
+            food_name: Food name as typed (e.g. "chapatti", "panner tikka")
+            min_confidence: Minimum match confidence between 0 and 1
             
-            # Check aliases
-            if 'aliases' in food:
-                for alias in food['aliases']:
-                    if alias.lower() == food_name_lower:
-                        return food
-        
-        return None
+        Returns:
+            (food, confidence) for the closest match, or None.
+            Exact matches have confidence 1.0.
+        """
+        return self._fuzzy_matcher.match(normalize_name(food_name), min_confidence)
+    
+    def find_food_candidates(self, food_name: str) -> List[Dict]:
+        """
+        Get every food matching a name or alias, in resolution order.
+        The first entry is what find_food() returns.
+        """
+        key = normalize_name(food_name)
+        if key in self._collisions:
+            return list(self._collisions[key])
+        food = self._name_index.get(key)
+        return [food] if food else []
+    
+    def get_ambiguous_names(self) -> Dict[str, List[str]]:
+        """Get names/aliases claimed by several foods, mapped to the foods in resolution order."""
+        return {
+            key: [food['name'] for food in foods]
+            for key, foods in self._collisions.items()
+        }
     
     def get_all_food_names(self) -> List[str]:
         """Get list of all food names and aliases."""
@@ -54,28 +208,19 @@ class NutritionDatabase:
                 names.extend(food['aliases'])
         return names
     
-    def search_food(self, query: str) -> List[Dict]:
+    def search_food(self, query: str, limit: Optional[int] = None) -> List[Dict]:
         """
         Search for foods containing the query string.
-        Useful for fuzzy matching.
-        """
-        query_lower = query.lower().strip()
-        results = []
+        Useful for fuzzy matching and autocomplete.
         
-        for food in self.foods:
-            # Check if query is in name
-            if query_lower in food['name'].lower():
-                results.append(food)
-                continue
+        Args:
+            query: Text to look for in names and aliases
+            limit: Maximum number of results (None for all)
             
-            # Check if query is in any alias
-            if 'aliases' in food:
-                for alias in food['aliases']:
-                    if query_lower in alias.lower():
-                        results.append(food)
-                        break
-        
-        return results
+        Returns:
+            Matching foods ranked best first
+        """
+        return self._search_index.search(query, limit)
 
 
 # Example usage
@@ -87,7 +232,12 @@ if __name__ == "__main__":
     chapati = db.find_food("roti")
     if chapati:
         print(f"Found: {chapati['name']}")
-        print(f"Calories: {chapati['calories']} per {chapati['serving_size']}")
+        print(f"Calories: {db.get_nutrients(chapati)['calories']} per {chapati['serving_size']}")
+    
+    # Test colliding aliases
+    print("\n--- Testing find_food_candidates ---")
+    for food in db.find_food_candidates("coffee"):
+        print(f"  - {food['name']}")
     
     # Test search
     print("\n--- Testing search_food ---")
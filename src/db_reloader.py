@@ -0,0 +1,114 @@
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from src.compiled_db import compiled_path_for, open_database
+
+
+class DatabaseReloader:
+    """
+    Keeps a nutrition database up to date with its files on disk.
+
+    The JSON file and its compiled sibling are checked (by mtime) at most
+    once every `check_interval` seconds. When either changed, the new
+    database and its indexes are built on a background thread and swapped
+    in with a single reference assignment; until then, and for calls
+    already in progress, the previous database keeps serving.
+
+    Callers that need several consistent lookups should take one
+    snapshot() and use it throughout (NutritionCalculator does this).
+    Attribute access is forwarded to the current snapshot, so the
+    reloader can stand in for a database elsewhere.
+    """
+
+    def __init__(self, db_path: str = "data/nutrition_db.json", check_interval: float = 2.0,
+                 loader: Callable = open_database):
+        """
+        Args:
+            db_path: JSON database path (a compiled sibling is picked up too)
+            check_interval: Minimum seconds between file checks
+            loader: Function building a database from db_path
+        """
+        self.db_path = Path(db_path)
+        self.check_interval = check_interval
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._last_check = time.monotonic()
+        self._signature = self._file_signature()
+        self._failed_signature = None
+        self._current = loader(str(self.db_path))
+        self.reload_count = 0
+
+    def _file_signature(self) -> Tuple[Optional[int], Optional[int]]:
+        """mtimes of the JSON and compiled files (None if missing)."""
+        signature = []
+        for path in (self.db_path, compiled_path_for(str(self.db_path))):
+            try:
+                signature.append(path.stat().st_mtime_ns)
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def snapshot(self):
+        """Get the current database, starting a background reload if the files changed."""
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self.check_for_changes()
+        return self._current
+
+    def check_for_changes(self, wait: bool = False) -> bool:
+        """
+        Start a reload if the database files changed since the last load.
+
+        Args:
+            wait: Block until the reload has finished (for scripts and tests)
+
+        Returns:
+            True if a reload was started
+        """
+        signature = self._file_signature()
+        with self._lock:
+            if signature == self._signature or self._reloading:
+                return False
+            self._reloading = True
+
+        thread = threading.Thread(target=self._reload, args=(signature,), daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def _reload(self, signature):
+        """
+        Build the new database off the request path and swap it in.
+
+        The files' signature is only recorded after a successful swap, so
+        a failed attempt (e.g. a JSON file caught mid-write) is retried on
+        the next check.
+        """
+        loaded = False
+        try:
+            database = self._loader(str(self.db_path))
+            if not database.foods:
+                raise ValueError("the reloaded database is empty")
+            self._current = database
+            self.reload_count += 1
+            loaded = True
+            print(f"🔄 Reloaded nutrition database ({len(database.foods)} foods)")
+        except Exception as e:
+            # Report each failing version of the files once, not every retry
+            if signature != self._failed_signature:
+                print(f"✗ Failed to reload nutrition database, keeping the previous one (will retry): {e}")
+        finally:
+            with self._lock:
+                if loaded:
+                    self._signature = signature
+                self._failed_signature = None if loaded else signature
+                self._reloading = False
+
+    def __getattr__(self, name):
+        # Only called for attributes not defined on the reloader itself
+        return getattr(self.snapshot(), name)
@@ -0,0 +1,125 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from src.search_index import normalize_name
+
+# Shorter queries ("coke", "salt") are one edit away from too many
+# unrelated words, so they only match exactly
+MIN_FUZZY_LENGTH = 5
+
+
+def _padded_trigrams(text: str) -> List[str]:
+    """Get character trigrams of a string padded with spaces, so short words still share grams."""
+    padded = f"  {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def bounded_edit_distance(a: str, b: str, max_distance: int) -> Optional[int]:
+    """
+    Levenshtein distance between two strings, giving up early.
+
+    Returns:
+        The distance, or None if it is greater than max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+
+    previous = list(range(len(a) + 1))
+    for j, char_b in enumerate(b, 1):
+        current = [j]
+        for i, char_a in enumerate(a, 1):
+            current.append(min(
+                previous[i] + 1,
+                current[i - 1] + 1,
+                previous[i - 1] + (char_a != char_b)
+            ))
+        if min(current) > max_distance:
+            return None
+        previous = current
+
+    distance = previous[-1]
+    return distance if distance <= max_distance else None
+
+
+class FuzzyMatcher:
+    """
+    Typo-tolerant lookup of food names and aliases.
+
+    Candidate keys are gathered from a padded-trigram index (Dice overlap
+    with a cutoff), and only the best few are verified with a bounded edit
+    distance, so a lookup touches a handful of strings rather than the
+    whole database. A misspelling is accepted only if it is also close to
+    the food's full name, so a short alias ("cake" of "milk cake") can't
+    pull in an unrelated food.
+    """
+
+    def __init__(self, name_index: Dict[str, Dict],
+                 min_overlap: float = 0.4, max_candidates: int = 20):
+        """
+        Args:
+            name_index: Normalized name/alias -> resolved food
+            min_overlap: Minimum trigram Dice coefficient for a candidate
+            max_candidates: Number of candidates checked by edit distance
+        """
+        self.name_index = name_index
+        self.min_overlap = min_overlap
+        self.max_candidates = max_candidates
+        self._keys: List[str] = list(name_index)
+        self._gram_counts: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+
+        for position, key in enumerate(self._keys):
+            grams = set(_padded_trigrams(key))
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(position)
+
+    def match(self, query: str, min_confidence: float = 0.75) -> Optional[Tuple[Dict, float]]:
+        """
+        Find the closest food to a (possibly misspelled) name.
+
+        Args:
+            query: Normalized food name
+            min_confidence: Minimum 1 - distance / length to accept,
+                measured against the food's full name
+
+        Returns:
+            (food, confidence) for the best match, or None
+        """
+        if not query:
+            return None
+        if query in self.name_index:
+            return self.name_index[query], 1.0
+        if len(query) < MIN_FUZZY_LENGTH:
+            return None
+
+        query_grams = set(_padded_trigrams(query))
+        overlaps = Counter()
+        for gram in query_grams:
+            overlaps.update(self._postings.get(gram, ()))
+
+        candidates = []
+        for position, shared in overlaps.items():
+            dice = 2 * shared / (len(query_grams) + self._gram_counts[position])
+            if dice >= self.min_overlap:
+                candidates.append((dice, position))
+        candidates.sort(reverse=True)
+
+        max_distance = max(1, int(len(query) * (1 - min_confidence)))
+        best = None
+        for _, position in candidates[:self.max_candidates]:
+            key = self._keys[position]
+            food = self.name_index[key]
+            name = normalize_name(food['name'])
+            if key != name and bounded_edit_distance(query, key, max_distance) is None:
+                continue
+            distance = bounded_edit_distance(query, name, max_distance)
+            if distance is None:
+                continue
+            confidence = 1 - distance / max(len(query), len(name))
+            if confidence >= min_confidence and (best is None or confidence > best[1]):
+                best = (food, round(confidence, 2))
+
+        return best
@@ -0,0 +1,344 @@
+import asyncio
+import queue
+import random
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+from src.llm_backends import GeminiBackend, LLMBackend
+from src.tracing import tracer
+
+
+# Errors worth retrying: timeouts, rate limits and server-side failures
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded,
+)
+
+# Ask Gemini for a JSON response
+JSON_OUTPUT = {'response_mime_type': 'application/json'}
+
+# How often a stream consumer checks that the producer is still running
+STREAM_POLL_SECONDS = 1.0
+
+# USD per 1M input / output tokens, used for the cost metrics
+MODEL_PRICES = {
+    'gemini-2.5-pro': (1.25, 10.00),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-flash-lite': (0.10, 0.40),
+}
+
+
+class ModelMetrics:
+    """Latency, token and cost counters for one model."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.calls = 0
+        self.errors = 0
+        self.escalations = 0
+        self.total_latency = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def record_call(self, latency: float, input_tokens: int = 0, output_tokens: int = 0):
+        """Record a successful request and its token usage."""
+        self.calls += 1
+        self.total_latency += latency
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+
+    @property
+    def cost(self) -> float:
+        """Estimated spend in USD (0 for models without a price)."""
+        input_price, output_price = MODEL_PRICES.get(self.model_name, (0.0, 0.0))
+        return (self.input_tokens * input_price + self.output_tokens * output_price) / 1_000_000
+
+    def as_dict(self) -> Dict:
+        """Counters plus derived averages, e.g. for display or export."""
+        return {
+            'model': self.model_name,
+            'calls': self.calls,
+            'errors': self.errors,
+            'escalations': self.escalations,
+            'avg_latency_ms': 1000 * self.total_latency / self.calls if self.calls else 0.0,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cost_usd': self.cost
+        }
+
+
+class RateLimiter:
+    """Spaces requests out evenly to stay under a requests-per-minute limit."""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute
+        self._next_slot = 0.0
+
+    async def wait(self):
+        """Wait for the next free slot (call from the client's event loop)."""
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class GeminiClient:
+    """
+    Gemini text generation with timeouts, bounded concurrency and retries.
+
+    All requests run on one event loop owned by the client (started on a
+    background thread on first use), so the async gRPC connection is
+    reused across calls, sessions and threads, and `max_concurrency`
+    bounds the number of requests in flight process-wide.
+
+    generate() blocks the calling thread (for Streamlit and the CLI);
+    generate_async() can be awaited from any event loop. Every method takes
+    an optional model_name, so one client can serve several model tiers;
+    per-model latency, token and cost metrics are kept in `metrics`.
+
+    Requests go through an LLMBackend: GeminiBackend by default, or e.g. a
+    ReplayBackend to run the app and benchmarks offline.
+    """
+
+    def __init__(self, model_name: str = 'gemini-2.5-pro', timeout: float = 30.0,
+                 max_concurrency: int = 4, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 requests_per_minute: Optional[float] = None,
+                 backend: Optional[LLMBackend] = None):
+        """
+        Args:
+            model_name: Default Gemini model
+            timeout: Seconds allowed per attempt
+            max_concurrency: Maximum requests in flight at once
+            max_retries: Retries after a transient error
+            backoff_base: Base delay for exponential backoff, in seconds
+            backoff_max: Upper bound for a single backoff delay, in seconds
+            requests_per_minute: Optional rate limit (retries included)
+            backend: Backend making the requests (defaults to GeminiBackend,
+                which reads the GEMINI_API_KEY env variable)
+        """
+        self.model_name = model_name
+        self.backend = backend or GeminiBackend()
+        self.metrics: Dict[str, ModelMetrics] = {}
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = RateLimiter(requests_per_minute) if requests_per_minute else None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+        # Guards `metrics`, which the loop thread adds models to
+        self._metrics_lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the client's event loop thread if it is not running yet."""
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='gemini-client', daemon=True)
+                thread.start()
+                self._loop = loop
+                self._thread = thread
+        return self._loop
+
+    def get_metrics(self, model_name: Optional[str] = None) -> ModelMetrics:
+        """Get the metrics of a model, creating them on first use."""
+        model_name = model_name or self.model_name
+        with self._metrics_lock:
+            if model_name not in self.metrics:
+                self.metrics[model_name] = ModelMetrics(model_name)
+            return self.metrics[model_name]
+
+    def record_escalation(self, model_name: str):
+        """Note that a result from this model was rejected and a larger model was tried."""
+        self.get_metrics(model_name).escalations += 1
+        tracer.count('parse_escalations', model=model_name)
+
+    def metrics_report(self):
+        """Metrics of every model used so far, as a list of dicts."""
+        with self._metrics_lock:
+            models = list(self.metrics.values())
+        return [metrics.as_dict() for metrics in models]
+
+    def run(self, coro):
+        """Run a coroutine on the client's event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    async def run_async(self, coro):
+        """Await a coroutine on the client's event loop, from any event loop."""
+        future = asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+        return await asyncio.wrap_future(future)
+
+    def generate(self, prompt: str, timeout: Optional[float] = None,
+                 generation_config: Optional[Dict] = None, model_name: Optional[str] = None) -> str:
+        """
+        Generate a response, blocking until it arrives.
+
+        Args:
+            prompt: Prompt text
+            timeout: Seconds allowed per attempt (defaults to self.timeout)
+            generation_config: Optional Gemini generation config, e.g.
+                {'response_mime_type': 'application/json'}
+            model_name: Model to use instead of the default
+
+        Returns:
+            Response text, stripped
+
+        Raises:
+            The last error once retries are exhausted
+        """
+        with tracer.span('llm', model=model_name or self.model_name):
+            tracer.add_to_trace('llm_calls')
+            return self.run(self._generate(prompt, timeout, generation_config, model_name))
+
+    async def generate_async(self, prompt: str, timeout: Optional[float] = None,
+                             generation_config: Optional[Dict] = None,
+                             model_name: Optional[str] = None) -> str:
+        """Async version of generate(); may be awaited from any event loop."""
+        with tracer.span('llm', model=model_name or self.model_name):
+            tracer.add_to_trace('llm_calls')
+            return await self.run_async(self._generate(prompt, timeout, generation_config, model_name))
+
+    async def _generate(self, prompt: str, timeout: Optional[float],
+                        generation_config: Optional[Dict] = None,
+                        model_name: Optional[str] = None) -> str:
+        """Make the request with retries; runs on the client's loop."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = timeout or self.timeout
+        model_name = model_name or self.model_name
+        metrics = self.get_metrics(model_name)
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                await self.rate_limiter.wait()
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    response = await asyncio.wait_for(
+                        self.backend.generate(model_name, prompt, generation_config, timeout),
+                        timeout
+                    )
+                    metrics.record_call(time.perf_counter() - start, response.input_tokens, response.output_tokens)
+                tracer.count('llm_calls', model=model_name)
+                return response.text.strip()
+            except TRANSIENT_ERRORS as e:
+                metrics.errors += 1
+                tracer.count('llm_errors', model=model_name, error=type(e).__name__)
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                print(f"⚠ Gemini request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                metrics.errors += 1
+                tracer.count('llm_errors', model=model_name, error=type(e).__name__)
+                raise
+
+    def generate_stream(self, prompt: str, timeout: Optional[float] = None,
+                        model_name: Optional[str] = None) -> Iterator[str]:
+        """
+        Generate a response, yielding text chunks as they arrive.
+
+        The request is retried like generate() until the first chunk has
+        arrived; after that an error (or `timeout` seconds without a new
+        chunk) is raised from the generator. Closing the generator early
+        cancels the request.
+
+        Args:
+            prompt: Prompt text
+            timeout: Seconds allowed for the request and between chunks
+            model_name: Model to use instead of the default
+
+        Yields:
+            Response text chunks
+        """
+        tracer.add_to_trace('llm_calls')
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._stream(prompt, timeout, chunks, model_name), self._get_loop())
+        try:
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=STREAM_POLL_SECONDS)
+                except queue.Empty:
+                    # The producer always ends with a sentinel; if it is gone
+                    # without one (loop thread died), don't wait forever
+                    if (future.done() or not self._thread.is_alive()) and chunks.empty():
+                        raise RuntimeError("Gemini stream ended without a result")
+                    continue
+                if kind == 'chunk':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+
+    async def _stream(self, prompt: str, timeout: Optional[float], chunks: queue.Queue,
+                      model_name: Optional[str] = None):
+        """Stream a response into `chunks` as ('chunk', text), then ('done', None) or ('error', e)."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = timeout or self.timeout
+        model_name = model_name or self.model_name
+        metrics = self.get_metrics(model_name)
+        started = False
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                if self.rate_limiter:
+                    await self.rate_limiter.wait()
+                try:
+                    async with self._semaphore:
+                        start = time.perf_counter()
+                        parts = self.backend.stream(model_name, prompt, timeout).__aiter__()
+                        chunk = None
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(parts.__anext__(), timeout)
+                            except StopAsyncIteration:
+                                break
+                            if chunk.text:
+                                started = True
+                                chunks.put(('chunk', chunk.text))
+                        # Usage totals come with the last chunk
+                        metrics.record_call(time.perf_counter() - start,
+                                            chunk.input_tokens if chunk else 0,
+                                            chunk.output_tokens if chunk else 0)
+                    tracer.count('llm_calls', model=model_name)
+                    chunks.put(('done', None))
+                    return
+                except TRANSIENT_ERRORS as e:
+                    metrics.errors += 1
+                    tracer.count('llm_errors', model=model_name, error=type(e).__name__)
+                    if started or attempt == self.max_retries:
+                        chunks.put(('error', e))
+                        return
+                    delay = self._backoff_delay(attempt)
+                    print(f"⚠ Gemini request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                except Exception as e:
+                    metrics.errors += 1
+                    tracer.count('llm_errors', model=model_name, error=type(e).__name__)
+                    chunks.put(('error', e))
+                    return
+        except asyncio.CancelledError:
+            # Wake the consumer, which would otherwise wait for a sentinel
+            chunks.put(('error', RuntimeError("Gemini stream was cancelled")))
+            raise
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
@@ -0,0 +1,335 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional, Union
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+from google.api_core import exceptions as api_exceptions
+
+load_dotenv()
+
+
+class LLMResponse:
+    """Text of a response (or of one streamed chunk) and its token usage."""
+
+    def __init__(self, text: str, input_tokens: int = 0, output_tokens: int = 0):
+        self.text = text
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class LLMBackend:
+    """
+    Interface GeminiClient sends its requests through.
+
+    A backend makes a single attempt per call; timeouts, retries, the
+    concurrency limit and metrics are handled by GeminiClient. Errors
+    listed in gemini_client.TRANSIENT_ERRORS are retried.
+    """
+
+    async def generate(self, model_name: str, prompt: str,
+                       generation_config: Optional[Dict] = None,
+                       timeout: Optional[float] = None) -> LLMResponse:
+        """Generate a complete response."""
+        raise NotImplementedError
+
+    def stream(self, model_name: str, prompt: str,
+               timeout: Optional[float] = None) -> AsyncIterator[LLMResponse]:
+        """
+        Generate a response as an async iterator of chunks.
+
+        Token counts are totals so far; the last chunk carries the usage
+        of the whole response.
+        """
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    """The Gemini API, through google.generativeai."""
+
+    def __init__(self, api_key: str = None):
+        """
+        Args:
+            api_key: Gemini API key. If None, loads from GEMINI_API_KEY env variable.
+        """
+        api_key = api_key or os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("Gemini API key not found. Set GEMINI_API_KEY environment variable.")
+
+        genai.configure(api_key=api_key)
+        self._models: Dict[str, genai.GenerativeModel] = {}
+
+    def get_model(self, model_name: str) -> genai.GenerativeModel:
+        """Get the (cached) model object for a model name."""
+        if model_name not in self._models:
+            self._models[model_name] = genai.GenerativeModel(model_name)
+        return self._models[model_name]
+
+    async def generate(self, model_name: str, prompt: str,
+                       generation_config: Optional[Dict] = None,
+                       timeout: Optional[float] = None) -> LLMResponse:
+        response = await self.get_model(model_name).generate_content_async(
+            prompt,
+            generation_config=generation_config,
+            request_options={'timeout': timeout} if timeout else None
+        )
+        return self._to_response(response.text, response)
+
+    async def stream(self, model_name: str, prompt: str,
+                     timeout: Optional[float] = None) -> AsyncIterator[LLMResponse]:
+        response = await self.get_model(model_name).generate_content_async(
+            prompt, stream=True, request_options={'timeout': timeout} if timeout else None
+        )
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text (e.g. the final one with finish info)
+                text = ''
+            yield self._to_response(text, chunk)
+
+    def _to_response(self, text: str, response) -> LLMResponse:
+        """Wrap Gemini's text and usage_metadata."""
+        usage = getattr(response, 'usage_metadata', None)
+        return LLMResponse(
+            text,
+            getattr(usage, 'prompt_token_count', 0) or 0,
+            getattr(usage, 'candidates_token_count', 0) or 0
+        )
+
+
+class LatencyModel:
+    """
+    Simulated response times: time to first token plus time per output token.
+
+    Both are scaled by a lognormal factor (sigma `jitter`), which gives the
+    long right tail real API latencies have. A fraction `error_rate` of
+    requests fail with ServiceUnavailable, to exercise retries.
+    """
+
+    def __init__(self, first_token: float = 0.4, per_token: float = 0.005,
+                 jitter: float = 0.25, error_rate: float = 0.0, seed: Optional[int] = None):
+        """
+        Args:
+            first_token: Median seconds until the first token
+            per_token: Median seconds per output token
+            jitter: Sigma of the lognormal factor (0 for fixed latencies)
+            error_rate: Fraction of requests that fail
+            seed: Random seed, for repeatable runs
+        """
+        self.first_token = first_token
+        self.per_token = per_token
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def _factor(self) -> float:
+        return self._random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+
+    def first_token_delay(self) -> float:
+        """Seconds until the first token of a response."""
+        return self.first_token * self._factor()
+
+    def token_delay(self, tokens: int) -> float:
+        """Seconds to generate `tokens` more output tokens."""
+        return self.per_token * tokens * self._factor()
+
+    def should_fail(self) -> bool:
+        """Whether this request fails."""
+        return self.error_rate > 0 and self._random.random() < self.error_rate
+
+
+def prompt_key(prompt: str) -> str:
+    """Key of a recorded response: hash of the exact prompt text."""
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Offline stand-in for Gemini that replays recorded responses.
+
+    Recordings are JSONL, one response per line, found either by prompt:
+        {"key": "<prompt_key(prompt)>", "response": "..."}   (as written by RecordingBackend)
+        {"prompt": "full prompt text", "response": "..."}
+    or, for hand-written fixtures, by a piece of text in the prompt:
+        {"match": "2 rotis and dal", "response": "..."}
+    When several "match" entries fit, the one found last in the prompt
+    wins, since the current message comes after the instructions and
+    history. Prompts without a recording get `default_response` (a string,
+    or a function of the prompt), or raise LookupError.
+
+    The model name is ignored, so every model tier gets the same response.
+    Responses are delayed according to `latency`, and streamed in chunks of
+    about `chunk_chars` characters.
+    """
+
+    def __init__(self, recordings_file: Optional[str] = None,
+                 latency: Optional[LatencyModel] = None,
+                 default_response: Union[str, Callable[[str], str], None] = None,
+                 chunk_chars: int = 40):
+        """
+        Args:
+            recordings_file: JSONL file of recorded responses
+            latency: Latency model (defaults to no delay)
+            default_response: Response for prompts without a recording
+            chunk_chars: Approximate size of streamed chunks
+        """
+        self.latency = latency or LatencyModel(first_token=0.0, per_token=0.0, jitter=0.0)
+        self.default_response = default_response
+        self.chunk_chars = chunk_chars
+        self.responses: Dict[str, str] = {}
+        self.matches: Dict[str, str] = {}
+        self.calls = 0
+        self.misses = 0
+
+        if recordings_file:
+            self.load(recordings_file)
+
+    def load(self, recordings_file: str):
+        """Add the recordings in a JSONL file."""
+        with open(recordings_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'response' not in record:
+                    raise ValueError(f"{recordings_file}:{line_number}: recording has no 'response'")
+                if 'match' in record:
+                    self.matches[record['match']] = record['response']
+                else:
+                    self.add(record.get('prompt') or record['key'], record['response'],
+                             hashed='prompt' not in record)
+
+        print(f"✓ Loaded {len(self.responses) + len(self.matches)} recorded responses from {recordings_file}")
+
+    def add(self, prompt: str, response: str, hashed: bool = False):
+        """Record the response to a prompt (or to a prompt_key() if `hashed`)."""
+        self.responses[prompt if hashed else prompt_key(prompt)] = response
+
+    def add_match(self, text: str, response: str):
+        """Record the response to prompts containing `text`."""
+        self.matches[text] = response
+
+    def lookup(self, prompt: str) -> str:
+        """Find the recorded response to a prompt."""
+        self.calls += 1
+        response = self.responses.get(prompt_key(prompt))
+        if response is not None:
+            return response
+
+        best = None
+        best_end = -1
+        for text, match_response in self.matches.items():
+            position = prompt.rfind(text)
+            if position >= 0 and position + len(text) > best_end:
+                best, best_end = match_response, position + len(text)
+        if best is not None:
+            return best
+
+        self.misses += 1
+        if callable(self.default_response):
+            return self.default_response(prompt)
+        if self.default_response is not None:
+            return self.default_response
+        raise LookupError(f"No recorded response for prompt {prompt_key(prompt)}")
+
+    async def generate(self, model_name: str, prompt: str,
+                       generation_config: Optional[Dict] = None,
+                       timeout: Optional[float] = None) -> LLMResponse:
+        text = self.lookup(prompt)
+        output_tokens = estimate_tokens(text)
+        await asyncio.sleep(self.latency.first_token_delay() + self.latency.token_delay(output_tokens))
+        if self.latency.should_fail():
+            raise api_exceptions.ServiceUnavailable("Simulated failure")
+        return LLMResponse(text, estimate_tokens(prompt), output_tokens)
+
+    async def stream(self, model_name: str, prompt: str,
+                     timeout: Optional[float] = None) -> AsyncIterator[LLMResponse]:
+        text = self.lookup(prompt)
+        await asyncio.sleep(self.latency.first_token_delay())
+        if self.latency.should_fail():
+            raise api_exceptions.ServiceUnavailable("Simulated failure")
+
+        output_tokens = 0
+        for chunk in self._split(text):
+            tokens = estimate_tokens(chunk)
+            if output_tokens:
+                await asyncio.sleep(self.latency.token_delay(tokens))
+            output_tokens += tokens
+            yield LLMResponse(chunk, estimate_tokens(prompt), output_tokens)
+
+    def _split(self, text: str) -> List[str]:
+        """Split text into chunks of about chunk_chars, at spaces."""
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = text.find(' ', start + self.chunk_chars)
+            end = len(text) if end < 0 else end + 1
+            chunks.append(text[start:end])
+            start = end
+        return chunks
+
+
+class RecordingBackend(LLMBackend):
+    """
+    Passes requests to another backend and appends each prompt's response to
+    a JSONL file that ReplayBackend can replay.
+    """
+
+    def __init__(self, backend: LLMBackend, recordings_file: str, include_prompt: bool = False):
+        """
+        Args:
+            backend: Backend making the real requests
+            recordings_file: JSONL file to append to
+            include_prompt: Store the full prompt instead of only its key
+        """
+        self.backend = backend
+        self.recordings_file = Path(recordings_file)
+        self.include_prompt = include_prompt
+        self._lock = threading.Lock()
+
+    def _record(self, model_name: str, prompt: str, response: str):
+        record = {'key': prompt_key(prompt), 'model': model_name, 'response': response}
+        if self.include_prompt:
+            record['prompt'] = prompt
+        with self._lock, open(self.recordings_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    async def generate(self, model_name: str, prompt: str,
+                       generation_config: Optional[Dict] = None,
+                       timeout: Optional[float] = None) -> LLMResponse:
+        response = await self.backend.generate(model_name, prompt, generation_config, timeout)
+        self._record(model_name, prompt, response.text)
+        return response
+
+    async def stream(self, model_name: str, prompt: str,
+                     timeout: Optional[float] = None) -> AsyncIterator[LLMResponse]:
+        text = ''
+        async for chunk in self.backend.stream(model_name, prompt, timeout):
+            text += chunk.text
+            yield chunk
+        self._record(model_name, prompt, text)
+
+
+# Example usage
+if __name__ == "__main__":
+    backend = ReplayBackend(latency=LatencyModel(first_token=0.2, seed=1), default_response="Hello! 👋")
+    backend.add_match("2 rotis", '{"meal_type": "dinner", "items": '
+                                 '[{"food": "chapati", "quantity": 2, "unit": "pieces"}]}')
+
+    async def demo():
+        for prompt in ['User input: "2 rotis for dinner"', "User: hi\nYou:"]:
+            response = await backend.generate('gemini-2.5-flash', prompt)
+            print(f"{prompt!r} -> {response.text} ({response.output_tokens} tokens)")
+
+    asyncio.run(demo())
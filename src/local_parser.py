@@ -0,0 +1,289 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from src.search_index import normalize_name
+
+
+# Meal words and the meal_type they map to
+MEAL_TYPES = {
+    'breakfast': 'breakfast',
+    'lunch': 'lunch',
+    'dinner': 'dinner',
+    'supper': 'dinner',
+    'snack': 'snack',
+    'snacks': 'snack',
+}
+
+# Same default as the Gemini prompt
+DEFAULT_MEAL_TYPE = 'lunch'
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11,
+    'twelve': 12, 'dozen': 12, 'half': 0.5, 'couple': 2,
+}
+
+# Unit words and the unit name the Gemini prompt uses for them.
+# None marks units whose quantity is not a number of servings; those
+# inputs are left to Gemini.
+UNITS = {
+    'piece': 'pieces', 'pieces': 'pieces', 'pc': 'pieces', 'pcs': 'pieces',
+    'slice': 'pieces', 'slices': 'pieces',
+    'bowl': 'bowl', 'bowls': 'bowl', 'katori': 'bowl', 'katoris': 'bowl',
+    'serving': 'serving', 'servings': 'serving', 'plate': 'serving', 'plates': 'serving',
+    'glass': 'glass', 'glasses': 'glass',
+    'cup': 'cup', 'cups': 'cup',
+    'g': None, 'gm': None, 'gms': None, 'gram': None, 'grams': None, 'kg': None, 'ml': None,
+}
+
+# Leading words that carry no meaning for the parse ("I had ...", "also ate ...")
+FILLER_WORDS = {'i', 'had', 'have', 'ate', 'eaten', 'eat', 'just', 'also', 'then', 'some', 'my', 'today'}
+
+# Colloquial names the Gemini prompt normalizes (e.g. "rotis" -> "chapati")
+# and that would otherwise hit an ambiguous alias in the database
+COMMON_NAMES = {
+    'roti': 'chapati',
+    'rotis': 'chapati',
+    'phulka': 'chapati',
+    'phulkas': 'chapati',
+    'chawal': 'rice',
+    'dal': 'daal',
+    'dhal': 'daal',
+}
+
+# Inputs that are not a plain list of foods
+_UNSUPPORTED = re.compile(r"\?|\b(not|no|didn't|didnt|without|instead|except|how|what|should)\b")
+_NUMBER = re.compile(r'^\d+(\.\d+)?$|^\d+/\d+$')
+_SEGMENT_SPLIT = re.compile(r'[,;+&]|\band\b|\bwith\b')
+
+
+class LocalMealParser:
+    """
+    Rule-based meal parser for simple inputs such as "2 rotis, 1 bowl rice and dal".
+
+    Recognizes quantities, units and meal types, and resolves food names
+    through the nutrition database's name/alias index. Returns the same
+    structure as MealParser.parse_meal(), together with a confidence; inputs
+    it cannot parse with confidence are meant to go to Gemini instead.
+    """
+
+    def __init__(self, database, min_confidence: float = 0.9, fuzzy_confidence: float = 0.85):
+        """
+        Args:
+            database: Nutrition database (or DatabaseReloader) to resolve names against
+            min_confidence: Minimum confidence for parse_meal() to return a parse
+            fuzzy_confidence: Minimum confidence for accepting a misspelled food name
+        """
+        self.db = database
+        self.min_confidence = min_confidence
+        self.fuzzy_confidence = fuzzy_confidence
+
+    def parse_meal(self, user_input: str) -> Optional[Dict]:
+        """
+        Parse a meal description if it can be done confidently.
+
+        Args:
+            user_input: Natural language meal description
+
+        Returns:
+            Dict with meal_type and items list, or None to hand off to Gemini
+        """
+        parsed, confidence = self.parse(user_input)
+        if parsed is None or confidence < self.min_confidence:
+            return None
+        return parsed
+
+    def parse(self, user_input: str) -> Tuple[Optional[Dict], float]:
+        """
+        Parse a meal description.
+
+        Returns:
+            (parsed meal or None, confidence between 0 and 1). The confidence
+            is that of the least certain item.
+        """
+        text = normalize_name(user_input).rstrip('.!')
+        if not text or _UNSUPPORTED.search(text):
+            return None, 0.0
+
+        # Pull out the meal type ("for lunch", "breakfast:", ...)
+        meal_type = None
+        words = []
+        for word in re.sub(r'[:.!]', ' ', text).split():
+            if word in MEAL_TYPES:
+                if meal_type and MEAL_TYPES[word] != meal_type:
+                    return None, 0.0
+                meal_type = MEAL_TYPES[word]
+                # Drop the preposition in front of it
+                if words and words[-1] in ('for', 'at', 'in', 'during', 'as'):
+                    words.pop()
+            else:
+                words.append(word)
+
+        items = []
+        confidence = 1.0
+        for part in ' '.join(words).split(','):
+            part_items, part_confidence = self._parse_part(part)
+            if not part_items:
+                if part.strip():
+                    return None, 0.0
+                continue
+            items.extend(part_items)
+            confidence = min(confidence, part_confidence)
+
+        if not items:
+            return None, 0.0
+
+        return {'meal_type': meal_type or DEFAULT_MEAL_TYPE, 'items': items}, confidence
+
+    def _parse_part(self, part: str) -> Tuple[List[Dict], float]:
+        """Parse a comma-separated part, which may itself list foods joined by and/with."""
+        segments = [segment for segment in _SEGMENT_SPLIT.split(part) if segment.strip()]
+
+        # "cheese and tomato sandwich" is one food, "rice and dal" is two
+        if len(segments) > 1:
+            item = self._parse_item(part.split(), fuzzy=False)
+            if item and item[1] >= self.min_confidence:
+                return [item[0]], item[1]
+
+        items = []
+        confidence = 1.0
+        for segment in segments:
+            item = self._parse_item(segment.split())
+            if item is None:
+                return [], 0.0
+            items.append(item[0])
+            confidence = min(confidence, item[1])
+        return items, confidence
+
+    def _parse_item(self, words: List[str], fuzzy: bool = True) -> Optional[Tuple[Dict, float]]:
+        """Parse '[quantity] [unit] [of] food' into an item and its confidence."""
+        while words and words[0] in FILLER_WORDS:
+            words = words[1:]
+
+        quantity = 1
+        if words and (_NUMBER.match(words[0]) or words[0] in NUMBER_WORDS):
+            quantity = self._parse_quantity(words[0])
+            if quantity is None:
+                return None
+            words = words[1:]
+            # "a couple of", "half a", "a dozen"
+            while words and words[0] in ('a', 'an', 'couple', 'dozen', 'half'):
+                if words[0] in ('couple', 'dozen', 'half'):
+                    quantity = NUMBER_WORDS[words[0]] if quantity == 1 else quantity * NUMBER_WORDS[words[0]]
+                words = words[1:]
+
+        unit = None
+        if words and words[0] in UNITS:
+            unit = UNITS[words[0]]
+            if unit is None:
+                return None
+            words = words[1:]
+        if words and words[0] == 'of':
+            words = words[1:]
+
+        if not words:
+            return None
+
+        match = self._resolve_food(' '.join(words), fuzzy)
+        if match is None:
+            return None
+        food_name, food, confidence, plural = match
+
+        # Counted plurals ("2 idlis") are pieces, like the Gemini prompt asks
+        if not unit:
+            unit = 'pieces' if plural else self._default_unit(food)
+
+        return {
+            'food': food_name,
+            'quantity': quantity,
+            'unit': unit
+        }, confidence
+
+    def _parse_quantity(self, word: str) -> Optional[float]:
+        """
+        Convert '2', '1.5', '1/2' or 'two' to a number.
+
+        Returns None for quantities that are not positive ('0', '0/2') or
+        have a zero denominator ('1/0'), so those inputs go to Gemini.
+        """
+        if word in NUMBER_WORDS:
+            return NUMBER_WORDS[word]
+        if '/' in word:
+            numerator, denominator = (int(part) for part in word.split('/'))
+            if not denominator:
+                return None
+            value = numerator / denominator
+        else:
+            value = float(word)
+        if value <= 0:
+            return None
+        return int(value) if value.is_integer() else value
+
+    def _resolve_food(self, phrase: str, fuzzy: bool = True) -> Optional[Tuple[str, Dict, float, bool]]:
+        """
+        Resolve a food phrase against the database.
+
+        Returns:
+            (name to put in the parse, food, confidence, whether the phrase
+            was a plural) or None
+        """
+        plural = phrase in ('rotis', 'phulkas')
+        phrase = COMMON_NAMES.get(phrase, phrase)
+
+        # Exact name/alias, then simple plurals ("idlis", "samosas", "tomatoes")
+        keys = [phrase]
+        if phrase.endswith('es'):
+            keys.append(phrase[:-2])
+        if phrase.endswith('s'):
+            keys.append(phrase[:-1])
+
+        for i, key in enumerate(keys):
+            key = COMMON_NAMES.get(key, key)
+            candidates = self.db.find_food_candidates(key)
+            if not candidates:
+                continue
+
+            food = candidates[0]
+            if len(candidates) == 1 or normalize_name(food['name']) == key:
+                confidence = 1.0
+            else:
+                # An alias shared by several foods: a guess, better left to Gemini
+                confidence = 0.5
+            if i > 0:
+                confidence *= 0.95
+            return key, food, confidence, plural or i > 0
+
+        if not fuzzy:
+            return None
+        match = self.db.find_food_fuzzy(phrase, self.fuzzy_confidence)
+        if match:
+            food, confidence = match
+            return food['name'], food, confidence, False
+        return None
+
+    def _default_unit(self, food: Dict) -> str:
+        """Unit for an item without one, taken from the food's serving size."""
+        serving = food.get('serving_size', '').lower()
+        for word, unit in (('bowl', 'bowl'), ('glass', 'glass'), ('cup', 'cup'), ('piece', 'pieces')):
+            if word in serving:
+                return unit
+        return 'serving'
+
+
+# Example usage
+if __name__ == "__main__":
+    from src.database import NutritionDatabase
+
+    parser = LocalMealParser(NutritionDatabase())
+
+    test_inputs = [
+        "I had 2 rotis, 1 bowl rice and dal for lunch",
+        "3 idlis with sambar for breakfast",
+        "a glass of lassi",
+        "what should I eat for dinner?",
+        "some leftover thing from yesterday"
+    ]
+
+    for test_input in test_inputs:
+        parsed, confidence = parser.parse(test_input)
+        print(f"{test_input!r} -> {parsed} (confidence {confidence:.2f})")
@@ -0,0 +1,545 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import pandas as pd
+
+from src.nutrients import NUTRIENT_KEYS, get_nutrient
+
+DB_PATH = "meal_history.db"
+# Owner of meals logged without a user, and of meals from before per-user history
+DEFAULT_USER = "default"
+
+# Statements are built once, so every connection's statement cache reuses
+# their prepared form
+_INSERT_MEAL = (
+    f'INSERT INTO meals (user_id, date, meal_type, description{"".join(", " + key for key in NUTRIENT_KEYS)}) '
+    f'VALUES (?, ?, ?, ?{", ?" * len(NUTRIENT_KEYS)})'
+)
+_HISTORY_COLUMNS = (
+    'date as Date, meal_type as "Meal Type", description as Description'
+    + ''.join(f', {key} as "{get_nutrient(key).label}"' for key in NUTRIENT_KEYS)
+)
+# One user's meals, newest first; id breaks ties so pages have a stable
+# order (all ranges of idx_meals_user_date)
+_SELECT_HISTORY = f'SELECT {_HISTORY_COLUMNS} FROM meals WHERE user_id = ? ORDER BY date DESC, id DESC'
+_SELECT_FIRST_PAGE = (
+    f'SELECT id, {_HISTORY_COLUMNS} FROM meals WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT ?'
+)
+_SELECT_PAGE_AFTER = (
+    f'SELECT id, {_HISTORY_COLUMNS} FROM meals WHERE user_id = ? AND (date, id) < (?, ?) '
+    f'ORDER BY date DESC, id DESC LIMIT ?'
+)
+_INSERT_ITEM = (
+    'INSERT INTO meal_items (meal_id, position, food_id, quantity, unit, multiplier) VALUES (?, ?, ?, ?, ?, ?)'
+)
+# A food's signature is set when it is first logged; afterwards only rescore_meals.py moves it
+_UPSERT_FOOD = '''INSERT INTO foods (id, name, signature) VALUES (?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET name = excluded.name'''
+_SELECT_ITEMS = '''SELECT meals.id AS meal_id, meals.date, meals.meal_type, meal_items.food_id, foods.name AS food,
+        meal_items.quantity, meal_items.unit, meal_items.multiplier
+    FROM meals JOIN meal_items ON meal_items.meal_id = meals.id LEFT JOIN foods ON foods.id = meal_items.food_id
+    WHERE meals.user_id = ? AND meals.date BETWEEN ? AND ? ORDER BY meals.date, meals.id, meal_items.position'''
+_COUNT_MEALS = 'SELECT meals FROM meal_counts WHERE user_id = ?'
+_COUNT_ALL_MEALS = 'SELECT TOTAL(meals) FROM meal_counts'
+_CALORIES_ON = 'SELECT TOTAL(calories) FROM daily_rollups WHERE user_id = ? AND date = ?'
+
+# Rollup tables: per-user, per-period, per-meal-type meal counts and
+# nutrient sums. Table -> (period column, SQL for a meal's period from its date)
+ROLLUPS = {
+    'daily_rollups': ('date', "date({})"),
+    # Weeks start on Monday: back six days, then forward to a Monday
+    'weekly_rollups': ('week', "date({}, '-6 days', 'weekday 1')"),
+}
+_NUTRIENT_SUMS = ''.join(f', TOTAL({key})' for key in NUTRIENT_KEYS)
+_NUTRIENT_COLUMNS = ''.join(f', {key}' for key in NUTRIENT_KEYS)
+
+
+def _add_to_rollup(table: str, row: str) -> str:
+    """Trigger statement adding meal `row` (NEW or OLD) to a rollup table."""
+    period, expression = ROLLUPS[table]
+    period_value = expression.format(f'{row}.date')
+    values = ''.join(f', COALESCE({row}.{key}, 0)' for key in NUTRIENT_KEYS)
+    updates = ''.join(f', {key} = {key} + excluded.{key}' for key in NUTRIENT_KEYS)
+    # Meals without a valid date are left out of the rollups
+    return (
+        f"INSERT INTO {table} (user_id, {period}, meal_type, meals{_NUTRIENT_COLUMNS}) "
+        f"SELECT {row}.user_id, {period_value}, COALESCE({row}.meal_type, ''), 1{values} "
+        f"WHERE {period_value} IS NOT NULL "
+        f"ON CONFLICT (user_id, {period}, meal_type) DO UPDATE SET meals = meals + 1{updates};"
+    )
+
+
+def _remove_from_rollup(table: str, row: str) -> str:
+    """Trigger statements taking meal `row` back out of a rollup table."""
+    period, expression = ROLLUPS[table]
+    where = (f"WHERE user_id = {row}.user_id AND {period} = {expression.format(f'{row}.date')} "
+             f"AND meal_type = COALESCE({row}.meal_type, '')")
+    updates = ''.join(f', {key} = {key} - COALESCE({row}.{key}, 0)' for key in NUTRIENT_KEYS)
+    return (
+        f"UPDATE {table} SET meals = meals - 1{updates} {where}; "
+        f"DELETE FROM {table} {where} AND meals <= 0;"
+    )
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Recompute every rollup table from the meals table, on an open connection.
+
+    Returns:
+        Number of rows in each rollup table
+    """
+    counts = {}
+    for table, (period, expression) in ROLLUPS.items():
+        period_value = expression.format('date')
+        conn.execute(f'DELETE FROM {table}')
+        conn.execute(
+            f"INSERT INTO {table} (user_id, {period}, meal_type, meals{_NUTRIENT_COLUMNS}) "
+            f"SELECT user_id, {period_value}, COALESCE(meal_type, ''), COUNT(*){_NUTRIENT_SUMS} FROM meals "
+            f"WHERE {period_value} IS NOT NULL GROUP BY 1, 2, 3"
+        )
+        counts[table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    return counts
+
+
+def create_schema(conn: sqlite3.Connection):
+    """Create the meals, counter and rollup tables, adding a column for any nutrient they lack."""
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS meals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}',
+        date TEXT,
+        meal_type TEXT,
+        description TEXT
+    )''')
+    existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    # One REAL column per nutrient in the schema; older tables gain new ones
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(meals)')}
+    for key in NUTRIENT_KEYS:
+        if key not in existing:
+            conn.execute(f'ALTER TABLE meals ADD COLUMN {key} REAL')
+    # Meals from before per-user history go to the default user
+    if 'user_id' not in existing:
+        conn.execute(f"ALTER TABLE meals ADD COLUMN user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}'")
+
+    # Per-user date lookups and newest-first pages (the index also holds
+    # the id); it replaces the all-users date index
+    conn.execute('DROP INDEX IF EXISTS idx_meals_date')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_meals_user_date ON meals (user_id, date)')
+
+    # Meals per user, kept up to date by triggers so it is never a table
+    # scan; it replaces the single all-users counter
+    conn.execute('DROP TABLE IF EXISTS meal_counters')
+    conn.execute('''CREATE TABLE IF NOT EXISTS meal_counts (
+        user_id TEXT PRIMARY KEY,
+        meals INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+    if 'meal_counts' not in existing_tables:
+        conn.execute('INSERT INTO meal_counts SELECT user_id, COUNT(*) FROM meals GROUP BY user_id')
+
+    # Per-item breakdown: the food, quantity and serving multiplier of each
+    # resolved item, so meals can be analyzed or re-scored without the LLM
+    conn.execute('''CREATE TABLE IF NOT EXISTS foods (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS meal_items (
+        meal_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        food_id INTEGER NOT NULL,
+        quantity REAL,
+        unit TEXT,
+        multiplier REAL NOT NULL,
+        PRIMARY KEY (meal_id, position)
+    ) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_meal_items_food ON meal_items (food_id)')
+    # Fingerprint of the nutrients meals were last re-scored with (rescore_meals.py)
+    if 'signature' not in {row[1] for row in conn.execute('PRAGMA table_info(foods)')}:
+        conn.execute('ALTER TABLE foods ADD COLUMN signature TEXT')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS meals_items_delete AFTER DELETE ON meals BEGIN
+        DELETE FROM meal_items WHERE meal_id = OLD.id;
+    END''')
+
+    # Daily and weekly rollups per user, also kept current by triggers
+    for table, (period, _) in ROLLUPS.items():
+        rollup_columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        # Rollups from before per-user history are rebuilt with a user column
+        if rollup_columns and 'user_id' not in rollup_columns:
+            conn.execute(f'DROP TABLE {table}')
+            existing_tables.discard(table)
+            rollup_columns = set()
+        columns = ''.join(f', {key} REAL NOT NULL DEFAULT 0' for key in NUTRIENT_KEYS)
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+            user_id TEXT NOT NULL,
+            {period} TEXT NOT NULL,
+            meal_type TEXT NOT NULL,
+            meals INTEGER NOT NULL DEFAULT 0{columns},
+            PRIMARY KEY (user_id, {period}, meal_type)
+        ) WITHOUT ROWID''')
+        for key in NUTRIENT_KEYS:
+            if rollup_columns and key not in rollup_columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {key} REAL NOT NULL DEFAULT 0')
+
+    # Recreated every time, so they cover nutrients added since
+    for trigger in ('meals_count_insert', 'meals_count_delete', 'meals_count_update',
+                    'meals_rollup_insert', 'meals_rollup_delete', 'meals_rollup_update'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    count_meal = ('INSERT INTO meal_counts (user_id, meals) VALUES (NEW.user_id, 1) '
+                  'ON CONFLICT (user_id) DO UPDATE SET meals = meals + 1;')
+    uncount_meal = 'UPDATE meal_counts SET meals = meals - 1 WHERE user_id = OLD.user_id;'
+    conn.execute(f'''CREATE TRIGGER meals_count_insert AFTER INSERT ON meals BEGIN
+        {count_meal}
+    END''')
+    conn.execute(f'''CREATE TRIGGER meals_count_delete AFTER DELETE ON meals BEGIN
+        {uncount_meal}
+    END''')
+    conn.execute(f'''CREATE TRIGGER meals_count_update AFTER UPDATE OF user_id ON meals BEGIN
+        {uncount_meal}
+        {count_meal}
+    END''')
+    conn.execute(f'''CREATE TRIGGER meals_rollup_insert AFTER INSERT ON meals BEGIN
+        {' '.join(_add_to_rollup(table, 'NEW') for table in ROLLUPS)}
+    END''')
+    conn.execute(f'''CREATE TRIGGER meals_rollup_delete AFTER DELETE ON meals BEGIN
+        {' '.join(_remove_from_rollup(table, 'OLD') for table in ROLLUPS)}
+    END''')
+    conn.execute(f'''CREATE TRIGGER meals_rollup_update
+        AFTER UPDATE OF user_id, date, meal_type{_NUTRIENT_COLUMNS} ON meals BEGIN
+        {' '.join(_remove_from_rollup(table, 'OLD') for table in ROLLUPS)}
+        {' '.join(_add_to_rollup(table, 'NEW') for table in ROLLUPS)}
+    END''')
+
+    # Histories from before the (per-user) rollups get them filled in once
+    if not set(ROLLUPS) <= existing_tables:
+        rebuild_rollups(conn)
+
+
+def normalize_user_id(name: Optional[str]) -> str:
+    """User id for a name or email as typed: trimmed and lowercased, DEFAULT_USER if empty."""
+    return (name or '').strip().lower() or DEFAULT_USER
+
+
+def insert_meals(conn: sqlite3.Connection, meals: Iterable[Tuple], user_id: str = DEFAULT_USER) -> int:
+    """
+    Insert meals and their items inside an open write transaction, without committing.
+
+    Lets callers add other writes (e.g. import progress) to the same transaction.
+
+    Args:
+        conn: Connection with a write transaction open (MealHistory.transaction())
+        meals: (date, meal_type, description, nutrition totals) tuples, with
+            the calculated items (result['items']) as an optional fifth element
+        user_id: User the meals belong to
+
+    Returns:
+        Number of meals inserted
+    """
+    meals = list(meals)
+    rows = [(user_id, date, meal_type, description, *[nutrition.get(key) for key in NUTRIENT_KEYS])
+            for date, meal_type, description, nutrition, *_ in meals]
+    conn.executemany(_INSERT_MEAL, rows)
+
+    # The write lock is held and AUTOINCREMENT ids only grow, so the meals
+    # just inserted have consecutive ids ending at last_insert_rowid()
+    first_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0] - len(rows) + 1
+    item_rows = []
+    foods = {}
+    for meal_id, meal in enumerate(meals, start=first_id):
+        items = meal[4] if len(meal) > 4 and meal[4] else []
+        # Foods that weren't found have nothing to store
+        resolved = [item for item in items if item.get('status') == 'success']
+        for position, item in enumerate(resolved):
+            item_rows.append((meal_id, position, item['food_id'], item.get('quantity'),
+                              item.get('unit'), item['multiplier']))
+            foods[item['food_id']] = (item['food'], item.get('food_signature'))
+    if item_rows:
+        conn.executemany(_UPSERT_FOOD, [(food_id, *food) for food_id, food in foods.items()])
+        conn.executemany(_INSERT_ITEM, item_rows)
+    return len(rows)
+
+
+class MealHistory:
+    """
+    Meal history repository over a pool of SQLite connections.
+
+    Every meal belongs to a user (DEFAULT_USER unless given), and reads
+    are scoped to one user through the (user_id, date) index and per-user
+    counters and rollups, so they don't slow down as other users' meals
+    pile up.
+
+    The database runs in WAL mode, so reads don't block the writer and
+    vice versa. Connections are shared by all threads (e.g. Streamlit
+    sessions) and handed out one at a time from the pool; writes take the
+    write lock up front (BEGIN IMMEDIATE), wait up to `busy_timeout` for
+    it, and are retried a few times before "database is locked" reaches
+    the caller.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, pool_size: int = 4,
+                 busy_timeout: float = 5.0, write_retries: int = 3):
+        """
+        Args:
+            db_path: SQLite database file
+            pool_size: Maximum number of open connections
+            busy_timeout: Seconds to wait for a lock before failing
+            write_retries: Extra attempts to start a write transaction
+                after a lock timeout
+        """
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self.write_retries = write_retries
+
+        self._pool: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+        with self.transaction() as conn:
+            create_schema(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open and configure a new connection."""
+        # isolation_level=None: transactions are started explicitly
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                               check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Safe with WAL, and commits don't wait for an fsync
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection from the pool (autocommit; see transaction() for writes)."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.pool_size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _release(self, conn: sqlite3.Connection):
+        """
+        Return a connection to the pool. One still inside a transaction (e.g.
+        after a failed COMMIT) is rolled back first, or replaced by a new
+        connection if that fails too, so the next borrower can begin its own.
+        """
+        if conn.in_transaction:
+            try:
+                conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                conn.close()
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    return
+        self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """A write transaction, committed on success and rolled back on error."""
+        with self.connection() as conn:
+            for attempt in range(self.write_retries + 1):
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    break
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e) and 'busy' not in str(e) or attempt == self.write_retries:
+                        raise
+                    print(f"⚠ Meal history is busy, retrying ({attempt + 1}/{self.write_retries})")
+                    time.sleep(0.05 * 2 ** attempt)
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                # SQLite may already have rolled back (e.g. on a full disk);
+                # a connection that can't roll back is replaced on release
+                if conn.in_transaction:
+                    try:
+                        conn.execute('ROLLBACK')
+                    except sqlite3.Error:
+                        pass
+                raise
+
+    def log_meal(self, date, meal_type, description, nutrition, items: Optional[List[Dict]] = None,
+                 user_id: str = DEFAULT_USER):
+        """Save one analyzed meal, with its calculated items if given."""
+        self.log_meals([(date, meal_type, description, nutrition, items)], user_id)
+
+    def log_meals(self, meals: Iterable[Tuple], user_id: str = DEFAULT_USER) -> int:
+        """Save several meals of a user (see insert_meals) in one transaction. Returns the number saved."""
+        with self.transaction() as conn:
+            return insert_meals(conn, meals, user_id)
+
+    def get_history(self, user_id: str = DEFAULT_USER) -> pd.DataFrame:
+        """All of a user's meals, newest first, with display column names."""
+        with self.connection() as conn:
+            return pd.read_sql_query(_SELECT_HISTORY, conn, params=(user_id,))
+
+    def get_history_page(self, after: Optional[Tuple[str, int]] = None, page_size: int = 50,
+                         user_id: str = DEFAULT_USER) -> Tuple[pd.DataFrame, Optional[Tuple[str, int]]]:
+        """
+        One page of a user's history, newest first.
+
+        Pages are found by keyset (the date and id of the previous page's
+        last meal) rather than OFFSET, so every page costs the same however
+        far back it is.
+
+        Args:
+            after: Cursor returned with the previous page (None for the first page)
+            page_size: Meals per page
+            user_id: User whose meals to list
+
+        Returns:
+            (meals with display column names, cursor of the next page or
+            None if this is the last page)
+        """
+        with self.connection() as conn:
+            if after is None:
+                df = pd.read_sql_query(_SELECT_FIRST_PAGE, conn, params=(user_id, page_size + 1))
+            else:
+                df = pd.read_sql_query(_SELECT_PAGE_AFTER, conn,
+                                       params=(user_id, after[0], after[1], page_size + 1))
+
+        cursor = None
+        if len(df) > page_size:
+            df = df.iloc[:page_size]
+            last = df.iloc[-1]
+            cursor = (last['Date'], int(last['id']))
+        return df.drop(columns='id'), cursor
+
+    def write_history_csv(self, buffer: TextIO, user_id: str = DEFAULT_USER, page_size: int = 5000) -> int:
+        """
+        Write all of a user's meals as CSV (newest first), one keyset page at a time.
+
+        Only one page is held as a DataFrame at once, however long the history.
+
+        Args:
+            buffer: Text file or buffer to write to
+            user_id: User whose meals to export
+            page_size: Meals read per query
+
+        Returns:
+            Number of meals written
+        """
+        written = 0
+        cursor = None
+        while True:
+            df, cursor = self.get_history_page(cursor, page_size, user_id)
+            df.to_csv(buffer, index=False, header=written == 0)
+            written += len(df)
+            if cursor is None:
+                return written
+
+    def get_totals(self, period: str, start: str, end: str, user_id: str = DEFAULT_USER) -> pd.DataFrame:
+        """
+        A user's meal counts and nutrient totals per day or week and meal type, from the rollups.
+
+        Args:
+            period: 'daily' or 'weekly'
+            start: First date (YYYY-MM-DD); weeks are labelled by their Monday
+            end: Last date, inclusive
+            user_id: User whose meals to total
+
+        Returns:
+            One row per period and meal type, oldest first, with columns
+            date or week, meal_type, meals and one per nutrient key
+        """
+        table = f'{period}_rollups'
+        if table not in ROLLUPS:
+            raise ValueError(f"Unknown rollup period: {period}")
+        period_column, expression = ROLLUPS[table]
+        with self.connection() as conn:
+            return pd.read_sql_query(
+                f'SELECT * FROM {table} WHERE user_id = ? AND {period_column} BETWEEN {expression.format("?")} AND ? '
+                f'ORDER BY {period_column}, meal_type',
+                conn, params=(user_id, start, end)
+            ).drop(columns='user_id')
+
+    def get_items(self, start: str, end: str, user_id: str = DEFAULT_USER) -> pd.DataFrame:
+        """
+        Stored items of a user's meals logged between two dates (inclusive).
+
+        Returns:
+            One row per item, with meal_id, date, meal_type, food_id, food
+            (name), quantity, unit and multiplier
+        """
+        with self.connection() as conn:
+            return pd.read_sql_query(_SELECT_ITEMS, conn, params=(user_id, start, end))
+
+    def rebuild_rollups(self) -> Dict[str, int]:
+        """Recompute the rollup tables from all meals. Returns rows per table."""
+        with self.transaction() as conn:
+            return rebuild_rollups(conn)
+
+    def count_meals(self, user_id: Optional[str] = DEFAULT_USER) -> int:
+        """Number of meals a user logged, or every user if user_id is None (from the trigger-maintained counts)."""
+        with self.connection() as conn:
+            if user_id is None:
+                return int(conn.execute(_COUNT_ALL_MEALS).fetchone()[0])
+            row = conn.execute(_COUNT_MEALS, (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def quick_stats(self, date: str, user_id: str = DEFAULT_USER) -> Dict:
+        """A user's number of meals logged and calories on `date`, for the sidebar."""
+        with self.connection() as conn:
+            row = conn.execute(_COUNT_MEALS, (user_id,)).fetchone()
+            # At most one rollup row per meal type
+            calories = conn.execute(_CALORIES_ON, (user_id, date)).fetchone()[0]
+        return {'meals': row[0] if row else 0, 'calories': calories or 0}
+
+    def close(self):
+        """Close the connections that are back in the pool."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+
+_repositories: Dict[str, MealHistory] = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(db_path: str = DB_PATH) -> MealHistory:
+    """The shared MealHistory for a database file, created on first use."""
+    with _repositories_lock:
+        if db_path not in _repositories:
+            _repositories[db_path] = MealHistory(db_path)
+        return _repositories[db_path]
+
+
+def init_db(db_path: str = DB_PATH):
+    """Create the meals table, adding a column for any nutrient it lacks."""
+    get_repository(db_path)
+
+
+def log_meal(date, meal_type, description, nutrition, db_path: str = DB_PATH,
+             items: Optional[List[Dict]] = None, user_id: str = DEFAULT_USER):
+    """Save one analyzed meal (and its calculated items) to a user's history."""
+    get_repository(db_path).log_meal(date, meal_type, description, nutrition, items, user_id)
+
+
+def get_history(db_path: str = DB_PATH, user_id: str = DEFAULT_USER) -> pd.DataFrame:
+    """All of a user's meals, newest first, with display column names."""
+    return get_repository(db_path).get_history(user_id)
@@ -1,43 +1,34 @@
-import os
 import json
-from typing import Dict, List
-import google.generativeai as genai
+import asyncio
+from typing import Dict, List, Optional, Sequence, Tuple
 from dotenv import load_dotenv
+from src.gemini_client import JSON_OUTPUT, GeminiClient
+from src.llm_backends import GeminiBackend
+from src.local_parser import LocalMealParser
+from src.nutrition_calculator import find_unresolved_foods
+from src.parse_cache import ParseCache
+from src.tracing import tracer
 
 # Load environment variables
 load_dotenv()
 
+# Models tried in order for parsing: a parse that is invalid, or whose foods
+# aren't in the database, is retried on the next (larger) model
+PARSE_MODELS = ('gemini-2.5-flash', 'gemini-2.5-pro')
 
-class MealParser:
-    """Parses meal descriptions using Google Gemini API."""
-    
-    def __init__(self, api_key: str = None):
-        """
-        Initialize the Gemini parser.
-        
-        Args:
-            api_key: Gemini API key. If None, loads from GEMINI_API_KEY env variable.
-        """
-        self.api_key = api_key or os.getenv('GEMINI_API_KEY')
-        
-        if not self.api_key:
-            raise ValueError("Gemini API key not found. Set GEMINI_API_KEY environment variable.")
-        
-        # Configure Gemini
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
-    
-    def parse_meal(self, user_input: str) -> Dict:
-        """
-        Parse user's meal description into structured format.
-        
-        Args:
-            user_input: Natural language meal description
-            
-        Returns:
-            Dict with meal_type and items list
-        """
-        prompt = f"""
+# Bump PROMPT_VERSION whenever PARSE_PROMPT changes, so cached parses
+# produced by the old prompt are not reused
+PROMPT_VERSION = "1"
+
+# How foods, meal types, units and quantities are normalized; shared with
+# the chatbot's combined chat-and-parse prompt
+PARSE_RULES = """1. Normalize food names (e.g., "rotis" → "chapati", "chawal" → "rice")
+2. If meal type is not mentioned, use "lunch" as default
+3. Use standard units: pieces for countable items, bowl for liquids/curries, serving for vegetables
+4. Quantity should be a number (convert "a couple" → 2, "half" → 0.5)
+"""
+
+PARSE_PROMPT = """
 You are a nutrition assistant. Extract food items and quantities from the user's meal description.
 
 User input: "{user_input}"
@@ -55,44 +46,326 @@ Extract and return ONLY a valid JSON object (no other text) with this exact stru
 }}
 
 Rules:
-1. Normalize food names (e.g., "rotis" → "chapati", "chawal" → "rice")
-2. If meal type is not mentioned, use "lunch" as default
-3. Use standard units: pieces for countable items, bowl for liquids/curries, serving for vegetables
-4. Quantity should be a number (convert "a couple" → 2, "half" → 0.5)
-5. Return ONLY the JSON, no other text or explanation
+""" + PARSE_RULES + """5. Return ONLY the JSON, no other text or explanation
 
 Example:
 Input: "I had 2 rotis and daal for dinner"
 Output: {{"meal_type": "dinner", "items": [{{"food": "chapati", "quantity": 2, "unit": "pieces"}}, {{"food": "daal", "quantity": 1, "unit": "bowl"}}]}}
 """
+
+# Many descriptions per request, correlated by id (see MealParser.parse_meals)
+BATCH_PARSE_PROMPT = """
+You are a nutrition assistant. Extract food items and quantities from each meal description below.
+
+Meal descriptions, as a JSON list of {{"id": ..., "text": ...}} objects:
+{descriptions}
+
+Return ONLY a valid JSON array (no other text) with one object per description, each with this exact structure:
+{{
+  "id": "id of the description, copied exactly",
+  "meal_type": "breakfast|lunch|dinner|snack",
+  "items": [
+    {{
+      "food": "food name in lowercase",
+      "quantity": numeric_value,
+      "unit": "pieces|bowl|serving|glass|grams|cup"
+    }}
+  ]
+}}
+
+Rules:
+""" + PARSE_RULES + """5. Return one object for every id; never merge or skip descriptions
+6. Return ONLY the JSON array, no other text or explanation
+"""
+
+
+def strip_code_fence(response_text: str) -> str:
+    """Remove the markdown code block (```json ... ```) Gemini sometimes wraps JSON in."""
+    response_text = response_text.strip()
+    if response_text.startswith('```'):
+        response_text = response_text.split('```')[1]
+        if response_text.startswith('json'):
+            response_text = response_text[4:]
+        response_text = response_text.strip()
+    return response_text
+
+
+def validate_parsed_meal(parsed_data) -> None:
+    """
+    Check that a parse has the shape the calculator expects.
+    
+    Raises:
+        ValueError: if it isn't a dict with meal_type and an items list of
+            dicts, each with a string food and a numeric quantity (if any)
+    """
+    if not isinstance(parsed_data, dict) or 'meal_type' not in parsed_data or 'items' not in parsed_data:
+        raise ValueError("Invalid response structure from Gemini")
+    if not isinstance(parsed_data['items'], list):
+        raise ValueError("Meal items are not a list")
+    for item in parsed_data['items']:
+        if not isinstance(item, dict) or not isinstance(item.get('food'), str):
+            raise ValueError(f"Invalid meal item: {item!r}")
+        if not isinstance(item.get('quantity', 1), (int, float)):
+            raise ValueError(f"Invalid quantity for {item['food']}: {item['quantity']!r}")
+
+
+class MealParser:
+    """Parses meal descriptions using Google Gemini API."""
+    
+    def __init__(self, api_key: str = None, cache: Optional[ParseCache] = None,
+                 local_parser: Optional[LocalMealParser] = None,
+                 client: Optional[GeminiClient] = None,
+                 models: Sequence[str] = PARSE_MODELS, database=None):
+        """
+        Initialize the Gemini parser.
         
-        try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+        Args:
+            api_key: Gemini API key. If None, loads from GEMINI_API_KEY env variable.
+                Not needed when a client is given.
+            cache: Optional ParseCache; repeated meal descriptions are then
+                answered from it instead of calling Gemini again
+            local_parser: Optional LocalMealParser tried before the cache and
+                Gemini; simple inputs are then parsed without an API call
+            client: GeminiClient to send requests through (timeouts, retries,
+                concurrency limit, per-model metrics)
+            models: Model tiers to try in order (see PARSE_MODELS)
+            database: Nutrition database; if given, a parse naming foods it
+                can't resolve is escalated to the next model tier
+        """
+        self.cache = cache
+        self.local_parser = local_parser
+        self.models = tuple(models)
+        self.database = database
+        self.client = client or GeminiClient(self.models[0], backend=GeminiBackend(api_key))
+    
+    def parse_meal(self, user_input: str, min_tier: int = 0) -> Dict:
+        """
+        Parse user's meal description into structured format.
+        
+        Args:
+            user_input: Natural language meal description
+            min_tier: Index of the first model tier to try, e.g. 1 when a
+                smaller model already failed on this input
+            
+        Returns:
+            Dict with meal_type and items list
+        """
+        parsed_data = self._parse_without_gemini(user_input)
+        if parsed_data is not None:
+            return parsed_data
+        
+        prompt = PARSE_PROMPT.format(user_input=user_input)
+        parsed_data = None
+        
+        for model_name in self.models[min_tier:]:
+            try:
+                response_text = self.client.generate(prompt, model_name=model_name)
+            except Exception as e:
+                print(f"✗ Error calling Gemini API ({model_name}): {e}")
+                if model_name != self.models[-1]:
+                    self.client.record_escalation(model_name)
+                continue
             
-            # Remove markdown code blocks if present
-            if response_text.startswith('```'):
-                response_text = response_text.split('```')[1]
-                if response_text.startswith('json'):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
+            checked, accepted = self._check_response(user_input, response_text)
+            if accepted:
+                return checked
+            # Keep a valid parse with unknown foods in case no tier does better
+            parsed_data = checked or parsed_data
+            if model_name != self.models[-1]:
+                self.client.record_escalation(model_name)
+        
+        return parsed_data or self._get_fallback_response()
+    
+    async def parse_meal_async(self, user_input: str, race: bool = False, min_tier: int = 0) -> Dict:
+        """
+        Async version of parse_meal().
+        
+        Args:
+            user_input: Natural language meal description
+            race: Start the Gemini request right away, in parallel with the
+                local parser and cache, and cancel it if they answer first.
+                Lower latency on a miss at the cost of some wasted requests.
+            min_tier: Index of the first model tier to try
             
+        Returns:
+            Dict with meal_type and items list
+        """
+        prompt = PARSE_PROMPT.format(user_input=user_input)
+        gemini = None
+        if race:
+            gemini = asyncio.ensure_future(self.client.generate_async(prompt, model_name=self.models[min_tier]))
+        
+        parsed_data = await asyncio.to_thread(self._parse_without_gemini, user_input)
+        if parsed_data is not None:
+            if gemini:
+                gemini.cancel()
+                # Don't leave an error from the losing request unretrieved
+                gemini.add_done_callback(lambda task: task.cancelled() or task.exception())
+            return parsed_data
+        
+        for tier, model_name in enumerate(self.models[min_tier:]):
+            try:
+                if tier == 0 and gemini:
+                    response_text = await gemini
+                else:
+                    response_text = await self.client.generate_async(prompt, model_name=model_name)
+            except Exception as e:
+                print(f"✗ Error calling Gemini API ({model_name}): {e}")
+                if model_name != self.models[-1]:
+                    self.client.record_escalation(model_name)
+                continue
+            
+            checked, accepted = self._check_response(user_input, response_text)
+            if accepted:
+                return checked
+            # Keep a valid parse with unknown foods in case no tier does better
+            parsed_data = checked or parsed_data
+            if model_name != self.models[-1]:
+                self.client.record_escalation(model_name)
+        
+        return parsed_data or self._get_fallback_response()
+    
+    def _parse_without_gemini(self, user_input: str) -> Optional[Dict]:
+        """Try the local parser, then the cache. Returns None if neither can answer."""
+        if self.local_parser:
+            parsed_data = self.local_parser.parse_meal(user_input)
+            if parsed_data is not None:
+                tracer.count('local_parses')
+                return parsed_data
+        
+        if self.cache:
+            return self.cache.get(user_input, PROMPT_VERSION)
+        return None
+    
+    def _check_response(self, user_input: str, response_text: str) -> Tuple[Optional[Dict], bool]:
+        """
+        Turn Gemini's response text into a parsed meal and decide whether to accept it.
+        
+        Returns:
+            (parsed meal or None if invalid, whether it is good enough to
+            return without trying a larger model). Accepted parses are cached.
+        """
+        try:
             # Parse JSON
+            response_text = strip_code_fence(response_text)
             parsed_data = json.loads(response_text)
             
-            # Validate structure
-            if 'meal_type' not in parsed_data or 'items' not in parsed_data:
-                raise ValueError("Invalid response structure from Gemini")
-            
-            return parsed_data
+            # Validate structure, down to each item
+            validate_parsed_meal(parsed_data)
             
         except json.JSONDecodeError as e:
             print(f"✗ Failed to parse Gemini response as JSON: {e}")
             print(f"Response was: {response_text}")
-            return self._get_fallback_response()
+            return None, False
         except Exception as e:
-            print(f"✗ Error calling Gemini API: {e}")
-            return self._get_fallback_response()
+            print(f"✗ Invalid response from Gemini: {e}")
+            return None, False
+        
+        if self.database is not None:
+            unresolved = find_unresolved_foods(self.database, parsed_data)
+            if unresolved:
+                print(f"⚠ Parsed foods not in database: {', '.join(unresolved)}")
+                return parsed_data, False
+        
+        if self.cache and parsed_data['items']:
+            self.cache.put(user_input, PROMPT_VERSION, parsed_data)
+        
+        return parsed_data, True
+    
+    def parse_meals(self, batch: Dict, batch_size: int = 20) -> Dict:
+        """
+        Parse many meal descriptions, packing several into each Gemini request.
+        
+        Descriptions the local parser or cache can answer skip Gemini. The
+        rest are sent `batch_size` at a time, with the requests running
+        concurrently within the client's concurrency and rate limits.
+        Descriptions missing from a batch response, or whose parse fails
+        validation, are retried one by one through parse_meal().
+        
+        Args:
+            batch: Dict mapping an id of your choice to a meal description
+            batch_size: Descriptions per Gemini request
+            
+        Returns:
+            Dict mapping each id to its parsed meal (or fallback response)
+        """
+        results, pending = self._split_batch(batch)
+        if pending:
+            results.update(self.client.run(self._parse_batch_with_gemini(pending, batch_size)))
+        return results
+    
+    async def parse_meals_async(self, batch: Dict, batch_size: int = 20) -> Dict:
+        """Async version of parse_meals()."""
+        results, pending = await asyncio.to_thread(self._split_batch, batch)
+        if pending:
+            results.update(await self.client.run_async(self._parse_batch_with_gemini(pending, batch_size)))
+        return results
+    
+    def _split_batch(self, batch: Dict) -> Tuple[Dict, Dict]:
+        """Split a batch into (parsed without Gemini, still pending)."""
+        results = {}
+        pending = {}
+        for meal_id, user_input in batch.items():
+            parsed_data = self._parse_without_gemini(user_input)
+            if parsed_data is not None:
+                results[meal_id] = parsed_data
+            else:
+                pending[meal_id] = user_input
+        return results, pending
+    
+    async def _parse_batch_with_gemini(self, pending: Dict, batch_size: int) -> Dict:
+        """Send the pending descriptions in concurrent batches; runs on the client's loop."""
+        meal_ids = list(pending)
+        chunks = [meal_ids[i:i + batch_size] for i in range(0, len(meal_ids), batch_size)]
+        results = {}
+        for chunk_results in await asyncio.gather(*[self._parse_chunk(chunk, pending) for chunk in chunks]):
+            results.update(chunk_results)
+        return results
+    
+    async def _parse_chunk(self, meal_ids: List, pending: Dict) -> Dict:
+        """One batched request; anything it doesn't answer well is parsed singly."""
+        # Ids go out as strings; map them back to the caller's ids
+        by_key = {str(meal_id): meal_id for meal_id in meal_ids}
+        descriptions = json.dumps([{'id': key, 'text': pending[meal_id]} for key, meal_id in by_key.items()])
+        prompt = BATCH_PARSE_PROMPT.format(descriptions=descriptions)
+        
+        answered = {}
+        try:
+            response_text = await self.client.generate_async(prompt, generation_config=JSON_OUTPUT,
+                                                             model_name=self.models[0])
+            parsed_list = json.loads(response_text)
+            if not isinstance(parsed_list, list):
+                raise ValueError("Batch response is not a JSON array")
+            for parsed_data in parsed_list:
+                if isinstance(parsed_data, dict) and str(parsed_data.get('id')) in by_key:
+                    answered[by_key[str(parsed_data.pop('id'))]] = parsed_data
+        except Exception as e:
+            print(f"✗ Batch parse of {len(meal_ids)} meals failed, parsing them one by one: {e}")
+        
+        results = {}
+        retries = {}
+        for meal_id in meal_ids:
+            parsed_data = answered.get(meal_id)
+            try:
+                validate_parsed_meal(parsed_data)
+            except ValueError:
+                retries[meal_id] = 0
+                continue
+            if self.database is not None and find_unresolved_foods(self.database, parsed_data):
+                # Same escalation as parse_meal(): unknown foods go to the next tier
+                retries[meal_id] = 1
+            else:
+                results[meal_id] = parsed_data
+        
+        if retries:
+            if 1 in retries.values() and len(self.models) > 1:
+                self.client.record_escalation(self.models[0])
+            singles = await asyncio.gather(*[
+                self.parse_meal_async(pending[meal_id], min_tier=min(tier, len(self.models) - 1))
+                for meal_id, tier in retries.items()
+            ])
+            results.update(zip(retries, singles))
+        return results
     
     def _get_fallback_response(self) -> Dict:
         """Return a fallback response when parsing fails."""
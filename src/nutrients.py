@@ -0,0 +1,56 @@
+from typing import List, NamedTuple, Optional
+
+
+class Nutrient(NamedTuple):
+    """A nutrient tracked by NutriBot."""
+    key: str          # Field name in the database, results and meals table
+    label: str        # Display name
+    unit: str         # Display unit
+    csv_column: str   # Column in data/indian_food_nutrition.csv
+    daily_value: Optional[float] = None  # Default daily goal (US FDA daily value)
+
+
+# Every nutrient the app knows about, in display order.
+# Adding a nutrient here is enough for it to flow from the CSV through the
+# database, calculator, formatted output and meal history.
+NUTRIENTS = (
+    Nutrient('calories', 'Calories', 'kcal', 'Calories (kcal)', 2000),
+    Nutrient('protein', 'Protein', 'g', 'Protein (g)', 50),
+    Nutrient('carbs', 'Carbs', 'g', 'Carbohydrates (g)', 275),
+    Nutrient('fats', 'Fats', 'g', 'Fats (g)', 78),
+    Nutrient('fiber', 'Fiber', 'g', 'Fibre (g)', 28),
+    Nutrient('sugar', 'Sugar', 'g', 'Free Sugar (g)', 50),
+    Nutrient('sodium', 'Sodium', 'mg', 'Sodium (mg)', 2300),
+    Nutrient('calcium', 'Calcium', 'mg', 'Calcium (mg)', 1300),
+    Nutrient('iron', 'Iron', 'mg', 'Iron (mg)', 18),
+    Nutrient('vitamin_c', 'Vitamin C', 'mg', 'Vitamin C (mg)', 90),
+    Nutrient('folate', 'Folate', 'µg', 'Folate (µg)', 400),
+)
+
+NUTRIENT_KEYS = tuple(nutrient.key for nutrient in NUTRIENTS)
+
+# Nutrients shown as columns in per-item tables (the rest appear in summaries)
+TABLE_NUTRIENT_KEYS = ('calories', 'protein', 'carbs', 'fats')
+
+_BY_KEY = {nutrient.key: nutrient for nutrient in NUTRIENTS}
+
+
+def get_nutrient(key: str) -> Nutrient:
+    """Get the schema entry for a nutrient key (unknown keys get a generic entry)."""
+    return _BY_KEY.get(key) or Nutrient(key, key.replace('_', ' ').title(), '', key)
+
+
+def order_nutrient_keys(keys) -> List[str]:
+    """Sort nutrient keys into schema order; unknown keys go last."""
+    position = {key: i for i, key in enumerate(NUTRIENT_KEYS)}
+    return sorted(set(keys), key=lambda key: (position.get(key, len(position)), key))
+
+
+def format_amount(key: str, value: Optional[float], precision: int = 1) -> str:
+    """Format a nutrient amount with its unit, e.g. '5.2g' or '140.0 kcal'."""
+    if value is None:
+        return '-'
+    unit = get_nutrient(key).unit
+    separator = ' ' if unit == 'kcal' else ''
+    return f"{value:.{precision}f}{separator}{unit}"
+
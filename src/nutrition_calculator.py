@@ -1,12 +1,70 @@
-from typing import Dict, List, Optional
+import hashlib
+from typing import Dict, List, Optional, Sequence
+import numpy as np
 from src.database import NutritionDatabase
+from src.db_reloader import DatabaseReloader
+from src.nutrients import TABLE_NUTRIENT_KEYS, format_amount, get_nutrient
+from src.tracing import tracer
+
+
+def round_array(values: np.ndarray, ndigits: int = 1) -> np.ndarray:
+    """
+    Round an array exactly like Python's round() does per value.
+    
+    np.round scales by 10**ndigits first, which pushes values such as
+    2.15 (really 2.14999...) onto an exact .5 and rounds them the other
+    way. Values landing near a half are re-rounded with round().
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scale = 10.0 ** ndigits
+    scaled = values * scale
+    rounded = np.round(scaled) / scale
+    
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(value, ndigits) for value in values[near_half].tolist()]
+    return rounded
+
+
+def nutrient_signature(nutrient_keys: Sequence[str], values: np.ndarray) -> str:
+    """
+    Fingerprint of a food's nutrients per serving (one row of the nutrient matrix).
+    
+    Meal history stores it per food (see rescore_meals.py), so foods whose
+    nutrients changed since their meals were scored can be found.
+    """
+    keys = ','.join(nutrient_keys).encode('utf-8')
+    return hashlib.sha1(keys + np.ascontiguousarray(values, dtype=np.float64).tobytes()).hexdigest()
+
+
+def find_unresolved_foods(database, parsed_meal: Dict, min_confidence: float = 0.75) -> List[str]:
+    """
+    Food names in a parsed meal that the database can't resolve, exactly
+    or as a misspelling (the same lookups NutritionCalculator does).
+    """
+    unresolved = []
+    for item in parsed_meal.get('items', []):
+        food_name = item.get('food', '')
+        if not database.find_food(food_name) and not database.find_food_fuzzy(food_name, min_confidence):
+            unresolved.append(food_name)
+    return unresolved
 
 
 class NutritionCalculator:
     """Calculate nutritional values for meals."""
     
-    def __init__(self, database: NutritionDatabase):
+    def __init__(self, database: NutritionDatabase, min_match_confidence: float = 0.75):
+        """
+        Args:
+            database: Nutrition database to resolve foods against
+            min_match_confidence: Minimum confidence for accepting a
+                misspelled food name (see NutritionDatabase.find_food_fuzzy)
+        """
         self.db = database
+        self.min_match_confidence = min_match_confidence
+        
+        # (database, food id -> nutrient matrix row) for the last database used
+        self._id_rows = (None, {})
     
     def calculate_meal(self, parsed_meal: Dict) -> Dict:
         """
@@ -18,74 +76,202 @@ class NutritionCalculator:
         Returns:
             Dict with detailed nutrition breakdown
         """
-        meal_type = parsed_meal.get('meal_type', 'unknown')
-        items = parsed_meal.get('items', [])
+        return self.calculate_meals([parsed_meal])[0]
+    
+    def calculate_meals(self, parsed_meals: List[Dict]) -> List[Dict]:
+        """
+        Calculate nutrition for several parsed meals at once.
         
-        if not items:
-            return {
-                'meal_type': meal_type,
-                'items': [],
-                'totals': self._get_empty_totals(),
-                'status': 'error',
-                'message': 'No food items found'
-            }
-        
-        calculated_items = []
-        total_nutrition = self._get_empty_totals()
-        
-        for item in items:
-            food_name = item.get('food', '')
-            quantity = item.get('quantity', 1)
-            unit = item.get('unit', 'serving')
+        All resolved items of all meals are scaled with a single gather
+        from the database's nutrient matrix, so scoring a batch costs one
+        array operation instead of per-item dict arithmetic.
+        
+        Args:
+            parsed_meals: List of dicts with meal_type and items from parser
             
-            # Find food in database
-            food_data = self.db.find_food(food_name)
+        Returns:
+            List of results in the same format as calculate_meal()
+        """
+        db = self.snapshot()
+        
+        # First pass: resolve foods and collect matrix rows and multipliers
+        resolved_meals = []
+        rows = []
+        multipliers = []
+        
+        for parsed_meal in parsed_meals:
+            resolved_items = []
+            for item in parsed_meal.get('items', []):
+                food_name = item.get('food', '')
+                quantity = item.get('quantity', 1)
+                unit = item.get('unit', 'serving')
+                
+                # Find food in database, falling back to typo-tolerant matching
+                food_data = db.find_food(food_name)
+                match_confidence = None
+                
+                if not food_data:
+                    match = db.find_food_fuzzy(food_name, self.min_match_confidence)
+                    if match:
+                        food_data, match_confidence = match
+                
+                multiplier = None
+                if food_data:
+                    multiplier = self._get_multiplier(quantity, unit, food_data)
+                    rows.append(db.row_of(food_data))
+                    multipliers.append(multiplier)
+                
+                resolved_items.append((food_name, quantity, unit, food_data, match_confidence, multiplier,
+                                       rows[-1] if food_data else None))
+            resolved_meals.append(resolved_items)
+        
+        # One gather + broadcast multiply for every resolved item
+        if rows:
+            scaled = (db.nutrients[rows] * np.asarray(multipliers, dtype=np.float64)[:, None]).tolist()
+        else:
+            scaled = []
+        
+        # Second pass: assemble per-meal breakdowns
+        results = []
+        scaled_rows = iter(scaled)
+        for parsed_meal, resolved_items in zip(parsed_meals, resolved_meals):
+            meal_type = parsed_meal.get('meal_type', 'unknown')
             
-            if not food_data:
-                calculated_items.append({
-                    'food': food_name,
-                    'quantity': quantity,
-                    'unit': unit,
-                    'status': 'not_found',
-                    'message': f'"{food_name}" not found in database'
+            if not resolved_items:
+                results.append({
+                    'meal_type': meal_type,
+                    'items': [],
+                    'totals': self._get_empty_totals(db),
+                    'status': 'error',
+                    'message': 'No food items found'
                 })
                 continue
             
-            # Calculate nutrition based on quantity
-            multiplier = self._get_multiplier(quantity, unit, food_data)
+            calculated_items = []
+            total_nutrition = self._get_empty_totals(db)
+            
+            for food_name, quantity, unit, food_data, match_confidence, multiplier, row in resolved_items:
+                if not food_data:
+                    tracer.count('unresolved_foods')
+                    calculated_items.append({
+                        'food': food_name,
+                        'quantity': quantity,
+                        'unit': unit,
+                        'status': 'not_found',
+                        'message': f'"{food_name}" not found in database'
+                    })
+                    continue
+                
+                values = [round(value, 1) for value in next(scaled_rows)]
+                
+                item_nutrition = {
+                    'food': food_data['name'],
+                    'food_id': food_data['id'],
+                    'quantity': quantity,
+                    'unit': unit,
+                    'multiplier': multiplier,
+                    'serving_info': food_data['serving_size'],
+                    # Nutrients the item was scored with, stored with the meal
+                    'food_signature': nutrient_signature(db.nutrient_keys, db.nutrients[row]),
+                    **dict(zip(db.nutrient_keys, values)),
+                    'status': 'success'
+                }
+                
+                if match_confidence is not None:
+                    item_nutrition['requested_food'] = food_name
+                    item_nutrition['match_confidence'] = match_confidence
+                
+                calculated_items.append(item_nutrition)
+                
+                # Add to totals
+                for key, value in zip(db.nutrient_keys, values):
+                    total_nutrition[key] += value
+            
+            # Round totals
+            for key in total_nutrition:
+                total_nutrition[key] = round(total_nutrition[key], 1)
             
-            item_nutrition = {
-                'food': food_data['name'],
-                'quantity': quantity,
-                'unit': unit,
-                'serving_info': food_data['serving_size'],
-                'calories': round(food_data['calories'] * multiplier, 1),
-                'protein': round(food_data['protein'] * multiplier, 1),
-                'carbs': round(food_data['carbs'] * multiplier, 1),
-                'fats': round(food_data['fats'] * multiplier, 1),
-                'fiber': round(food_data['fiber'] * multiplier, 1),
+            results.append({
+                'meal_type': meal_type,
+                'items': calculated_items,
+                'totals': total_nutrition,
                 'status': 'success'
-            }
+            })
+        
+        return results
+    
+    def score_meal_totals(self, rows: np.ndarray, multipliers: np.ndarray,
+                          meal_index: np.ndarray, n_meals: int, db=None) -> np.ndarray:
+        """
+        Vectorized totals for many meals given already-resolved items.
+        
+        Intended for bulk re-scoring (e.g. a whole meal history after a
+        database update). Gives the same totals as calculate_meal().
+        
+        Args:
+            rows: Nutrient matrix row of each item
+            multipliers: Serving multiplier of each item
+            meal_index: Index (0..n_meals-1) of the meal each item belongs to
+            n_meals: Number of meals
+            db: Database snapshot the rows are from (defaults to the current one)
             
-            calculated_items.append(item_nutrition)
+        Returns:
+            n_meals x len(db.nutrient_keys) array of totals
+        """
+        db = db if db is not None else self.snapshot()
+        item_values = round_array(db.nutrients[rows] * np.asarray(multipliers, dtype=np.float64)[:, None])
+        totals = np.zeros((n_meals, len(db.nutrient_keys)))
+        np.add.at(totals, np.asarray(meal_index), item_values)
+        return round_array(totals)
+    
+    def food_rows(self, food_ids: Sequence[int], db=None) -> np.ndarray:
+        """
+        Nutrient matrix rows of foods given by id, e.g. from stored meal items.
+        
+        Args:
+            food_ids: Food ids
+            db: Database snapshot to use (defaults to the current one)
+            
+        Returns:
+            Row of each food, or -1 for ids the database doesn't have
+        """
+        db = db if db is not None else self.snapshot()
+        cached_db, id_rows = self._id_rows
+        if cached_db is not db:
+            id_rows = {}
+            for row, food in enumerate(db.foods):
+                id_rows.setdefault(food['id'], row)
+            if len(id_rows) < len(db.foods):
+                print(f"⚠ {len(db.foods) - len(id_rows)} foods share an id with an earlier food "
+                      f"(stored meal items use the first)")
+            self._id_rows = (db, id_rows)
+        return np.fromiter((id_rows.get(food_id, -1) for food_id in food_ids), dtype=np.int64, count=len(food_ids))
+    
+    def score_items(self, food_ids: Sequence[int], multipliers: Sequence[float], db=None) -> np.ndarray:
+        """
+        Nutrients of stored meal items (see MealHistory.get_items), from food ids.
+        
+        Uses today's database values, so no LLM call is needed to analyze
+        or re-score past meals.
+        
+        Args:
+            food_ids: Food id of each item
+            multipliers: Serving multiplier of each item
+            db: Database snapshot to use (defaults to the current one), e.g.
+                the one whose nutrient_keys index the result's columns
             
-            # Add to totals
-            total_nutrition['calories'] += item_nutrition['calories']
-            total_nutrition['protein'] += item_nutrition['protein']
-            total_nutrition['carbs'] += item_nutrition['carbs']
-            total_nutrition['fats'] += item_nutrition['fats']
-            total_nutrition['fiber'] += item_nutrition['fiber']
-        
-        # Round totals
-        for key in total_nutrition:
-            total_nutrition[key] = round(total_nutrition[key], 1)
-        
-        return {
-            'meal_type': meal_type,
-            'items': calculated_items,
-            'totals': total_nutrition,
-            'status': 'success'
-        }
+        Returns:
+            len(food_ids) x len(db.nutrient_keys) array, rounded like
+            calculate_meal(); NaN for foods no longer in the database
+        """
+        db = db if db is not None else self.snapshot()
+        rows = self.food_rows(food_ids, db)
+        values = np.full((len(rows), len(db.nutrient_keys)), np.nan)
+        known = rows >= 0
+        if known.any():
+            scaled = db.nutrients[rows[known]] * np.asarray(multipliers, dtype=np.float64)[known][:, None]
+            values[known] = round_array(scaled)
+        return values
     
     def _get_multiplier(self, quantity: float, unit: str, food_data: Dict) -> float:
         """
@@ -98,15 +284,20 @@ class NutritionCalculator:
         # e.g., 2 chapatis = 2 servings, 1 bowl = 1 serving
         return quantity
     
-    def _get_empty_totals(self) -> Dict:
+    def snapshot(self):
+        """
+        Database to use for one calculation.
+        
+        With a DatabaseReloader, the database may be swapped between calls;
+        pinning it per call keeps food lookups and matrix rows consistent.
+        """
+        if isinstance(self.db, DatabaseReloader):
+            return self.db.snapshot()
+        return self.db
+    
+    def _get_empty_totals(self, db) -> Dict:
         """Return empty nutrition totals."""
-        return {
-            'calories': 0.0,
-            'protein': 0.0,
-            'carbs': 0.0,
-            'fats': 0.0,
-            'fiber': 0.0
-        }
+        return {key: 0.0 for key in db.nutrient_keys}
     
     def format_result(self, result: Dict, format_type: str = 'table') -> str:
         """
@@ -123,9 +314,13 @@ class NutritionCalculator:
         output.append(f"\n🍽️  Meal: {result['meal_type'].upper()}")
         output.append("=" * 70)
         
+        totals = result['totals']
+        table_keys = [key for key in TABLE_NUTRIENT_KEYS if key in totals]
+        
         # Items breakdown
         if format_type == 'table':
-            output.append(f"\n{'Food Item':<20} {'Qty':<12} {'Calories':<10} {'Protein':<10} {'Carbs':<10} {'Fats':<8}")
+            header = "".join(f" {get_nutrient(key).label:<10}" for key in table_keys)
+            output.append(f"\n{'Food Item':<20} {'Qty':<12}{header}")
             output.append("-" * 70)
             
             for item in result['items']:
@@ -133,11 +328,8 @@ class NutritionCalculator:
                     output.append(f"{item['food']:<20} {'N/A':<12} ❌ Not found in database")
                 else:
                     qty_str = f"{item['quantity']} {item['unit']}"
-                    output.append(
-                        f"{item['food']:<20} {qty_str:<12} "
-                        f"{item['calories']:<10.1f} {item['protein']:<10.1f}g "
-                        f"{item['carbs']:<10.1f}g {item['fats']:<8.1f}g"
-                    )
+                    values = "".join(f" {format_amount(key, item[key]):<10}" for key in table_keys)
+                    output.append(f"{item['food']:<20} {qty_str:<12}{values}")
         else:
             for item in result['items']:
                 if item['status'] == 'not_found':
@@ -147,21 +339,15 @@ class NutritionCalculator:
         
         # Totals
         output.append("-" * 70)
-        totals = result['totals']
-        output.append(
-            f"{'TOTAL':<20} {'':<12} "
-            f"{totals['calories']:<10.1f} {totals['protein']:<10.1f}g "
-            f"{totals['carbs']:<10.1f}g {totals['fats']:<8.1f}g"
-        )
+        values = "".join(f" {format_amount(key, totals[key]):<10}" for key in table_keys)
+        output.append(f"{'TOTAL':<20} {'':<12}{values}")
         output.append("=" * 70)
         
         # Summary
         output.append(f"\n📊 Nutrition Summary:")
-        output.append(f"   Calories: {totals['calories']} kcal")
-        output.append(f"   Protein:  {totals['protein']}g")
-        output.append(f"   Carbs:    {totals['carbs']}g")
-        output.append(f"   Fats:     {totals['fats']}g")
-        output.append(f"   Fiber:    {totals['fiber']}g")
+        for key, value in totals.items():
+            label = get_nutrient(key).label + ':'
+            output.append(f"   {label:<10} {format_amount(key, value)}")
         
         return "\n".join(output)
 
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from src.search_index import normalize_name
+from src.tracing import tracer
+
+
+def normalize_meal_text(text: str) -> str:
+    """Normalize a meal description for cache lookups (case, spacing, trailing punctuation)."""
+    return normalize_name(text).rstrip('.!?, ')
+
+
+class ParseCache:
+    """
+    Persistent cache of parsed meal descriptions, stored in SQLite.
+
+    Entries are keyed on the normalized meal text plus the parser's prompt
+    version, so changing the prompt never serves stale parses. Once the
+    cache grows past `max_entries`, the least recently used entries are
+    evicted down to `low_water` of it in one batch, so puts in between
+    cost no eviction work. Entries older than `ttl_seconds` are treated
+    as misses.
+    """
+
+    def __init__(self, db_path: str = "parse_cache.db", max_entries: int = 10000,
+                 ttl_seconds: float = 30 * 24 * 3600, low_water: float = 0.9):
+        """
+        Args:
+            db_path: SQLite file for the cache (":memory:" for a throwaway cache)
+            max_entries: Maximum number of cached parses
+            ttl_seconds: Age after which a cached parse is ignored
+            low_water: Fraction of max_entries an eviction shrinks the cache to
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+
+        # One connection shared by all threads (Streamlit runs sessions on threads)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS parse_cache (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_parse_cache_last_used ON parse_cache (last_used)')
+        self._conn.commit()
+        # Upper bound on the number of entries (puts that replace an entry
+        # count too), so COUNT(*) only runs when the cache may be full
+        self._entries = self._conn.execute('SELECT COUNT(*) FROM parse_cache').fetchone()[0]
+
+    @staticmethod
+    def make_key(text: str, prompt_version: str) -> str:
+        """Cache key for a meal description under a given prompt version."""
+        return hashlib.sha1(f"{prompt_version}\x00{normalize_meal_text(text)}".encode('utf-8')).hexdigest()
+
+    def get(self, text: str, prompt_version: str) -> Optional[Dict]:
+        """
+        Look up a cached parse.
+
+        Args:
+            text: Meal description as typed by the user
+            prompt_version: Version of the prompt that produced the parse
+
+        Returns:
+            The cached parse, or None on a miss
+        """
+        key = self.make_key(text, prompt_version)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT result, created_at FROM parse_cache WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                tracer.count('parse_cache_misses')
+                return None
+
+            self._conn.execute('UPDATE parse_cache SET last_used = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+            tracer.count('parse_cache_hits')
+
+        return json.loads(row[0])
+
+    def put(self, text: str, prompt_version: str, result: Dict):
+        """Store a parse, evicting the least recently used entries if the cache is full."""
+        key = self.make_key(text, prompt_version)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO parse_cache (key, result, created_at, last_used) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(result), now, now)
+            )
+            self._entries += 1
+            if self._entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Delete the least recently used entries down to the low-water mark (lock held)."""
+        self._entries = self._conn.execute('SELECT COUNT(*) FROM parse_cache').fetchone()[0]
+        if self._entries <= self.max_entries:
+            return
+        keep = int(self.max_entries * self.low_water)
+        # Oldest first along idx_parse_cache_last_used
+        self._conn.execute(
+            'DELETE FROM parse_cache WHERE key IN (SELECT key FROM parse_cache ORDER BY last_used LIMIT ?)',
+            (self._entries - keep,)
+        )
+        self._entries = keep
+
+    def purge_expired(self) -> int:
+        """Delete entries older than the TTL. Returns the number removed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                'DELETE FROM parse_cache WHERE created_at < ?', (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+            self._entries = max(0, self._entries - cursor.rowcount)
+        return cursor.rowcount
+
+    def clear(self):
+        """Remove every cached parse."""
+        with self._lock:
+            self._conn.execute('DELETE FROM parse_cache')
+            self._conn.commit()
+            self._entries = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this process and the current cache size."""
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM parse_cache').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries
+        }
+
+    def close(self):
+        """Close the cache database."""
+        with self._lock:
+            self._conn.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    cache = ParseCache(":memory:")
+    parsed = {"meal_type": "lunch", "items": [{"food": "chapati", "quantity": 2, "unit": "pieces"}]}
+
+    cache.put("2 chapatis for lunch", "1", parsed)
+    print(cache.get("  2 Chapatis for lunch. ", "1"))
+    print(cache.get("2 chapatis for lunch", "2"))
+    print(cache.stats())
@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set
+import heapq
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a food name or alias for index lookups."""
+    return " ".join(name.lower().split())
+
+
+def _trigrams(text: str) -> Set[str]:
+    """Get the set of character trigrams in a string."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class FoodSearchIndex:
+    """
+    Inverted index over food names and aliases for substring search.
+
+    Queries of three or more characters are answered by intersecting the
+    trigram posting lists of the query, so only foods sharing every trigram
+    are checked. Shorter queries (typical while typing) match word prefixes
+    through a sorted token list.
+    """
+
+    def __init__(self, foods: List[Dict]):
+        self.foods = foods
+        self._names: List[str] = []
+        self._aliases: List[List[str]] = []
+        self._trigram_postings: Dict[str, Set[int]] = {}
+        self._token_postings: Dict[str, Set[int]] = {}
+        self._sorted_tokens: List[str] = []
+        self._build()
+
+    def _build(self):
+        """Build trigram and token posting lists for every food."""
+        for position, food in enumerate(self.foods):
+            name = normalize_name(food['name'])
+            aliases = [normalize_name(alias) for alias in food.get('aliases', [])]
+            self._names.append(name)
+            self._aliases.append(aliases)
+
+            for text in [name] + aliases:
+                for trigram in _trigrams(text):
+                    self._trigram_postings.setdefault(trigram, set()).add(position)
+                for token in text.split():
+                    self._token_postings.setdefault(token, set()).add(position)
+
+        self._sorted_tokens = sorted(self._token_postings)
+
+    def _candidates(self, query: str) -> Set[int]:
+        """Get positions of foods that may contain the query."""
+        if len(query) >= 3:
+            postings = []
+            for trigram in _trigrams(query):
+                posting = self._trigram_postings.get(trigram)
+                if not posting:
+                    return set()
+                postings.append(posting)
+            postings.sort(key=len)
+            return postings[0].intersection(*postings[1:])
+
+        # Short query: union of every token starting with it
+        candidates: Set[int] = set()
+        start = bisect_left(self._sorted_tokens, query)
+        for token in self._sorted_tokens[start:]:
+            if not token.startswith(query):
+                break
+            candidates.update(self._token_postings[token])
+        return candidates
+
+    def _rank(self, position: int, query: str) -> Optional[int]:
+        """
+        Rank how well a food matches the query (lower is better).
+        Returns None if the food does not actually match.
+        """
+        name = self._names[position]
+        aliases = self._aliases[position]
+
+        if name == query:
+            return 0
+        if query in aliases:
+            return 1
+        if name.startswith(query):
+            return 2
+        if any(token.startswith(query) for token in name.split()):
+            return 3
+        if len(query) >= 3 and query in name:
+            return 4
+        if any(alias.startswith(query) for alias in aliases):
+            return 5
+        if any(token.startswith(query) for alias in aliases for token in alias.split()):
+            return 6
+        if len(query) >= 3 and any(query in alias for alias in aliases):
+            return 7
+        return None
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Search for foods whose name or alias contains the query.
+
+        Args:
+            query: Text to search for
+            limit: Maximum number of results (None for all)
+
+        Returns:
+            Matching foods, best match first (exact name, exact alias,
+            prefix, word prefix, then substring; shorter names first)
+        """
+        query = normalize_name(query)
+        if not query:
+            return []
+
+        ranked = []
+        for position in self._candidates(query):
+            rank = self._rank(position, query)
+            if rank is not None:
+                ranked.append((rank, len(self._names[position]), position))
+
+        if limit is not None:
+            ranked = heapq.nsmallest(limit, ranked)
+        else:
+            ranked.sort()
+
+        return [self.foods[position] for _, _, position in ranked]
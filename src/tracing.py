@@ -0,0 +1,280 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+# Upper bounds (seconds) of the span duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """One timed stage; spans started inside it become its children."""
+
+    __slots__ = ('tracer', 'name', 'attrs', 'trace_id', 'span_id', 'parent_id', 'root', 'start', 'duration', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, attrs: Dict):
+        parent = _current_span.get()
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = next(tracer._span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.root = parent.root if parent else self
+        self.duration = None
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+
+    def set(self, **attrs):
+        """Attach attributes, e.g. the response type."""
+        self.attrs.update(attrs)
+
+    def end(self):
+        """Stop the span (once) and hand it to the tracer."""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Ended from another context (e.g. a different thread)
+            pass
+        self.tracer._finish(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """Returned while tracing is disabled, so instrumented code costs next to nothing."""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Spans, timings and counters for the stages of a chat turn.
+
+    Disabled by default: span() then returns a shared no-op span and
+    count() returns immediately. When enabled, every finished span is
+    added to a per-stage duration histogram and, if a JSONL file is set,
+    written to it as one line (trace_id, span_id, parent_id, name,
+    duration_ms, attributes). Counters and histograms are exported in
+    Prometheus text format by prometheus_text() and serve().
+    """
+
+    def __init__(self, enabled: bool = False, jsonl_path: Optional[str] = None, prefix: str = 'nutribot'):
+        """
+        Args:
+            enabled: Record spans and counters
+            jsonl_path: File to append finished spans to
+            prefix: Prefix of the exported metric names
+        """
+        self.enabled = enabled
+        self.prefix = prefix
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.durations: Dict[str, list] = {}
+        self._span_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._jsonl = None
+        self._server = None
+        if jsonl_path:
+            self.set_jsonl(jsonl_path)
+
+    def set_jsonl(self, jsonl_path: str):
+        """Append finished spans to a JSONL file (and enable tracing)."""
+        with self._lock:
+            if self._jsonl:
+                self._jsonl.close()
+            self._jsonl = open(jsonl_path, 'a', encoding='utf-8', buffering=1)
+        self.enabled = True
+
+    def span(self, name: str, **attrs):
+        """
+        Start a span; use as a context manager, or call end() on it.
+
+        Args:
+            name: Stage name, e.g. 'parse_meal'
+            **attrs: Attributes recorded with the span
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def count(self, name: str, value: float = 1, **labels):
+        """Add to a counter, e.g. count('llm_calls', model='gemini-2.5-flash')."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_to_trace(self, name: str, value: float = 1):
+        """
+        Add to an attribute of the current trace's root span, e.g.
+        add_to_trace('llm_calls') counts the LLM requests of a chat turn.
+        Does nothing outside a span.
+        """
+        span = _current_span.get()
+        if span is None:
+            return
+        with self._lock:
+            span.root.attrs[name] = span.root.attrs.get(name, 0) + value
+
+    def _finish(self, span: Span):
+        """Record a finished span."""
+        with self._lock:
+            # [bucket counts..., count, sum]
+            stats = self.durations.get(span.name)
+            if stats is None:
+                stats = self.durations[span.name] = [0] * len(DURATION_BUCKETS) + [0, 0.0]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    stats[i] += 1
+            stats[-2] += 1
+            stats[-1] += span.duration
+
+            if self._jsonl:
+                self._jsonl.write(json.dumps({
+                    'trace_id': span.trace_id,
+                    'span_id': span.span_id,
+                    'parent_id': span.parent_id,
+                    'name': span.name,
+                    'time': time.time() - span.duration,
+                    'duration_ms': round(span.duration * 1000, 3),
+                    'attrs': span.attrs,
+                }, default=str) + '\n')
+
+    def prometheus_text(self) -> str:
+        """Counters and span duration histograms in Prometheus text format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            durations = sorted((name, list(stats)) for name, stats in self.durations.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f'{self.prefix}_{name}_total'
+            if metric not in seen:
+                lines.append(f'# TYPE {metric} counter')
+                seen.add(metric)
+            lines.append(f'{metric}{_format_labels(labels)} {value:g}')
+
+        if durations:
+            metric = f'{self.prefix}_span_duration_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            for name, stats in durations:
+                for bound, bucket_count in zip(DURATION_BUCKETS, stats):
+                    lines.append(f'{metric}_bucket{_format_labels((("span", name), ("le", f"{bound:g}")))} {bucket_count}')
+                lines.append(f'{metric}_bucket{_format_labels((("span", name), ("le", "+Inf")))} {stats[-2]}')
+                lines.append(f'{metric}_count{_format_labels((("span", name),))} {stats[-2]}')
+                lines.append(f'{metric}_sum{_format_labels((("span", name),))} {stats[-1]:.6f}')
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, host: str = '127.0.0.1'):
+        """
+        Serve prometheus_text() at http://host:port/metrics from a background thread.
+
+        Also enables tracing. Calling it again while serving does nothing.
+        """
+        self.enabled = True
+        if self._server is not None:
+            return
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        print(f"📈 Serving metrics at http://{host}:{self._server.server_port}/metrics")
+
+    def reset(self):
+        """Clear counters and histograms."""
+        with self._lock:
+            self.counters.clear()
+            self.durations.clear()
+
+
+def _format_labels(labels) -> str:
+    """Render (name, value) pairs as a Prometheus label set."""
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+# Process-wide tracer used by the instrumented modules
+tracer = Tracer()
+
+
+def configure_from_env():
+    """
+    Enable tracing from environment variables.
+
+    NUTRIBOT_TRACE_FILE: append spans to this JSONL file
+    NUTRIBOT_METRICS_PORT: serve Prometheus metrics on this port
+    """
+    if os.getenv('NUTRIBOT_TRACE_FILE'):
+        tracer.set_jsonl(os.getenv('NUTRIBOT_TRACE_FILE'))
+    if os.getenv('NUTRIBOT_METRICS_PORT'):
+        tracer.serve(int(os.getenv('NUTRIBOT_METRICS_PORT')))
+
+
+# Example usage
+if __name__ == "__main__":
+    tracer.enabled = True
+
+    with tracer.span('turn', source='example') as turn:
+        with tracer.span('parse_meal'):
+            time.sleep(0.01)
+            tracer.count('llm_calls', model='gemini-2.5-flash')
+        with tracer.span('calculate_meal'):
+            tracer.count('unresolved_foods', 2)
+        turn.set(type='meal_analysis')
+
+    print(tracer.prometheus_text())
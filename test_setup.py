@@ -4,6 +4,7 @@ Test script to verify all components are set up correctly.
 Run this after installation to check if everything works.
 """
 
+import json
 import sys
 from pathlib import Path
 
@@ -165,6 +166,180 @@ def test_parser():
         return False
 
 
+def test_fuzzy_matching():
+    """Test that misspellings resolve but short unrelated words don't."""
+    print("Testing fuzzy food matching...")
+    
+    from src.database import NutritionDatabase
+    from src.nutrition_calculator import NutritionCalculator, find_unresolved_foods
+    
+    db = NutritionDatabase()
+    meal = {"meal_type": "lunch", "items": [{"food": food, "quantity": 1, "unit": "serving"}
+                                            for food in ("coke", "wine", "soda", "salt", "chapatti")]}
+    
+    items = NutritionCalculator(db).calculate_meal(meal)['items']
+    assert [item['status'] for item in items] == ['not_found'] * 4 + ['success'], items
+    assert items[-1]['food'] == 'chapati', items[-1]
+    assert find_unresolved_foods(db, meal) == ["coke", "wine", "soda", "salt"]
+    
+    print("   chapatti -> chapati; coke, wine, soda and salt left unresolved")
+    print(" Fuzzy matching working\n")
+    return True
+
+
+def test_fenced_stream_reply():
+    """Test that a streamed meal reply wrapped in a code fence keeps its parse (offline)."""
+    print("Testing streamed meal reply (offline)...")
+    
+    from src.chatbot_handler import NutritionChatbot
+    from src.gemini_client import GeminiClient
+    from src.llm_backends import ReplayBackend
+    
+    meal = {"meal_type": "breakfast", "items": [{"food": "masala dosa", "quantity": 1, "unit": "serving"}]}
+    reply = json.dumps({"type": "meal_analysis", "message": "Let me analyze your breakfast 🍽️",
+                        "meal_description": "a masala dosa", "meal": meal})
+    
+    for response_text in (reply, f"```json\n{reply}\n```"):
+        backend = ReplayBackend()
+        backend.add_match("Just finished a masala dosa", response_text)
+        chatbot = NutritionChatbot(client=GeminiClient(backend=backend), combined=True)
+        
+        response = chatbot.chat_stream("Just finished a masala dosa")
+        assert response['type'] == 'meal_analysis', response
+        assert response.get('parsed_meal') == meal, f"Meal dropped from {response_text!r}"
+    
+    print("   Fenced and unfenced replies both carry the parsed meal")
+    print(" Streamed meal replies working\n")
+    return True
+
+
+def test_malformed_parse():
+    """Test that well-formed JSON with malformed items is rejected, not crashed on (offline)."""
+    print("Testing malformed parse responses (offline)...")
+    
+    from src.database import NutritionDatabase
+    from src.gemini_client import GeminiClient
+    from src.llm_backends import ReplayBackend
+    from src.nlp_parser import MealParser
+    
+    parser = MealParser(client=GeminiClient(backend=ReplayBackend()), database=NutritionDatabase())
+    for items in (["chapati", "rice"], [{"quantity": 2}], [{"food": 3}], "chapati",
+                  [{"food": "chapati", "quantity": "two"}]):
+        response_text = json.dumps({"meal_type": "lunch", "items": items})
+        assert parser._check_response("2 chapatis", response_text) == (None, False), items
+    
+    parsed, accepted = parser._check_response(
+        "2 chapatis", json.dumps({"meal_type": "lunch", "items": [{"food": "chapati", "quantity": 2}]}))
+    assert accepted and parsed['items'][0]['food'] == "chapati"
+    
+    print("   Malformed items are treated as a failed parse")
+    print(" Parse validation working\n")
+    return True
+
+
+def test_combined_turn_single_call():
+    """Test that a meal parsed by the combined chat call costs one LLM request (offline)."""
+    print("Testing combined chat-and-parse turn (offline)...")
+    
+    import tempfile
+    from benchmarks.chat_pipeline import build_pipeline, chat_turn
+    from src.meal_history import get_repository, init_db
+    from src.nlp_parser import strip_code_fence
+    from src.tracing import tracer
+    
+    message = "Just finished a masala dosa"
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        history_db = str(Path(tmp) / 'meal_history.db')
+        init_db(history_db)
+        pipeline = build_pipeline(history_db)
+        backend = pipeline['backend']
+        recorded = strip_code_fence(backend.matches[message])
+        
+        tracer.enabled = True
+        try:
+            for response_text in (recorded, f"```json\n{recorded}\n```"):
+                backend.add_match(message, response_text)
+                calls = backend.calls
+                with tracer.span('turn', source='test') as turn:
+                    result = chat_turn(pipeline, message, [], stream=True)
+                
+                assert result['type'] == 'meal_analysis', result
+                assert backend.calls - calls == 1, f"{backend.calls - calls} backend calls for one meal"
+                assert turn.attrs.get('llm_calls') == 1, turn.attrs
+            assert not any(name == 'combined_parse_misses' for name, _ in tracer.counters), \
+                "Combined reply fell back to a separate parse"
+        finally:
+            tracer.enabled = False
+            tracer.reset()
+        
+        history = get_repository(history_db)
+        assert history.count_meals() == 2, history.count_meals()
+        history.close()
+    
+    print("   One backend call per logged meal, fenced or not")
+    print(" Combined turns working\n")
+    return True
+
+
+def test_offline_pipeline():
+    """Test chat -> parse -> calculate -> log on the recorded responses, without an API key."""
+    print("Testing offline pipeline (recorded responses)...")
+    
+    import tempfile
+    from benchmarks.chat_pipeline import MESSAGES, build_pipeline, chat_turn
+    from src.meal_history import get_repository, init_db
+    from src.nutrients import NUTRIENT_KEYS
+    
+    # What each meal in MESSAGES should be parsed into, locally or from the recordings
+    expected_meals = [
+        {"meal_type": "dinner", "items": [{"food": "chapati", "quantity": 2, "unit": "pieces"},
+                                          {"food": "daal", "quantity": 1, "unit": "bowl"}]},
+        {"meal_type": "breakfast", "items": [{"food": "idli", "quantity": 3, "unit": "pieces"},
+                                             {"food": "sambar", "quantity": 1, "unit": "serving"}]},
+        {"meal_type": "lunch", "items": [{"food": "paneer butter masala", "quantity": 1, "unit": "bowl"},
+                                         {"food": "naan", "quantity": 2, "unit": "serving"}]},
+        {"meal_type": "lunch", "items": [{"food": "chole bhature", "quantity": 1, "unit": "serving"}]},
+        {"meal_type": "dinner", "items": [{"food": "biryani (chicken)", "quantity": 1, "unit": "serving"},
+                                          {"food": "boondi raita", "quantity": 1, "unit": "bowl"}]},
+        {"meal_type": "breakfast", "items": [{"food": "masala dosa", "quantity": 1, "unit": "serving"}]},
+    ]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        history_db = str(Path(tmp) / 'meal_history.db')
+        init_db(history_db)
+        pipeline = build_pipeline(history_db)
+        
+        conversation = []
+        types = [chat_turn(pipeline, message, conversation, stream=True)['type'] for message in MESSAGES]
+        assert types.count('meal_analysis') == len(expected_meals), types
+        assert types.count('conversation') == len(MESSAGES) - len(expected_meals), types
+        assert pipeline['backend'].misses == 0, f"{pipeline['backend'].misses} prompts without a recording"
+        
+        # Totals per meal type, so a meal logged under the wrong type fails too
+        expected = {}
+        for meal in expected_meals:
+            result = pipeline['calculator'].calculate_meal(meal)
+            assert all(item['status'] == 'success' for item in result['items']), result['items']
+            meal_totals = expected.setdefault(meal['meal_type'], {key: 0.0 for key in ['meals', *NUTRIENT_KEYS]})
+            meal_totals['meals'] += 1
+            for key, value in result['totals'].items():
+                meal_totals[key] += value
+        
+        history = get_repository(history_db)
+        totals = history.get_totals('daily', '0001-01-01', '9999-12-31').groupby('meal_type').sum(numeric_only=True)
+        history.close()
+        assert sorted(totals.index) == sorted(expected), totals
+        for meal_type, meal_totals in expected.items():
+            for key, value in meal_totals.items():
+                logged = totals.loc[meal_type, key]
+                assert abs(logged - value) < 1e-6, f"{meal_type} {key}: logged {logged}, expected {value}"
+    
+    print(f"   Logged {len(expected_meals)} meals with the expected totals")
+    print(" Offline pipeline working\n")
+    return True
+
+
 def main():
     """Run all tests."""
     print("=" * 70)
@@ -177,7 +352,12 @@ def main():
         ("File Structure", test_file_structure),
         ("API Configuration", test_api_key),
         ("Database", test_database),
-        ("NLP Parser", test_parser)
+        ("NLP Parser", test_parser),
+        ("Fuzzy Matching", test_fuzzy_matching),
+        ("Streamed Meal Reply", test_fenced_stream_reply),
+        ("Parse Validation", test_malformed_parse),
+        ("Combined Turn", test_combined_turn_single_call),
+        ("Offline Pipeline", test_offline_pipeline)
     ]
     
     results = []